@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Worker for queued AI requests
+
+Runs the Gemini calls that the AI endpoints queue in ai_jobs (see
+utils/ai_jobs.py), so web workers never wait on the model, along with the
+other slow work queued there (course indexes, finalizing chunked uploads,
+image variants).
+Run it next to the web server, on a machine that shares its uploads folder
+(start.sh runs both, which is how render.yaml deploys them):
+
+    python ai_worker.py
+
+AI_WORKER_PROCESSES processes (default 2) each run AI_WORKER_THREADS
+threads (default 4) that claim jobs. Model calls in each process still go
+through the shared Gemini client and its AI_MAX_CONCURRENCY limit.
+"""
+
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+import time
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+WORKER_PROCESSES = int(os.getenv('AI_WORKER_PROCESSES', 2))
+WORKER_THREADS = int(os.getenv('AI_WORKER_THREADS', 4))
+POLL_INTERVAL = float(os.getenv('AI_WORKER_POLL_SECONDS', 0.5))
+LEASE_CHECK_INTERVAL = 60
+# Process 0 also removes abandoned upload files and unreferenced blobs this often
+MAINTENANCE_INTERVAL = 3600
+
+def work(app, worker_id, stop):
+    """Claim and run jobs until stopped"""
+    from utils.ai_jobs import claim_job, run_job
+
+    while not stop.is_set():
+        try:
+            job = claim_job(app.db, worker_id)
+        except Exception as e:
+            print(f"AI worker {worker_id} could not claim a job: {e}")
+            job = None
+
+        if not job:
+            stop.wait(POLL_INTERVAL)
+            continue
+
+        # The chat helpers read the database from the app context
+        with app.app_context():
+            run_job(app.db, job)
+
+def run_process(index):
+    """One worker process: WORKER_THREADS claim loops sharing a MongoDB client"""
+    # Imported here so every process opens its own MongoDB connection
+    from app import app
+    from utils.ai_jobs import recover_expired_leases
+    from utils.chunked_upload import cleanup_stale_uploads
+    from utils.media_store import collect_garbage
+
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+
+    threads = [
+        threading.Thread(target=work, args=(app, f'{socket.gethostname()}:{os.getpid()}:{n}', stop))
+        for n in range(WORKER_THREADS)
+    ]
+    for thread in threads:
+        thread.start()
+    print(f"AI worker process {index} started with {WORKER_THREADS} threads")
+
+    last_maintenance = None
+    while not stop.is_set():
+        if index == 0:
+            recover_expired_leases(app.db)
+            if last_maintenance is None or time.monotonic() - last_maintenance >= MAINTENANCE_INTERVAL:
+                cleanup_stale_uploads(app.db)
+                collect_garbage(app.db)
+                last_maintenance = time.monotonic()
+        stop.wait(LEASE_CHECK_INTERVAL)
+
+    for thread in threads:
+        thread.join()
+
+def main():
+    """Start the worker processes and wait for them"""
+    processes = [
+        multiprocessing.Process(target=run_process, args=(index,), name=f'ai-worker-{index}')
+        for index in range(WORKER_PROCESSES)
+    ]
+    for process in processes:
+        process.start()
+
+    # Children get Ctrl+C from the terminal themselves and finish their
+    # current jobs; pass SIGTERM on to them
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, lambda *_: [p.terminate() for p in processes])
+    for process in processes:
+        process.join()
+
+if __name__ == "__main__":
+    main()
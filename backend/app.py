@@ -21,6 +21,7 @@ from routes.notifications import notifications_bp
 from routes.videos import videos_bp
 from routes.progress import progress_bp
 from routes.student_progress import student_progress_bp
+from routes.uploads import uploads_bp
 
 # Import error handler
 from utils.error_handler import register_error_handlers
@@ -96,6 +97,7 @@ app.register_blueprint(notifications_bp, url_prefix='/api')
 app.register_blueprint(videos_bp, url_prefix='/api/videos')
 app.register_blueprint(progress_bp, url_prefix='/api/progress')
 app.register_blueprint(student_progress_bp, url_prefix='/api/student-progress')
+app.register_blueprint(uploads_bp, url_prefix='/api/uploads')
 
 # Register error handlers
 register_error_handlers(app)
@@ -180,5 +182,21 @@ if __name__ == '__main__':
     from utils.token_cleanup import cleanup_expired_tokens
     cleanup_expired_tokens(db)
     
+    # Bring existing documents up to the current schema (production runs migrate.py)
+    from utils.migrations import run_migrations
+    run_migrations(db)
+    
+    # Rebuild co-enrollment recommendations (also run by build_recommendations.py)
+    from utils.recommendations import build_course_neighbors
+    build_course_neighbors(db)
+    
+    # Remove partial uploads whose session expired
+    from utils.chunked_upload import cleanup_stale_uploads
+    cleanup_stale_uploads(db)
+    
+    # Remove media blobs no longer referenced by videos or materials
+    from utils.media_store import collect_garbage
+    collect_garbage(db)
+    
     # Run the application
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+"""
+Script to rebuild the course recommendation index
+
+Run it periodically (e.g. nightly from cron) so recommendations follow new
+enrollments:
+
+    0 3 * * * cd /path/to/backend && python build_recommendations.py
+"""
+
+from pymongo import MongoClient
+import os
+from dotenv import load_dotenv
+
+from utils.recommendations import build_course_neighbors
+
+# Load environment variables
+load_dotenv()
+
+def main():
+    """Recompute course neighbors from the enrollments collection"""
+    
+    # Connect to MongoDB
+    mongo_uri = os.getenv('MONGO_URI', 'mongodb://localhost:27017/edunexa_lms')
+    client = MongoClient(mongo_uri)
+    db = client.edunexa_lms
+    
+    build_course_neighbors(db)
+    client.close()
+
+if __name__ == "__main__":
+    main()
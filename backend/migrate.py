@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+"""
+Script to migrate existing data to the current schema
+
+Run it once per deploy, before the new code serves requests (render.yaml
+runs it as the pre-deploy command):
+
+    cd /path/to/backend && python migrate.py
+
+Every step is idempotent, so running it again is harmless.
+"""
+
+from pymongo import MongoClient
+import os
+from dotenv import load_dotenv
+
+from utils.db_init import create_indexes
+from utils.migrations import run_migrations
+
+# Load environment variables
+load_dotenv()
+
+def main():
+    """Create missing indexes and migrate documents"""
+    
+    # Connect to MongoDB
+    mongo_uri = os.getenv('MONGO_URI', 'mongodb://localhost:27017/edunexa_lms')
+    client = MongoClient(mongo_uri)
+    db = client.edunexa_lms
+    
+    create_indexes(db)
+    run_migrations(db)
+    client.close()
+
+if __name__ == "__main__":
+    main()
@@ -1,33 +1,31 @@
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, request, jsonify, current_app, Response, stream_with_context, url_for
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from bson import ObjectId
 from datetime import datetime
-import google.generativeai as genai
+import base64
+import binascii
 import os
-import PyPDF2
-import io
+import json
 import re
+from utils.recommendations import recommend_courses
+from utils.ai_cache import get_or_generate, lookup, store, cache_ttl, cache_stats
+from utils.ai_context import get_user_context
+from utils.course_index import search_course, sync_course_index
+from utils.material_summaries import stored_summary, summary_source, summary_by_hash, save_summary
+from utils.pdf_text import extract_pdf_text, PDFError, MAX_PDF_SIZE_MB
+from utils.summarizer import summarize_document, SINGLE_PASS_CHARS, MAX_DOCUMENT_CHARS
+from utils.validation import validate_file_type, validate_file_size, ValidationError
+from utils.ai_client import generate, stream, latency_stats, AIError
+from utils.ai_jobs import (enqueue_job, get_job, job_handler, JobQueueFullError,
+                           PRIORITY_INTERACTIVE, PRIORITY_NORMAL)
 
 ai_bp = Blueprint('ai', __name__)
 
-# Configure Gemini AI
+# Gemini is configured per worker process by utils.ai_client
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
-if GEMINI_API_KEY:
-    genai.configure(api_key=GEMINI_API_KEY)
-else:
+if not GEMINI_API_KEY:
     print("⚠️  Warning: GEMINI_API_KEY not found. AI features will use fallback responses.")
 
-def extract_text_from_pdf(pdf_content):
-    """Extract text from PDF content"""
-    try:
-        pdf_reader = PyPDF2.PdfReader(io.BytesIO(pdf_content))
-        text = ""
-        for page in pdf_reader.pages:
-            text += page.extract_text() + "\n"
-        return text
-    except Exception as e:
-        return f"Error extracting PDF text: {str(e)}"
-
 def generate_fallback_learning_path(goal, timeframe, enrolled_courses, user):
     """Generate a structured learning path when AI is not available"""
     
@@ -186,10 +184,9 @@ Contact your administrator to enable full AI capabilities for personalized respo
 
 Feel free to ask me anything about studying and learning! 😊"""
 
-def generate_explanation(topic, context=""):
-    """Generate detailed explanation of a topic"""
-    if not GEMINI_API_KEY:
-        return f"""## 📚 Understanding {topic}
+def explanation_fallback(topic, context=""):
+    """Explanation template used when Gemini is not configured"""
+    return f"""## 📚 Understanding {topic}
 
 ### 🎯 Key Concepts:
 This is a fundamental concept in your course. Let me break it down:
@@ -208,10 +205,10 @@ Think of it like this: [simplified analogy would go here]
 4. Ask your instructor for clarification if needed
 
 Need more details? Feel free to ask! 😊"""
-    
-    try:
-        model = genai.GenerativeModel('gemini-2.5-flash')
-        prompt = f"""
+
+def build_explanation_prompt(topic, context=""):
+    """Prompt for the explain chat type"""
+    return f"""
         You are a patient and knowledgeable tutor. Explain the following topic in simple, easy-to-understand terms.
         
         Topic: {topic}
@@ -228,17 +225,24 @@ Need more details? Feel free to ask! 😊"""
         Use markdown formatting with headers (##, ###), bullet points, and emojis.
         Keep it conversational and encouraging.
         """
+
+def generate_explanation(topic, context=""):
+    """Generate detailed explanation of a topic"""
+    if not GEMINI_API_KEY:
+        return explanation_fallback(topic)
+    
+    try:
+        prompt = build_explanation_prompt(topic, context)
         
-        response = model.generate_content(prompt)
-        return response.text
+        return get_or_generate(current_app.db, 'explain', topic, context,
+                               lambda: generate(prompt, mode='explain'))
     except Exception as e:
         print(f"Gemini API error: {str(e)}")
         return generate_fallback_response(topic, context)
 
-def generate_summary(content, context=""):
-    """Generate a concise summary"""
-    if not GEMINI_API_KEY:
-        return f"""## 📝 Summary
+def summary_fallback(content="", context=""):
+    """Summary template used when Gemini is not configured"""
+    return """## 📝 Summary
 
 ### Key Points:
 - Main concept 1
@@ -252,10 +256,10 @@ Focus on understanding the core concepts and how they connect.
 Review these key points regularly and practice applying them.
 
 *For a more detailed summary, ensure AI features are properly configured.*"""
-    
-    try:
-        model = genai.GenerativeModel('gemini-2.5-flash')
-        prompt = f"""
+
+def build_summary_prompt(content, context=""):
+    """Prompt for summaries"""
+    return f"""
         Summarize the following content into clear, concise bullet points.
         Focus on the most important concepts and key takeaways.
         
@@ -276,28 +280,32 @@ Review these key points regularly and practice applying them.
         
         Keep it brief but comprehensive. Use emojis and markdown.
         """
+
+def generate_summary(content, context=""):
+    """Generate a concise summary"""
+    if not GEMINI_API_KEY:
+        return summary_fallback(content)
+    
+    try:
+        prompt = build_summary_prompt(content, context)
         
-        response = model.generate_content(prompt)
-        return response.text
+        return get_or_generate(current_app.db, 'summarize', content, context,
+                               lambda: generate(prompt, mode='summarize'))
     except Exception as e:
         print(f"Gemini API error: {str(e)}")
         return generate_fallback_response(content, context)
 
-
-
-def generate_qa_response(question, context=""):
-    """Answer questions about course materials"""
-    if not GEMINI_API_KEY:
-        return generate_fallback_response(question, context)
-    
-    try:
-        model = genai.GenerativeModel('gemini-2.5-flash')
-        prompt = f"""
+def build_qa_prompt(question, context=""):
+    """Prompt for questions about course material"""
+    return f"""
         You are a helpful tutor answering a student's question about their course material.
         
         Question: {question}
         Student Context: {context}
         
+        When the context includes course material excerpts, base your answer on them
+        and mention which material they come from; say so if they do not cover the question.
+        
         Provide a clear, comprehensive answer that:
         1. Directly addresses the question
         2. Explains the reasoning
@@ -308,24 +316,24 @@ def generate_qa_response(question, context=""):
         Use markdown formatting with headers, bullet points, and emojis.
         Be friendly and encouraging.
         """
-        
-        response = model.generate_content(prompt)
-        return response.text
-    except Exception as e:
-        print(f"Gemini API error: {str(e)}")
-        return generate_fallback_response(question, context)
 
-def generate_ai_response(prompt, context=""):
-    """Generate AI response using Gemini or fallback"""
-    
-    # Check if Gemini API is available
+def generate_qa_response(question, context=""):
+    """Answer questions about course materials"""
     if not GEMINI_API_KEY:
-        return generate_fallback_response(prompt, context)
+        return generate_fallback_response(question, context)
     
     try:
-        model = genai.GenerativeModel('gemini-2.5-flash')
+        prompt = build_qa_prompt(question, context)
         
-        full_prompt = f"""
+        return get_or_generate(current_app.db, 'qa', question, context,
+                               lambda: generate(prompt, mode='qa'))
+    except Exception as e:
+        print(f"Gemini API error: {str(e)}")
+        return generate_fallback_response(question, context)
+
+def build_chat_prompt(prompt, context=""):
+    """Prompt for the general chat"""
+    return f"""
         You are an AI learning assistant for EduNexa LMS, a friendly and knowledgeable tutor who helps students succeed.
         
         Student Context: {context}
@@ -364,13 +372,73 @@ def generate_ai_response(prompt, context=""):
         
         Now respond to the student's question in this style.
         """
+
+def generate_ai_response(prompt, context=""):
+    """Generate AI response using Gemini or fallback"""
+    
+    # Check if Gemini API is available
+    if not GEMINI_API_KEY:
+        return generate_fallback_response(prompt, context)
+    
+    try:
+        
+        full_prompt = build_chat_prompt(prompt, context)
         
-        response = model.generate_content(full_prompt)
-        return response.text
+        return get_or_generate(current_app.db, 'general', prompt, context,
+                               lambda: generate(full_prompt, mode='general'))
     except Exception as e:
         print(f"Gemini API error: {str(e)}")
         return generate_fallback_response(prompt, context)
 
+# Prompt and offline template per chat type, for the streaming chat
+CHAT_MODES = {
+    'explain': (build_explanation_prompt, explanation_fallback),
+    'summarize': (build_summary_prompt, summary_fallback),
+    'qa': (build_qa_prompt, generate_fallback_response),
+    'general': (build_chat_prompt, generate_fallback_response)
+}
+
+def can_use_course_materials(user_context, course):
+    """Students need an enrollment unless the course is public; teachers must own it"""
+    user = user_context['user']
+    if user['role'] == 'student':
+        enrolled = {c['course_id'] for c in user_context['courses']}
+        return str(course['_id']) in enrolled or course.get('is_public', False)
+    if user['role'] == 'teacher':
+        return course.get('teacher_id') == str(user['_id'])
+    return True
+
+def course_material_context(db, course_id, question):
+    """Passages of the course's materials most relevant to a question"""
+    try:
+        results = search_course(db, course_id, question)
+    except Exception as e:
+        print(f"Course material search failed: {e}")
+        return ""
+    if not results:
+        return ""
+    excerpts = [f"[{i}] ({result['title']}) {result['text']}" for i, result in enumerate(results, 1)]
+    return "Course material excerpts:\n" + "\n".join(excerpts)
+
+def build_chat_context(db, user_context, chat_type, course_id=None, message=''):
+    """Context string passed to the model along with a chat message"""
+    # Cached answers are shared between users, so cacheable chat types
+    # only get course-level context instead of the student's profile
+    if cache_ttl(chat_type):
+        context_parts = [f"Role: {user_context['user']['role']}"]
+        if course_id and ObjectId.is_valid(course_id):
+            course = db.courses.find_one({'_id': ObjectId(course_id)}, {'title': 1, 'teacher_id': 1, 'is_public': 1})
+            if course:
+                context_parts.append(f"Course: {course['title']}")
+                # Ground answers to questions in the course's own materials
+                if chat_type == 'qa' and can_use_course_materials(user_context, course):
+                    excerpts = course_material_context(db, course_id, message)
+                    if excerpts:
+                        context_parts.append(excerpts)
+        return "; ".join(context_parts)
+    
+    return user_context['context']
+
 @ai_bp.route('/chat/welcome', methods=['GET'])
 @jwt_required()
 def get_welcome_message():
@@ -379,21 +447,13 @@ def get_welcome_message():
         user_id = get_jwt_identity()
         db = current_app.db
         
-        # Get user info
-        user = db.users.find_one({'_id': ObjectId(user_id)})
-        if not user:
+        # Get user info and enrolled courses
+        user_context = get_user_context(db, user_id)
+        if not user_context:
             return jsonify({'error': 'User not found'}), 404
         
-        enrolled_courses = []
-        if user['role'] == 'student':
-            # Get enrolled courses
-            enrollments = list(db.enrollments.find({'student_id': user_id}))
-            if enrollments:
-                course_ids = [enrollment['course_id'] for enrollment in enrollments]
-                courses = list(db.courses.find({'_id': {'$in': [ObjectId(cid) for cid in course_ids]}}))
-                enrolled_courses = [course['title'] for course in courses]
-        
-        welcome_message = generate_welcome_message(user['name'], enrolled_courses)
+        enrolled_courses = [course['title'] for course in user_context['courses']]
+        welcome_message = generate_welcome_message(user_context['user']['name'], enrolled_courses)
         
         return jsonify({
             'message': welcome_message,
@@ -403,6 +463,65 @@ def get_welcome_message():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def wants_async(data):
+    """Requests go to the background job queue unless the client sends "async": false or ?async=0"""
+    return not (data.get('async') in (False, '0', 'false') or request.args.get('async') in ('0', 'false'))
+
+def enqueue_response(db, kind, payload, user_id, priority):
+    """Queue an AI job and answer 202 with the URL to poll for its result"""
+    try:
+        job_id = enqueue_job(db, kind, payload, user_id, priority)
+    except JobQueueFullError as e:
+        return jsonify({'error': e.message}), e.status_code
+    
+    return jsonify({
+        'job_id': job_id,
+        'status': 'queued',
+        'status_url': url_for('ai.get_ai_job', job_id=job_id)
+    }), 202
+
+def answer_chat(db, user_id, message, chat_type, context, material=None):
+    """Generate the chat response, save it to the history and return the API body"""
+    # Generate AI response based on type
+    if chat_type == 'explain':
+        ai_response = generate_explanation(message, context)
+    elif chat_type == 'summarize' and material is not None:
+        ai_response = material_chat_summary(db, material, message, context)
+    elif chat_type == 'summarize':
+        ai_response = generate_summary(message, context)
+    elif chat_type == 'qa':
+        ai_response = generate_qa_response(message, context)
+    else:
+        ai_response = generate_ai_response(message, context)
+    
+    # Save chat history
+    chat_data = {
+        'user_id': user_id,
+        'message': message,
+        'response': ai_response,
+        'type': chat_type,
+        'timestamp': datetime.utcnow(),
+        'context': context
+    }
+    
+    db.chat_history.insert_one(chat_data)
+    
+    return {
+        'response': ai_response,
+        'timestamp': datetime.utcnow().isoformat(),
+        'type': chat_type
+    }
+
+@job_handler('chat')
+def run_chat_job(db, job):
+    payload = job['payload']
+    user_context = get_user_context(db, job['user_id'])
+    context = build_chat_context(db, user_context, payload['type'], payload.get('course_id'), payload['message'])
+    material = None
+    if payload.get('material_id'):
+        material = db.materials.find_one({'_id': ObjectId(payload['material_id'])})
+    return answer_chat(db, job['user_id'], payload['message'], payload['type'], context, material)
+
 @ai_bp.route('/chat', methods=['POST'])
 @jwt_required()
 def ai_chat():
@@ -413,92 +532,210 @@ def ai_chat():
         data = request.get_json()
         message = data.get('message', '').strip()
         chat_type = data.get('type', 'general')  # general, explain, summarize, qa
+        # Summarize chats may name a course material instead of pasting it
+        material_id = data.get('material_id') if chat_type == 'summarize' else None
         
-        if not message:
+        if not message and not material_id:
             return jsonify({'error': 'Message is required'}), 400
         
+        material = None
+        if material_id:
+            material, error = find_material(db, get_user_context(db, user_id), material_id)
+            if error:
+                return error
+            message = message or f"Summarize {material['title']}"
+        
+        if wants_async(data):
+            payload = {'message': message, 'type': chat_type, 'course_id': data.get('course_id'),
+                       'material_id': material_id}
+            return enqueue_response(db, 'chat', payload, user_id, PRIORITY_INTERACTIVE)
+        
         # Get user context for personalized responses
-        user = db.users.find_one({'_id': ObjectId(user_id)})
+        user_context = get_user_context(db, user_id)
+        context = build_chat_context(db, user_context, chat_type, data.get('course_id'), message)
         
-        # Build comprehensive context
-        context_parts = [f"User: {user['name']}", f"Role: {user['role']}"]
-        
-        if user['role'] == 'student':
-            # Get enrolled courses
-            enrollments = list(db.enrollments.find({'student_id': user_id}))
-            if enrollments:
-                course_ids = [enrollment['course_id'] for enrollment in enrollments]
-                courses = list(db.courses.find({'_id': {'$in': [ObjectId(cid) for cid in course_ids]}}))
-                course_titles = [course['title'] for course in courses]
-                context_parts.append(f"Enrolled courses: {', '.join(course_titles)}")
-            
+        return jsonify(answer_chat(db, user_id, message, chat_type, context, material)), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
 
-            
+def sse_event(event, payload):
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
 
+@ai_bp.route('/chat/stream', methods=['POST'])
+@jwt_required()
+def ai_chat_stream():
+    """
+    Streaming variant of /chat: the response is sent as Server-Sent Events
+    while the model produces it - `chunk` events with {text}, then one `done`
+    event, or an `error` event if the model fails mid-response. Chat history
+    is saved once the response is complete.
+    """
+    try:
+        user_id = get_jwt_identity()
+        db = current_app.db
         
-        context = "; ".join(context_parts)
+        data = request.get_json()
+        message = data.get('message', '').strip()
+        chat_type = data.get('type', 'general')
         
-        # Generate AI response based on type
-        if chat_type == 'explain':
-            ai_response = generate_explanation(message, context)
-        elif chat_type == 'summarize':
-            ai_response = generate_summary(message, context)
-
-        elif chat_type == 'qa':
-            ai_response = generate_qa_response(message, context)
-        else:
-            ai_response = generate_ai_response(message, context)
+        if not message:
+            return jsonify({'error': 'Message is required'}), 400
         
-        # Save chat history
-        chat_data = {
+        user_context = get_user_context(db, user_id)
+        context = build_chat_context(db, user_context, chat_type, data.get('course_id'), message)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    
+    mode = chat_type if chat_type in CHAT_MODES else 'general'
+    build_prompt, offline_response = CHAT_MODES[mode]
+    
+    def events():
+        chunks = []
+        if not GEMINI_API_KEY:
+            chunks.append(offline_response(message, context))
+            yield sse_event('chunk', {'text': chunks[-1]})
+        else:
+            cached = lookup(db, mode, message, context)
+            if cached is not None:
+                chunks.append(cached)
+                yield sse_event('chunk', {'text': cached})
+            else:
+                try:
+                    for text in stream(build_prompt(message, context), mode=mode):
+                        chunks.append(text)
+                        yield sse_event('chunk', {'text': text})
+                except Exception as e:
+                    print(f"Gemini API error: {str(e)}")
+                    if chunks:
+                        # Part of the answer is already on the client
+                        error = e.message if isinstance(e, AIError) else 'AI response was interrupted'
+                        yield sse_event('error', {'error': error})
+                        return
+                    chunks.append(generate_fallback_response(message, context))
+                    yield sse_event('chunk', {'text': chunks[-1]})
+                else:
+                    store(db, mode, message, context, ''.join(chunks))
+        
+        db.chat_history.insert_one({
             'user_id': user_id,
             'message': message,
-            'response': ai_response,
+            'response': ''.join(chunks),
             'type': chat_type,
             'timestamp': datetime.utcnow(),
             'context': context
-        }
-        
-        db.chat_history.insert_one(chat_data)
-        
-        return jsonify({
-            'response': ai_response,
-            'timestamp': datetime.utcnow().isoformat(),
-            'type': chat_type
-        }), 200
-        
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        })
+        yield sse_event('done', {'timestamp': datetime.utcnow().isoformat(), 'type': chat_type})
+    
+    return Response(stream_with_context(events()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+def is_long_material(material):
+    """Whether a material may need a map-reduce summary: it holds a PDF or long inline text"""
+    content = material.get('content')
+    return (material.get('storage_key', '').lower().endswith('.pdf')
+            or (isinstance(content, str) and len(content) > SINGLE_PASS_CHARS))
+
+def material_summary_response(db, user_id, data):
+    """Serve the summary of a course material, usually precomputed at upload"""
+    material, error = find_material(db, get_user_context(db, user_id), data['material_id'])
+    if error:
+        return error
+    
+    # Map-reduce over a long material would outlast the request; the AI workers do it
+    if stored_summary(material) is None and (wants_async(data) or is_long_material(material)):
+        payload = {'material_id': str(material['_id'])}
+        return enqueue_response(db, 'material_summary', payload, user_id, PRIORITY_NORMAL)
+    
+    try:
+        result = summarize_material(db, material)
+    except AIError as e:
+        return jsonify({'error': e.message}), e.status_code
+    if result is None:
+        return jsonify({'error': 'This material has no text to summarize'}), 400
+    return jsonify(result), 200
 
 @ai_bp.route('/summarize', methods=['POST'])
 @jwt_required()
 def summarize_content():
     try:
         user_id = get_jwt_identity()
-        data = request.get_json()
-        
-        content = data.get('content', '').strip()
-        content_type = data.get('type', 'text')  # text, pdf, url
+        db = current_app.db
         
-        if not content:
-            return jsonify({'error': 'Content is required'}), 400
+        pdf_content = None
+        if request.mimetype == 'multipart/form-data' and request.content_length:
+            # Reject oversized uploads before the body is parsed
+            try:
+                validate_file_size(request.content_length, MAX_PDF_SIZE_MB)
+            except ValidationError as e:
+                return jsonify({'error': e.message, 'field': e.field}), 400
+        
+        if 'file' in request.files:
+            # Multipart upload: the PDF arrives as a file instead of base64 JSON
+            data = request.form
+            upload = request.files['file']
+            content_type = 'pdf'
+            try:
+                validate_file_type(upload.filename or '', ['pdf'])
+            except ValidationError as e:
+                return jsonify({'error': e.message, 'field': e.field}), 400
+            # Content-Length can be missing; one byte over the limit is enough to reject
+            pdf_content = upload.read(MAX_PDF_SIZE_MB * 1024 * 1024 + 1)
+        else:
+            data = request.get_json()
+            if data.get('material_id'):
+                return material_summary_response(db, user_id, data)
+            
+            content = data.get('content', '').strip()
+            content_type = data.get('type', 'text')  # text, pdf, url
+            
+            if not content:
+                return jsonify({'error': 'Content is required'}), 400
+            
+            if content_type == 'pdf':
+                # Base64 encoded PDF
+                try:
+                    pdf_content = base64.b64decode(content)
+                except (binascii.Error, ValueError) as e:
+                    return jsonify({'error': f'Failed to process PDF: {str(e)}'}), 400
+            else:
+                text_content = content
         
         # Extract text based on content type
-        if content_type == 'pdf':
-            # Assuming content is base64 encoded PDF
-            import base64
+        if pdf_content is not None:
             try:
-                pdf_content = base64.b64decode(content)
-                text_content = extract_text_from_pdf(pdf_content)
-            except Exception as e:
-                return jsonify({'error': f'Failed to process PDF: {str(e)}'}), 400
-        else:
-            text_content = content
+                validate_file_size(len(pdf_content), MAX_PDF_SIZE_MB)
+                text_content = extract_pdf_text(db, pdf_content, budget=MAX_DOCUMENT_CHARS)
+            except ValidationError as e:
+                return jsonify({'error': e.message, 'field': e.field}), 400
+            except PDFError as e:
+                return jsonify({'error': f'Failed to process PDF: {e.message}'}), e.status_code
+        
+        # Longer documents are summarized section by section up to this limit
+        if len(text_content) > MAX_DOCUMENT_CHARS:
+            text_content = text_content[:MAX_DOCUMENT_CHARS] + "..."
+        
+        # Longer text is summarized map-reduce style by the AI workers, never in the request
+        if wants_async(data) or len(text_content) > SINGLE_PASS_CHARS:
+            payload = {'content': text_content, 'content_type': content_type}
+            return enqueue_response(db, 'summarize', payload, user_id, PRIORITY_NORMAL)
         
-        # Limit content length for API
-        if len(text_content) > 10000:
-            text_content = text_content[:10000] + "..."
+        try:
+            return jsonify(summarize_text(db, user_id, text_content, content_type)), 200
+        except AIError as e:
+            return jsonify({'error': e.message}), e.status_code
+        except Exception as e:
+            return jsonify({'error': f'Failed to generate summary: {str(e)}'}), 500
         
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def generate_text_summary(db, text_content):
+    """Summarize extracted text and return the API body"""
+    if len(text_content) > SINGLE_PASS_CHARS:
+        # Map-reduce over overlapping sections of the document
+        summary, sections, skipped = summarize_document(db, text_content)
+    else:
         # Generate summary using AI
         prompt = f"""
         Please provide a concise summary of the following educational content. 
@@ -510,34 +747,106 @@ def summarize_content():
         Summary:
         """
         
-        try:
-            model = genai.GenerativeModel('gemini-2.5-flash')
-            response = model.generate_content(prompt)
-            summary = response.text
-        except Exception as e:
-            return jsonify({'error': f'Failed to generate summary: {str(e)}'}), 500
-        
-        # Save summary
-        summary_data = {
-            'user_id': user_id,
-            'original_content': text_content[:1000],  # Store first 1000 chars
-            'summary': summary,
-            'content_type': content_type,
-            'created_at': datetime.utcnow()
-        }
-        
-        db.summaries.insert_one(summary_data)
-        
-        return jsonify({
-            'summary': summary,
-            'word_count_original': len(text_content.split()),
-            'word_count_summary': len(summary.split())
-        }), 200
-        
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
-
-
+        summary = get_or_generate(db, 'summary', text_content, '',
+                                  lambda: generate(prompt, mode='summary'))
+        sections, skipped = 1, 0
+    
+    return {
+        'summary': summary,
+        'word_count_original': len(text_content.split()),
+        'word_count_summary': len(summary.split()),
+        'sections': sections,
+        'skipped_sections': skipped
+    }
+
+def summarize_text(db, user_id, text_content, content_type):
+    """Summarize extracted text, save the summary and return the API body"""
+    result = generate_text_summary(db, text_content)
+    summary = result['summary']
+    
+    # Save summary
+    summary_data = {
+        'user_id': user_id,
+        'original_content': text_content[:1000],  # Store first 1000 chars
+        'summary': summary,
+        'content_type': content_type,
+        'created_at': datetime.utcnow()
+    }
+    
+    db.summaries.insert_one(summary_data)
+    
+    return result
+
+@job_handler('summarize')
+def run_summarize_job(db, job):
+    payload = job['payload']
+    return summarize_text(db, job['user_id'], payload['content'], payload['content_type'])
+
+def find_material(db, user_context, material_id):
+    """
+    (material, None) if the user may read the material's course, else
+    (None, error response) for the route to return.
+    """
+    if not ObjectId.is_valid(material_id or ''):
+        return None, (jsonify({'error': 'Invalid material id'}), 400)
+    material = db.materials.find_one({'_id': ObjectId(material_id)})
+    if not material:
+        return None, (jsonify({'error': 'Material not found'}), 404)
+    
+    course = db.courses.find_one({'_id': ObjectId(material['course_id'])}, {'teacher_id': 1, 'is_public': 1})
+    if not course or not can_use_course_materials(user_context, course):
+        return None, (jsonify({'error': 'Access denied'}), 403)
+    return material, None
+
+def summarize_material(db, material):
+    """
+    Summary of a course material as the API body: the stored one if it is
+    current, else generated (or copied from a material with the same text)
+    and stored. None if the material has no text to summarize.
+    """
+    summary = stored_summary(material)
+    precomputed = summary is not None
+    if summary is None:
+        text_content, content_hash = summary_source(db, material)
+        if not text_content:
+            return None
+        result = summary_by_hash(db, content_hash) or generate_text_summary(db, text_content)
+        if result.get('skipped_sections'):
+            # Not stored, so the next request retries the missing sections
+            summary = result
+        else:
+            summary = save_summary(db, material, content_hash, result)
+    
+    return {
+        'summary': summary['summary'],
+        'word_count_original': summary['word_count_original'],
+        'word_count_summary': summary['word_count_summary'],
+        'sections': summary['sections'],
+        'material_id': str(material['_id']),
+        'precomputed': precomputed
+    }
+
+def material_chat_summary(db, material, message, context=""):
+    """Chat answer for summarizing a material, preferring its stored summary"""
+    try:
+        result = summarize_material(db, material)
+    except AIError as e:
+        print(f"Material summary failed: {e.message}")
+        result = None
+    return result['summary'] if result else generate_summary(message, context)
+
+@job_handler('course_index')
+def run_course_index_job(db, job):
+    sync_course_index(db, job['payload']['course_id'])
+    return None
+
+@job_handler('material_summary')
+def run_material_summary_job(db, job):
+    material = db.materials.find_one({'_id': ObjectId(job['payload']['material_id'])})
+    if not material:
+        # Deleted before the worker got to it
+        return None
+    return summarize_material(db, material)
 
 @ai_bp.route('/recommendations', methods=['GET'])
 @jwt_required()
@@ -546,24 +855,17 @@ def get_recommendations():
         user_id = get_jwt_identity()
         db = current_app.db
         
-        # Get user
-        user = db.users.find_one({'_id': ObjectId(user_id)})
+        # Get user and enrolled courses
+        user_context = get_user_context(db, user_id)
+        user = user_context['user']
         if user['role'] != 'student':
             return jsonify({'error': 'Recommendations are only available for students'}), 403
         
-        # Get user's learning data
-        enrollments = list(db.enrollments.find({'student_id': user_id}))
-        enrolled_course_ids = [enrollment['course_id'] for enrollment in enrollments]
-        
-        # Get enrolled courses
-        enrolled_courses = list(db.courses.find({
-            '_id': {'$in': [ObjectId(cid) for cid in enrolled_course_ids]}
-        }))
-        
-
+        enrolled_courses = user_context['courses']
+        enrolled_course_ids = [course['course_id'] for course in enrolled_courses]
         
         # Get assignment submissions
-        submissions = list(db.submissions.find({'student_id': user_id}))
+        submissions_count = db.submissions.count_documents({'student_id': user_id})
         
         # Analyze performance
         weak_areas = []
@@ -571,12 +873,6 @@ def get_recommendations():
         
 
         
-        # Get available courses for recommendations
-        available_courses = list(db.courses.find({
-            '_id': {'$nin': [ObjectId(cid) for cid in enrolled_course_ids]},
-            'is_active': True
-        }))
-        
         # Generate AI-powered recommendations
         context = f"""
         Student Profile:
@@ -588,13 +884,8 @@ def get_recommendations():
         - Total Points: {user.get('total_points', 0)}
         """
         
-        # Get course recommendations
-        course_recommendations = []
-        if available_courses:
-            # Simple recommendation based on department and category
-            for course in available_courses[:5]:  # Limit to 5 recommendations
-                course['_id'] = str(course['_id'])
-                course_recommendations.append(course)
+        # Neighbors of the student's courses from the co-enrollment index
+        course_recommendations = recommend_courses(db, enrolled_course_ids)
         
         # Generate study tips
         study_tips = [
@@ -617,13 +908,47 @@ def get_recommendations():
                 'total_points': user.get('total_points', 0),
                 'courses_enrolled': len(enrolled_courses),
 
-                'assignments_submitted': len(submissions)
+                'assignments_submitted': submissions_count
             }
         }), 200
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@ai_bp.route('/cache/stats', methods=['GET'])
+@jwt_required()
+def get_cache_stats():
+    """Hit ratios of the AI response cache (admin only)"""
+    try:
+        user_id = get_jwt_identity()
+        db = current_app.db
+        
+        user = db.users.find_one({'_id': ObjectId(user_id)})
+        if user['role'] != 'admin':
+            return jsonify({'error': 'Admin access required'}), 403
+        
+        return jsonify(cache_stats(db)), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@ai_bp.route('/metrics', methods=['GET'])
+@jwt_required()
+def get_ai_metrics():
+    """Gemini latency histograms per mode for this worker (admin only)"""
+    try:
+        user_id = get_jwt_identity()
+        db = current_app.db
+        
+        user = db.users.find_one({'_id': ObjectId(user_id)})
+        if user['role'] != 'admin':
+            return jsonify({'error': 'Admin access required'}), 403
+        
+        return jsonify(latency_stats()), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @ai_bp.route('/chat-history', methods=['GET'])
 @jwt_required()
 def get_chat_history():
@@ -666,8 +991,8 @@ def generate_learning_path():
         db = current_app.db
         
         # Check if user is student
-        user = db.users.find_one({'_id': ObjectId(user_id)})
-        if user['role'] != 'student':
+        user_context = get_user_context(db, user_id)
+        if user_context['user']['role'] != 'student':
             return jsonify({'error': 'Learning paths are only available for students'}), 403
         
         data = request.get_json()
@@ -677,63 +1002,90 @@ def generate_learning_path():
         if not goal:
             return jsonify({'error': 'Learning goal is required'}), 400
         
-        # Get user's current progress
-        enrollments = list(db.enrollments.find({'student_id': user_id}))
-        enrolled_courses = []
-        for enrollment in enrollments:
-            course = db.courses.find_one({'_id': ObjectId(enrollment['course_id'])})
-            if course:
-                enrolled_courses.append({
-                    'title': course['title'],
-                    'progress': enrollment.get('progress', 0)
-                })
-        
-        # Generate learning path using AI or fallback
-        if GEMINI_API_KEY:
-            prompt = f"""
-            Create a personalized learning path for a student with the following profile:
-            
-            Goal: {goal}
-            Timeframe: {timeframe}
-            Current Courses: {[course['title'] for course in enrolled_courses]}
-            Department: {user.get('department', 'Not specified')}
-            
-            Provide a structured learning path with:
-            1. Weekly milestones
-            2. Recommended study hours per week
-            3. Key topics to focus on
-            4. Suggested resources or activities
-            
-            Format as a practical, actionable plan using markdown formatting.
-            """
-            
-            try:
-                model = genai.GenerativeModel('gemini-2.5-flash')
-                response = model.generate_content(prompt)
-                learning_path = response.text
-            except Exception as e:
-                print(f"Gemini API error in learning path: {str(e)}")
-                learning_path = generate_fallback_learning_path(goal, timeframe, enrolled_courses, user)
-        else:
-            learning_path = generate_fallback_learning_path(goal, timeframe, enrolled_courses, user)
+        if wants_async(data):
+            payload = {'goal': goal, 'timeframe': timeframe}
+            return enqueue_response(db, 'learning_path', payload, user_id, PRIORITY_NORMAL)
         
-        # Save learning path
-        path_data = {
-            'user_id': user_id,
-            'goal': goal,
-            'timeframe': timeframe,
-            'learning_path': learning_path,
-            'created_at': datetime.utcnow(),
-            'is_active': True
-        }
+        return jsonify(create_learning_path(db, user_context, user_id, goal, timeframe)), 201
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def create_learning_path(db, user_context, user_id, goal, timeframe):
+    """Generate a learning path, save it and return the API body"""
+    user = user_context['user']
+    
+    # Get user's current progress; titles come from the cached context
+    progress = {
+        enrollment['course_id']: enrollment.get('progress', 0)
+        for enrollment in db.enrollments.find({'student_id': user_id}, {'course_id': 1, 'progress': 1})
+    }
+    enrolled_courses = [
+        {'title': course['title'], 'progress': progress.get(course['course_id'], 0)}
+        for course in user_context['courses']
+    ]
+    
+    # Generate learning path using AI or fallback
+    if GEMINI_API_KEY:
+        prompt = f"""
+        Create a personalized learning path for a student with the following profile:
         
-        result = db.learning_paths.insert_one(path_data)
-        path_data['_id'] = str(result.inserted_id)
+        Goal: {goal}
+        Timeframe: {timeframe}
+        Current Courses: {[course['title'] for course in enrolled_courses]}
+        Department: {user.get('department', 'Not specified')}
         
-        return jsonify({
-            'message': 'Learning path generated successfully',
-            'learning_path': path_data
-        }), 201
+        Provide a structured learning path with:
+        1. Weekly milestones
+        2. Recommended study hours per week
+        3. Key topics to focus on
+        4. Suggested resources or activities
+        
+        Format as a practical, actionable plan using markdown formatting.
+        """
+        
+        try:
+            learning_path = generate(prompt, mode='learning_path')
+        except Exception as e:
+            print(f"Gemini API error in learning path: {str(e)}")
+            learning_path = generate_fallback_learning_path(goal, timeframe, enrolled_courses, user)
+    else:
+        learning_path = generate_fallback_learning_path(goal, timeframe, enrolled_courses, user)
+    
+    # Save learning path
+    path_data = {
+        'user_id': user_id,
+        'goal': goal,
+        'timeframe': timeframe,
+        'learning_path': learning_path,
+        'created_at': datetime.utcnow(),
+        'is_active': True
+    }
+    
+    result = db.learning_paths.insert_one(path_data)
+    path_data['_id'] = str(result.inserted_id)
+    
+    return {
+        'message': 'Learning path generated successfully',
+        'learning_path': path_data
+    }
+
+@job_handler('learning_path')
+def run_learning_path_job(db, job):
+    user_context = get_user_context(db, job['user_id'])
+    return create_learning_path(db, user_context, job['user_id'], job['payload']['goal'], job['payload']['timeframe'])
+
+@ai_bp.route('/jobs/<job_id>', methods=['GET'])
+@jwt_required()
+def get_ai_job(job_id):
+    """Status of a queued AI request, with its result once done"""
+    try:
+        user_id = get_jwt_identity()
+        job = get_job(current_app.db, job_id, user_id)
+        if not job:
+            return jsonify({'error': 'Job not found'}), 404
+        
+        return jsonify(job), 200
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
\ No newline at end of file
@@ -30,17 +30,11 @@ def get_teacher_dashboard_stats():
         if course_ids:
             total_students = db.enrollments.count_documents({'course_id': {'$in': course_ids}})
         
-        # Get assignments created by teacher
-        assignments = list(db.assignments.find({'course_id': {'$in': course_ids}}))
-        assignment_ids = [str(assignment['_id']) for assignment in assignments]
-        
-        # Calculate pending assignments (submissions without grades)
-        pending_grades = 0
-        if assignment_ids:
-            pending_grades = db.submissions.count_documents({
-                'assignment_id': {'$in': assignment_ids},
-                'grade': None
-            })
+        # Calculate pending assignments (served by the grading queue index)
+        pending_grades = db.submissions.count_documents({
+            'teacher_id': user_id,
+            'status': 'submitted'
+        })
         
         # Calculate average course ratings (placeholder - would need rating system)
         # For now, we'll calculate based on course completion rates as a proxy
@@ -2,7 +2,9 @@ from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from bson import ObjectId
 from datetime import datetime
-from routes.notifications import create_notification
+from pymongo import UpdateOne
+from routes.notifications import create_notification, create_notifications
+from utils.grading_queue import pending_submissions, CursorError, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
 from utils.validation import (
     validate_assignment_data,
     validate_grade_data,
@@ -11,6 +13,20 @@ from utils.validation import (
 
 assignments_bp = Blueprint('assignments', __name__)
 
+MAX_GRADING_BATCH = 1000
+
+def grade_notification(student_id, assignment, grade, max_points):
+    """Notification payload telling a student their submission was graded"""
+    percentage = (grade / max_points) * 100 if max_points else 0
+    notification_type = 'success' if percentage >= 70 else 'warning' if percentage >= 50 else 'error'
+    return {
+        'user_id': student_id,
+        'title': 'Assignment Graded',
+        'message': f'Your assignment "{assignment["title"]}" has been graded. Score: {grade}/{max_points} ({percentage:.1f}%)',
+        'notification_type': notification_type,
+        'link': f'/assignments/detail?id={assignment["_id"]}'
+    }
+
 @assignments_bp.route('/', methods=['GET'])
 @jwt_required()
 def get_assignments():
@@ -83,6 +99,74 @@ def get_assignments():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@assignments_bp.route('/grading-queue', methods=['GET'])
+@jwt_required()
+def get_grading_queue():
+    """Page through ungraded submissions, earliest due date first"""
+    try:
+        user_id = get_jwt_identity()
+        db = current_app.db
+        
+        user = db.users.find_one({'_id': ObjectId(user_id)}, {'role': 1})
+        if user['role'] not in ['teacher', 'admin']:
+            return jsonify({'error': 'Only teachers and admins can view the grading queue'}), 403
+        
+        # Admins may look at any teacher's queue
+        teacher_id = user_id if user['role'] == 'teacher' else request.args.get('teacher_id')
+        course_id = request.args.get('course_id')
+        try:
+            limit = min(max(int(request.args.get('limit', DEFAULT_PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+        except ValueError:
+            return jsonify({'error': 'limit must be an integer'}), 400
+        
+        submissions, next_cursor = pending_submissions(
+            db, teacher_id, course_id, request.args.get('cursor'), limit
+        )
+        
+        # Titles and names for this page only
+        assignments = {
+            str(a['_id']): a for a in db.assignments.find(
+                {'_id': {'$in': list({ObjectId(s['assignment_id']) for s in submissions})}},
+                {'title': 1, 'max_points': 1}
+            )
+        }
+        students = {
+            str(u['_id']): u for u in db.users.find(
+                {'_id': {'$in': list({ObjectId(s['student_id']) for s in submissions})}},
+                {'name': 1, 'email': 1, 'roll_no': 1}
+            )
+        }
+        
+        items = []
+        for submission in submissions:
+            assignment = assignments.get(submission['assignment_id'], {})
+            student = students.get(submission['student_id'], {})
+            items.append({
+                'submission_id': str(submission['_id']),
+                'assignment_id': submission['assignment_id'],
+                'assignment_title': assignment.get('title', ''),
+                'max_points': assignment.get('max_points', 100),
+                'course_id': submission['course_id'],
+                'student_id': submission['student_id'],
+                'student_name': student.get('name', ''),
+                'student_email': student.get('email', ''),
+                'roll_no': student.get('roll_no', ''),
+                'due_date': submission.get('due_date'),
+                'submitted_at': submission['submitted_at'],
+                'is_late': bool(submission.get('due_date') and submission['submitted_at'] > submission['due_date'])
+            })
+        
+        return jsonify({
+            'submissions': items,
+            'next_cursor': next_cursor,
+            'has_more': next_cursor is not None
+        }), 200
+        
+    except CursorError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @assignments_bp.route('/<assignment_id>', methods=['GET'])
 @jwt_required()
 def get_assignment(assignment_id):
@@ -241,6 +325,13 @@ def update_assignment(assignment_id):
             {'$set': update_data}
         )
         
+        # Keep the due date copied onto submissions for the grading queue in sync
+        if 'due_date' in validated_data:
+            db.submissions.update_many(
+                {'assignment_id': assignment_id},
+                {'$set': {'due_date': validated_data['due_date']}}
+            )
+        
         # Get updated assignment
         updated_assignment = db.assignments.find_one({'_id': ObjectId(assignment_id)})
         updated_assignment['_id'] = str(updated_assignment['_id'])
@@ -303,11 +394,15 @@ def submit_assignment(assignment_id):
         if submission_type in ['file', 'both'] and not data.get('file_path'):
             return jsonify({'error': 'File is required'}), 400
         
-        # Create submission
+        course = db.courses.find_one({'_id': ObjectId(assignment['course_id'])}, {'teacher_id': 1})
+        
+        # Create submission; teacher_id and due_date feed the grading queue index
         submission_data = {
             'assignment_id': assignment_id,
             'student_id': user_id,
             'course_id': assignment['course_id'],
+            'teacher_id': course['teacher_id'] if course else None,
+            'due_date': assignment['due_date'],
             'text_content': data.get('text_content', ''),
             'file_path': data.get('file_path', ''),
             'file_name': data.get('file_name', ''),
@@ -324,7 +419,6 @@ def submit_assignment(assignment_id):
         
         # Send notification to teacher
         try:
-            course = db.courses.find_one({'_id': ObjectId(assignment['course_id'])})
             if course:
                 teacher_id = course['teacher_id']
                 create_notification(
@@ -383,9 +477,11 @@ def grade_submission(submission_id):
         if 'grade' not in validated_data:
             return jsonify({'error': 'Grade is required'}), 400
         
+        grade = validated_data['grade']
+        
         # Update submission with validated data
         update_data = {
-            'grade': validated_data['grade'],
+            'grade': grade,
             'feedback': validated_data.get('feedback', ''),
             'status': 'graded',
             'graded_at': datetime.utcnow(),
@@ -397,25 +493,15 @@ def grade_submission(submission_id):
             {'$set': update_data}
         )
         
-        # Update student's total points
+        # Update student's total points (a regrade only adds the difference)
         db.users.update_one(
             {'_id': ObjectId(submission['student_id'])},
-            {'$inc': {'total_points': grade}}
+            {'$inc': {'total_points': grade - (submission.get('grade') or 0)}}
         )
         
         # Create notification for student
         try:
-            percentage = (grade / max_points) * 100
-            notification_type = 'success' if percentage >= 70 else 'warning' if percentage >= 50 else 'error'
-            
-            create_notification(
-                db=db,
-                user_id=submission['student_id'],
-                title='Assignment Graded',
-                message=f'Your assignment "{assignment["title"]}" has been graded. Score: {grade}/{max_points} ({percentage:.1f}%)',
-                notification_type=notification_type,
-                link=f'/assignments/detail?id={assignment["_id"]}'
-            )
+            create_notification(db=db, **grade_notification(submission['student_id'], assignment, grade, max_points))
         except Exception as notif_error:
             # Don't fail the grading if notification fails
             print(f"Failed to create notification: {notif_error}")
@@ -423,4 +509,126 @@ def grade_submission(submission_id):
         return jsonify({'message': 'Submission graded successfully'}), 200
         
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
\ No newline at end of file
+        return jsonify({'error': str(e)}), 500
+
+@assignments_bp.route('/<assignment_id>/grade/batch', methods=['POST'])
+@jwt_required()
+def grade_submissions_batch(assignment_id):
+    """Grade many submissions of one assignment in a single request"""
+    try:
+        user_id = get_jwt_identity()
+        db = current_app.db
+        
+        # Check if user is teacher or admin
+        user = db.users.find_one({'_id': ObjectId(user_id)}, {'role': 1})
+        if user['role'] not in ['teacher', 'admin']:
+            return jsonify({'error': 'Only teachers and admins can grade submissions'}), 403
+        
+        assignment = db.assignments.find_one({'_id': ObjectId(assignment_id)})
+        if not assignment:
+            return jsonify({'error': 'Assignment not found'}), 404
+        
+        course = db.courses.find_one({'_id': ObjectId(assignment['course_id'])}, {'teacher_id': 1})
+        if user['role'] == 'teacher' and (not course or course['teacher_id'] != user_id):
+            return jsonify({'error': 'Access denied'}), 403
+        
+        items = (request.get_json() or {}).get('grades')
+        if not isinstance(items, list) or not items:
+            return jsonify({'error': 'grades must be a non-empty list'}), 400
+        if len(items) > MAX_GRADING_BATCH:
+            return jsonify({'error': f'At most {MAX_GRADING_BATCH} grades per request'}), 400
+        
+        max_points = assignment.get('max_points', 100)
+        results = [None] * len(items)
+        
+        # Validate every item against the one assignment
+        valid = []
+        for index, item in enumerate(items):
+            try:
+                if not isinstance(item, dict):
+                    raise ValidationError('Each grade must be an object')
+                if not item.get('submission_id') and not item.get('student_id'):
+                    raise ValidationError('submission_id or student_id is required', 'submission_id')
+                if item.get('submission_id') and not ObjectId.is_valid(item['submission_id']):
+                    raise ValidationError('Invalid submission_id', 'submission_id')
+                validated_data = validate_grade_data(item, max_points)
+                if 'grade' not in validated_data:
+                    raise ValidationError('Grade is required', 'grade')
+                valid.append((index, item, validated_data))
+            except ValidationError as e:
+                results[index] = {'index': index, 'status': 'error', 'error': e.message, 'field': e.field}
+        
+        # Load all referenced submissions of this assignment in one query
+        submission_ids = [ObjectId(item['submission_id']) for _, item, _ in valid if item.get('submission_id')]
+        student_ids = [str(item['student_id']) for _, item, _ in valid if not item.get('submission_id')]
+        submissions = list(db.submissions.find(
+            {'assignment_id': assignment_id, '$or': [{'_id': {'$in': submission_ids}}, {'student_id': {'$in': student_ids}}]},
+            {'student_id': 1, 'grade': 1}
+        ))
+        by_id = {str(s['_id']): s for s in submissions}
+        by_student = {s['student_id']: s for s in submissions}
+        
+        now = datetime.utcnow()
+        submission_ops = []
+        point_deltas = {}
+        notifications = []
+        seen = set()
+        for index, item, validated_data in valid:
+            submission = by_id.get(item['submission_id']) if item.get('submission_id') \
+                else by_student.get(str(item['student_id']))
+            if not submission:
+                results[index] = {'index': index, 'status': 'error', 'error': 'Submission not found'}
+                continue
+            if submission['_id'] in seen:
+                results[index] = {'index': index, 'status': 'error', 'error': 'Submission graded twice in this batch'}
+                continue
+            seen.add(submission['_id'])
+            
+            grade = validated_data['grade']
+            update_data = {
+                'grade': grade,
+                'feedback': validated_data.get('feedback', ''),
+                'status': 'graded',
+                'graded_at': now,
+                'graded_by': user_id
+            }
+            submission_ops.append(UpdateOne({'_id': submission['_id']}, {'$set': update_data}))
+            
+            # A regrade only adds the difference to the student's points
+            student_id = submission['student_id']
+            point_deltas[student_id] = point_deltas.get(student_id, 0) + grade - (submission.get('grade') or 0)
+            notifications.append(grade_notification(student_id, assignment, grade, max_points))
+            results[index] = {
+                'index': index,
+                'status': 'graded',
+                'submission_id': str(submission['_id']),
+                'student_id': student_id,
+                'grade': grade
+            }
+        
+        if submission_ops:
+            db.submissions.bulk_write(submission_ops, ordered=False)
+        
+        user_ops = [
+            UpdateOne({'_id': ObjectId(student_id)}, {'$inc': {'total_points': delta}})
+            for student_id, delta in point_deltas.items() if delta
+        ]
+        if user_ops:
+            db.users.bulk_write(user_ops, ordered=False)
+        
+        try:
+            create_notifications(db, notifications)
+        except Exception as notif_error:
+            # Don't fail the grading if notifications fail
+            print(f"Failed to create notifications: {notif_error}")
+        
+        graded = len(submission_ops)
+        return jsonify({
+            'message': f'{graded} submissions graded',
+            'graded': graded,
+            'failed': len(items) - graded,
+            'results': results
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
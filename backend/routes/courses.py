@@ -1,10 +1,45 @@
-from flask import Blueprint, request, jsonify, current_app, send_from_directory
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask import Blueprint, request, jsonify, current_app, send_file
+from flask_jwt_extended import jwt_required, get_jwt_identity, verify_jwt_in_request
 from bson import ObjectId
 from datetime import datetime, timedelta
+import csv
+import io
 import os
 from werkzeug.utils import secure_filename
-from routes.notifications import create_notification
+from routes.notifications import create_notification, create_notifications
+from utils.media_delivery import send_media, send_blob
+from utils.ai_jobs import job_handler
+from utils.media_store import save_upload, store_blob, ingest_media, release_blob, BlobUnavailableError
+from utils.images import (
+    ingest_image,
+    image_variant,
+    render_variants,
+    release_render,
+    is_image_file,
+    variant_url,
+    variant_urls,
+    ImageError,
+    MAX_IMAGE_SIZE
+)
+from utils.mp4 import format_duration
+from utils.completions import record_completion
+from utils.enrollments import enroll_student, unenroll_student, bulk_enroll, resolve_students, EnrollmentError
+from utils.ai_context import invalidate_course
+from utils.course_index import queue_course_index
+from utils.material_summaries import queue_material_summaries
+from utils.pdf_text import MAX_PDF_SIZE_MB
+from utils.catalog import search_courses, CATALOG_PAGE_SIZE, MAX_CATALOG_PAGE_SIZE
+from utils.course_bundle import (
+    new_course,
+    lesson_materials,
+    create_course_bundle,
+    export_course,
+    bundle_archive,
+    load_bundle,
+    import_course,
+    parse_term_start,
+    BundleError
+)
 from utils.validation import (
     validate_course_data,
     validate_material_data,
@@ -15,8 +50,14 @@ from utils.validation import (
 
 courses_bp = Blueprint('courses', __name__)
 
+MAX_BULK_ENROLLMENT = 5000
+IDENTIFIER_COLUMNS = ('student_id', 'id', 'email', 'roll_number', 'roll_no')
+OUTLINE_PROJECTION = {'title': 1, 'type': 1, 'order': 1, 'is_required': 1}
+
 ALLOWED_EXTENSIONS = {'pdf', 'doc', 'docx', 'ppt', 'pptx', 'mp4', 'avi', 'mov', 'mkv', 'webm', 'jpg', 'jpeg', 'png'}
 VIDEO_EXTENSIONS = {'mp4', 'avi', 'mov', 'mkv', 'webm'}
+# Larger videos go through the chunked upload API (/api/uploads, target course_video)
+MAX_VIDEO_SIZE = 100 * 1024 * 1024  # 100MB
 
 # Create uploads directory if it doesn't exist
 UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'uploads')
@@ -29,6 +70,32 @@ def allowed_file(filename):
 def is_video_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in VIDEO_EXTENSIONS
 
+def can_view_course(db, course, user, user_id):
+    """Students need an enrollment unless the course is public; teachers must own it"""
+    if user['role'] == 'student':
+        enrollment = db.enrollments.find_one({
+            'course_id': str(course['_id']),
+            'student_id': user_id
+        }, {'_id': 1})
+        return enrollment is not None or course.get('is_public', False)
+    if user['role'] == 'teacher':
+        return course['teacher_id'] == user_id
+    return True
+
+def can_view_image(db, sha256, user_id):
+    """Whether the user can view a course that has an image material with this content"""
+    user = db.users.find_one({'_id': ObjectId(user_id)})
+    if not user:
+        return False
+    
+    # The same image can be a material of several courses
+    course_ids = db.materials.distinct('course_id', {'blob_sha256': sha256, 'type': 'image'})
+    courses = db.courses.find(
+        {'_id': {'$in': [ObjectId(course_id) for course_id in course_ids]}},
+        {'teacher_id': 1, 'is_public': 1}
+    )
+    return any(can_view_course(db, course, user, user_id) for course in courses)
+
 @courses_bp.route('/', methods=['GET'])
 @jwt_required()
 def get_courses():
@@ -155,6 +222,40 @@ def get_courses():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@courses_bp.route('/search', methods=['GET'])
+@jwt_required()
+def search_catalog():
+    """Relevance-ranked catalog search with category and difficulty facets"""
+    try:
+        db = current_app.db
+        
+        try:
+            page = max(int(request.args.get('page', 1)), 1)
+            limit = min(max(int(request.args.get('limit', CATALOG_PAGE_SIZE)), 1), MAX_CATALOG_PAGE_SIZE)
+        except ValueError:
+            return jsonify({'error': 'page and limit must be integers'}), 400
+        
+        courses, total, facets = search_courses(
+            db,
+            text=request.args.get('q', ''),
+            category=request.args.get('category'),
+            difficulty=request.args.get('difficulty'),
+            page=page,
+            limit=limit
+        )
+        
+        return jsonify({
+            'courses': courses,
+            'total': total,
+            'page': page,
+            'limit': limit,
+            'total_pages': (total + limit - 1) // limit,
+            'facets': facets
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @courses_bp.route('/<course_id>', methods=['GET'])
 @jwt_required()
 def get_course(course_id):
@@ -167,18 +268,9 @@ def get_course(course_id):
         if not course:
             return jsonify({'error': 'Course not found'}), 404
         
-        # Get user to check permissions
-        user = db.users.find_one({'_id': ObjectId(user_id)})
-        
         # Check if user has access to this course
-        if user['role'] == 'student':
-            enrollment = db.enrollments.find_one({
-                'course_id': course_id,
-                'student_id': user_id
-            })
-            if not enrollment and not course.get('is_public', False):
-                return jsonify({'error': 'Access denied'}), 403
-        elif user['role'] == 'teacher' and course['teacher_id'] != user_id:
+        user = db.users.find_one({'_id': ObjectId(user_id)})
+        if not can_view_course(db, course, user, user_id):
             return jsonify({'error': 'Access denied'}), 403
         
         # Convert ObjectId to string
@@ -191,23 +283,53 @@ def get_course(course_id):
             course['teacher_name'] = teacher['name']
             course['teacher_email'] = teacher['email']
         
+        # The outline only carries what a sidebar needs; bodies are fetched per material
+        outline = request.args.get('outline', '').lower() in ('1', 'true')
+        
         # Get materials
-        materials = list(db.materials.find({'course_id': course_id}))
+        materials = list(db.materials.find(
+            {'course_id': course_id},
+            OUTLINE_PROJECTION if outline else None
+        ).sort([('order', 1), ('_id', 1)]))
         for material in materials:
             material['_id'] = str(material['_id'])
         course['materials'] = materials
         
         # Get assignments
-        assignments = list(db.assignments.find({'course_id': course_id}))
+        assignments = list(db.assignments.find(
+            {'course_id': course_id},
+            {**OUTLINE_PROJECTION, 'due_date': 1} if outline else None
+        ))
         for assignment in assignments:
             assignment['_id'] = str(assignment['_id'])
         course['assignments'] = assignments
         
+        return jsonify({'course': course}), 200
 
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@courses_bp.route('/<course_id>/materials/<material_id>', methods=['GET'])
+@jwt_required()
+def get_material(course_id, material_id):
+    """Full body of one material, loaded when the student opens it"""
+    try:
+        user_id = get_jwt_identity()
+        db = current_app.db
+
+        # Access is checked first so material ids of other courses cannot be probed
+        course = db.courses.find_one({'_id': ObjectId(course_id)}, {'teacher_id': 1, 'is_public': 1})
+        user = db.users.find_one({'_id': ObjectId(user_id)})
+        if not course or not can_view_course(db, course, user, user_id):
+            return jsonify({'error': 'Material not found'}), 404
+
+        material = db.materials.find_one({'_id': ObjectId(material_id), 'course_id': course_id})
+        if not material:
+            return jsonify({'error': 'Material not found'}), 404
+
+        material['_id'] = str(material['_id'])
+        return jsonify({'material': material}), 200
 
-        
-        return jsonify({'course': course}), 200
-        
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -237,48 +359,14 @@ def create_course():
             if field not in validated_data:
                 return jsonify({'error': f'{field} is required'}), 400
         
-        # Create course with validated data
-        course_data = {
-            **validated_data,
-            'teacher_id': user_id,
-            'difficulty': validated_data.get('difficulty', 'Beginner'),
-            'duration': validated_data.get('duration', ''),
-            'prerequisites': validated_data.get('prerequisites', []),
-            'learning_objectives': validated_data.get('learning_objectives', []),
-            'thumbnail': validated_data.get('thumbnail', ''),
-            'is_active': True,
-            'is_public': validated_data.get('is_public', True),
-            'max_students': validated_data.get('max_students', 0),  # 0 means unlimited
-            'created_at': datetime.utcnow(),
-            'updated_at': datetime.utcnow()
-        }
-        
-        result = db.courses.insert_one(course_data)
-        course_id = str(result.inserted_id)
-        
-        # Process modules and create materials
-        modules = data.get('modules', [])
-        for module in modules:
-            for lesson in module.get('lessons', []):
-                if lesson.get('content') and lesson.get('title'):
-                    material_data = {
-                        'course_id': course_id,
-                        'title': lesson['title'],
-                        'description': lesson.get('description', ''),
-                        'type': lesson.get('type', 'video'),
-                        'content': lesson['content'],  # This is the video ID
-                        'order': lesson.get('order', 0),
-                        'is_required': lesson.get('is_required', False),
-                        'uploaded_by': user_id,
-                        'created_at': datetime.utcnow()
-                    }
-                    db.materials.insert_one(material_data)
-        
-        # Update teacher's courses_created list
-        db.users.update_one(
-            {'_id': ObjectId(user_id)},
-            {'$push': {'courses_created': course_id}}
-        )
+        # Course, lesson materials and the teacher's course list go in one transaction
+        course_data = new_course(validated_data, user_id)
+        materials = lesson_materials(data.get('modules', []), user_id)
+        course_id = create_course_bundle(db, course_data, materials, user_id=user_id)
+        # Summaries of the handouts are made ahead of time by the AI workers
+        queue_material_summaries(db, materials)
+        if materials:
+            queue_course_index(db, course_id)
         
         course_data['_id'] = course_id
         course_data['course_id'] = course_id
@@ -291,6 +379,79 @@ def create_course():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@courses_bp.route('/<course_id>/export', methods=['GET'])
+@jwt_required()
+def export_course_bundle(course_id):
+    """Export a course as a bundle for cloning; ?format=zip returns a zip archive"""
+    try:
+        user_id = get_jwt_identity()
+        db = current_app.db
+
+        course = db.courses.find_one({'_id': ObjectId(course_id)})
+        if not course:
+            return jsonify({'error': 'Course not found'}), 404
+
+        user = db.users.find_one({'_id': ObjectId(user_id)})
+        if user['role'] != 'admin' and course['teacher_id'] != user_id:
+            return jsonify({'error': 'Access denied'}), 403
+
+        bundle = export_course(db, course)
+        if request.args.get('format') == 'zip':
+            return send_file(
+                bundle_archive(bundle),
+                mimetype='application/zip',
+                as_attachment=True,
+                download_name=f'course-{course_id}.zip'
+            )
+
+        return jsonify(bundle), 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@courses_bp.route('/import', methods=['POST'])
+@jwt_required()
+def import_course_bundle():
+    """Create a new course from a bundle (JSON body, or a .json/.zip file in `bundle`)"""
+    try:
+        user_id = get_jwt_identity()
+        db = current_app.db
+
+        user = db.users.find_one({'_id': ObjectId(user_id)})
+        if user['role'] not in ['teacher', 'admin']:
+            return jsonify({'error': 'Only teachers and admins can create courses'}), 403
+
+        upload = request.files.get('bundle')
+        bundle = load_bundle(request.get_json(silent=True) if upload is None else None, upload)
+
+        try:
+            term_start = parse_term_start(request.values.get('term_start'))
+            course, materials, assignments, skipped = import_course(
+                db, bundle, user_id, term_start, request.values.get('title'), is_admin=user['role'] == 'admin'
+            )
+        except ValidationError as e:
+            return jsonify({'error': e.message, 'field': e.field}), 400
+        queue_material_summaries(db, materials)
+
+        course_id = str(course['_id'])
+        if materials:
+            queue_course_index(db, course_id)
+        course['_id'] = course_id
+        course['course_id'] = course_id
+
+        return jsonify({
+            'message': 'Course imported successfully',
+            'course': course,
+            'materials_created': len(materials),
+            'assignments_created': len(assignments),
+            'skipped': skipped
+        }), 201
+
+    except (BundleError, BlobUnavailableError) as e:
+        return jsonify({'error': e.message}), e.status_code
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @courses_bp.route('/<course_id>', methods=['PUT'])
 @jwt_required()
 def update_course(course_id):
@@ -321,11 +482,22 @@ def update_course(course_id):
         validated_data['updated_at'] = datetime.utcnow()
         update_data = validated_data
         
+        # A thumbnail URL set by hand replaces an uploaded thumbnail
+        replaced_thumbnail = course.get('thumbnail_sha256') and \
+            validated_data.get('thumbnail', course.get('thumbnail')) != course.get('thumbnail')
+        update = {'$set': update_data}
+        if replaced_thumbnail:
+            update['$unset'] = {'thumbnail_sha256': '', 'thumbnail_variants': ''}
+        
         # Update course
         db.courses.update_one(
             {'_id': ObjectId(course_id)},
-            {'$set': update_data}
+            update
         )
+        if replaced_thumbnail:
+            release_blob(db, course['thumbnail_sha256'])
+        if validated_data.get('title', course['title']) != course['title']:
+            invalidate_course(db, course_id)
         
         # Get updated course
         updated_course = db.courses.find_one({'_id': ObjectId(course_id)})
@@ -347,51 +519,15 @@ def enroll_course(course_id):
         db = current_app.db
         
         # Check if user is student
-        user = db.users.find_one({'_id': ObjectId(user_id)})
+        user = db.users.find_one({'_id': ObjectId(user_id)}, {'role': 1})
         if user['role'] != 'student':
             return jsonify({'error': 'Only students can enroll in courses'}), 403
         
-        # Check if course exists
-        course = db.courses.find_one({'_id': ObjectId(course_id)})
-        if not course:
-            return jsonify({'error': 'Course not found'}), 404
-        
-        if not course.get('is_active', True):
-            return jsonify({'error': 'Course is not active'}), 400
-        
-        # Check if already enrolled
-        existing_enrollment = db.enrollments.find_one({
-            'course_id': course_id,
-            'student_id': user_id
-        })
-        if existing_enrollment:
-            return jsonify({'error': 'Already enrolled in this course'}), 409
-        
-        # Check max students limit
-        if course.get('max_students', 0) > 0:
-            current_enrollments = db.enrollments.count_documents({'course_id': course_id})
-            if current_enrollments >= course['max_students']:
-                return jsonify({'error': 'Course is full'}), 400
-        
-        # Create enrollment
-        enrollment_data = {
-            'course_id': course_id,
-            'student_id': user_id,
-            'enrolled_at': datetime.utcnow(),
-            'progress': 0,
-            'completed_materials': [],
-            'completed_assignments': [],
-
-            'is_active': True
-        }
-        
-        db.enrollments.insert_one(enrollment_data)
-        
-        # Update user's enrolled courses
-        db.users.update_one(
-            {'_id': ObjectId(user_id)},
-            {'$push': {'enrolled_courses': course_id}}
-        )
+        # Seat reservation and the unique index do the capacity/duplicate checks
+        idempotency_key = request.headers.get('Idempotency-Key')
+        course, created = enroll_student(db, course_id, user_id, idempotency_key)
+        if not created:
+            return jsonify({'message': 'Successfully enrolled in course'}), 200
         
         # Create notification for student
         try:
@@ -408,6 +544,8 @@ def enroll_course(course_id):
         
         return jsonify({'message': 'Successfully enrolled in course'}), 200
         
+    except EnrollmentError as e:
+        return jsonify({'error': e.message}), e.status_code
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -418,31 +556,154 @@ def unenroll_course(course_id):
         user_id = get_jwt_identity()
         db = current_app.db
         
-        # Check if enrolled
-        enrollment = db.enrollments.find_one({
-            'course_id': course_id,
-            'student_id': user_id
-        })
-        if not enrollment:
+        # Remove enrollment, release the seat and update the user's course list
+        if not unenroll_student(db, course_id, user_id):
             return jsonify({'error': 'Not enrolled in this course'}), 404
         
-        # Remove enrollment
-        db.enrollments.delete_one({
-            'course_id': course_id,
-            'student_id': user_id
-        })
+        return jsonify({'message': 'Successfully unenrolled from course'}), 200
         
-        # Update user's enrolled courses
-        db.users.update_one(
-            {'_id': ObjectId(user_id)},
-            {'$pull': {'enrolled_courses': course_id}}
-        )
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def read_student_identifiers():
+    """Collect student ids, emails or roll numbers from JSON or an uploaded CSV"""
+    csv_text = None
+    if 'file' in request.files:
+        csv_text = request.files['file'].read().decode('utf-8-sig')
+    elif request.mimetype == 'text/csv':
+        csv_text = request.get_data(as_text=True)
+    
+    if csv_text is None:
+        data = request.get_json(silent=True) or {}
+        identifiers = data.get('students', [])
+        if not isinstance(identifiers, list):
+            raise ValidationError('students must be a list', 'students')
+        return [str(i).strip() for i in identifiers if str(i).strip()]
+    
+    rows = [row for row in csv.reader(io.StringIO(csv_text)) if any(cell.strip() for cell in row)]
+    if not rows:
+        return []
+    
+    # Use a known identifier column when there is a header, otherwise the first column
+    header = [cell.strip().lower() for cell in rows[0]]
+    column = next((header.index(name) for name in IDENTIFIER_COLUMNS if name in header), None)
+    if column is None:
+        column = 0
+    else:
+        rows = rows[1:]
+    return [row[column].strip() for row in rows if len(row) > column and row[column].strip()]
+
+@courses_bp.route('/<course_id>/enroll/bulk', methods=['POST'])
+@jwt_required()
+def bulk_enroll_course(course_id):
+    """Enroll a cohort by student id, email or roll number (JSON list or CSV)"""
+    try:
+        user_id = get_jwt_identity()
+        db = current_app.db
         
-        return jsonify({'message': 'Successfully unenrolled from course'}), 200
+        course = db.courses.find_one({'_id': ObjectId(course_id)}, {'title': 1, 'teacher_id': 1})
+        if not course:
+            return jsonify({'error': 'Course not found'}), 404
+        
+        user = db.users.find_one({'_id': ObjectId(user_id)}, {'role': 1})
+        if user['role'] != 'admin' and course['teacher_id'] != user_id:
+            return jsonify({'error': 'Access denied'}), 403
+        
+        identifiers = read_student_identifiers()
+        if not identifiers:
+            return jsonify({'error': 'No students provided'}), 400
+        if len(identifiers) > MAX_BULK_ENROLLMENT:
+            return jsonify({'error': f'At most {MAX_BULK_ENROLLMENT} students can be enrolled at once'}), 400
+        
+        students, not_found, not_students = resolve_students(db, identifiers)
+        enrolled, already_enrolled = bulk_enroll(db, course_id, list(students))
+        
+        try:
+            create_notifications(db, [{
+                'user_id': student_id,
+                'title': 'Course Enrollment Successful',
+                'message': f'You have been enrolled in "{course["title"]}". Start learning now!',
+                'notification_type': 'success',
+                'link': f'/courses/detail?id={course_id}'
+            } for student_id in enrolled])
+        except Exception as notif_error:
+            print(f"Failed to create notifications: {notif_error}")
         
+        def describe(student_id):
+            student = students[student_id]
+            return {
+                'student_id': student_id,
+                'name': student.get('name', ''),
+                'email': student.get('email', '')
+            }
+        
+        return jsonify({
+            'message': f'{len(enrolled)} students enrolled',
+            'enrolled': [describe(s) for s in enrolled],
+            'already_enrolled': [describe(s) for s in already_enrolled],
+            'not_found': not_found,
+            'not_students': not_students
+        }), 200
+        
+    except ValidationError as e:
+        return jsonify({'error': e.message, 'field': e.field}), 400
+    except UnicodeDecodeError:
+        return jsonify({'error': 'CSV file must be UTF-8 encoded'}), 400
+    except EnrollmentError as e:
+        return jsonify({'error': e.message}), e.status_code
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def create_video_material(db, course, user_id, blob, unique_filename, title, description='', order=0, duration=''):
+    """Create the video material for a stored blob and notify enrolled students"""
+    course_id = str(course['_id'])
+    media_info = blob.get('media_info') or {}
+    if not duration and media_info.get('duration_seconds'):
+        duration = format_duration(media_info['duration_seconds'])
+    video_data = {
+        'course_id': course_id,
+        'title': title,
+        'description': description,
+        'type': 'video',
+        'filename': unique_filename,
+        'file_path': blob['path'],
+        'storage_key': blob['key'],
+        'file_size': blob['size'],
+        'blob_sha256': blob['_id'],
+        'url': f'/api/courses/videos/{unique_filename}',
+        'duration': duration,
+        'duration_seconds': media_info.get('duration_seconds'),
+        'bitrate': media_info.get('bitrate'),
+        'order': int(order),
+        'is_required': True,
+        'uploaded_by': user_id,
+        'created_at': datetime.utcnow(),
+        'views': 0,
+        'completion_count': 0
+    }
+    
+    result = db.materials.insert_one(video_data)
+    video_data['_id'] = str(result.inserted_id)
+    queue_course_index(db, course_id)
+    video_data['material_id'] = str(result.inserted_id)
+    
+    # Notify enrolled students
+    enrollments = db.enrollments.find({'course_id': course_id})
+    for enrollment in enrollments:
+        try:
+            create_notification(
+                db=db,
+                user_id=enrollment['student_id'],
+                title='New Video Added',
+                message=f'A new video "{title}" has been added to {course["title"]}',
+                notification_type='info',
+                link=f'/courses/detail?id={course_id}'
+            )
+        except:
+            pass
+    
+    return video_data
+
 @courses_bp.route('/<course_id>/upload-video', methods=['POST'])
 @jwt_required()
 def upload_video(course_id):
@@ -459,6 +720,10 @@ def upload_video(course_id):
         if user['role'] != 'admin' and course['teacher_id'] != user_id:
             return jsonify({'error': 'Access denied'}), 403
         
+        # Enforce the upload size limit before reading the body
+        if request.content_length and request.content_length > MAX_VIDEO_SIZE:
+            return jsonify({'error': f'File too large. Maximum size is {MAX_VIDEO_SIZE // (1024 * 1024)}MB. Use the chunked upload API for larger videos.'}), 413
+        
         # Check if video file is present
         if 'video' not in request.files:
             return jsonify({'error': 'No video file provided'}), 400
@@ -479,49 +744,20 @@ def upload_video(course_id):
         if not title:
             return jsonify({'error': 'Video title is required'}), 400
         
-        # Save video file
+        # Save video file into the content-addressed store
         filename = secure_filename(video_file.filename)
         timestamp = datetime.utcnow().strftime('%Y%m%d_%H%M%S')
         unique_filename = f"{course_id}_{timestamp}_{filename}"
-        video_path = os.path.join(VIDEO_FOLDER, unique_filename)
-        video_file.save(video_path)
+        temp_path, file_size, sha256 = save_upload(video_file, max_size=MAX_VIDEO_SIZE)
         
-        # Create video material record
-        video_data = {
-            'course_id': course_id,
-            'title': title,
-            'description': description,
-            'type': 'video',
-            'filename': unique_filename,
-            'file_path': video_path,
-            'url': f'/api/courses/videos/{unique_filename}',
-            'duration': duration,
-            'order': int(order),
-            'is_required': True,
-            'uploaded_by': user_id,
-            'created_at': datetime.utcnow(),
-            'views': 0,
-            'completed_by': []
-        }
+        # Content-Length is missing on chunked requests; check what was actually read
+        if file_size > MAX_VIDEO_SIZE:
+            os.remove(temp_path)
+            return jsonify({'error': f'File too large. Maximum size is {MAX_VIDEO_SIZE // (1024 * 1024)}MB. Use the chunked upload API for larger videos.'}), 413
         
-        result = db.materials.insert_one(video_data)
-        video_data['_id'] = str(result.inserted_id)
-        video_data['material_id'] = str(result.inserted_id)
+        blob = ingest_media(db, temp_path, filename.rsplit('.', 1)[1], sha256, file_size)
         
-        # Notify enrolled students
-        enrollments = db.enrollments.find({'course_id': course_id})
-        for enrollment in enrollments:
-            try:
-                create_notification(
-                    db=db,
-                    user_id=enrollment['student_id'],
-                    title='New Video Added',
-                    message=f'A new video "{title}" has been added to {course["title"]}',
-                    notification_type='info',
-                    link=f'/courses/detail?id={course_id}'
-                )
-            except:
-                pass
+        video_data = create_video_material(db, course, user_id, blob, unique_filename, title, description, order, duration)
         
         return jsonify({
             'message': 'Video uploaded successfully',
@@ -572,11 +808,275 @@ def serve_video(filename):
             {'$inc': {'views': 1}}
         )
         
-        return send_from_directory(VIDEO_FOLDER, filename)
+        if video.get('storage_key'):
+            return send_blob(video['storage_key'])
+        
+        # Legacy materials were saved under VIDEO_FOLDER by their filename
+        video_path = video.get('file_path') or os.path.join(VIDEO_FOLDER, filename)
+        return send_media(os.path.dirname(video_path), os.path.basename(video_path))
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def read_image_upload(field):
+    """Validate and stage an uploaded image; returns (temp_path, extension, size, sha256)"""
+    if request.content_length and request.content_length > MAX_IMAGE_SIZE:
+        raise ImageError(f'Image too large. Maximum size is {MAX_IMAGE_SIZE // (1024 * 1024)}MB', 413)
+    
+    image = request.files.get(field)
+    if not image or image.filename == '':
+        raise ImageError('No image file provided')
+    if not is_image_file(image.filename):
+        raise ImageError('Invalid image format')
+    
+    extension = secure_filename(image.filename).rsplit('.', 1)[1].lower()
+    temp_path, file_size, sha256 = save_upload(image)
+    # Content-Length can be missing or wrong; check what was actually read
+    if file_size > MAX_IMAGE_SIZE:
+        os.remove(temp_path)
+        raise ImageError(f'Image too large. Maximum size is {MAX_IMAGE_SIZE // (1024 * 1024)}MB', 413)
+    return temp_path, extension, file_size, sha256
+
+@courses_bp.route('/<course_id>/thumbnail', methods=['POST'])
+@jwt_required()
+def upload_thumbnail(course_id):
+    """Upload a course thumbnail; resized variants are generated in the background"""
+    try:
+        user_id = get_jwt_identity()
+        db = current_app.db
+        
+        course = db.courses.find_one({'_id': ObjectId(course_id)})
+        if not course:
+            return jsonify({'error': 'Course not found'}), 404
+        
+        user = db.users.find_one({'_id': ObjectId(user_id)})
+        if user['role'] != 'admin' and course['teacher_id'] != user_id:
+            return jsonify({'error': 'Access denied'}), 403
+        
+        temp_path, extension, file_size, sha256 = read_image_upload('image')
+        blob = ingest_image(db, temp_path, extension, sha256, file_size)
+        
+        thumbnail = {
+            'thumbnail': variant_url(blob['_id']),
+            'thumbnail_sha256': blob['_id'],
+            'thumbnail_variants': variant_urls(blob['_id']),
+            'updated_at': datetime.utcnow()
+        }
+        db.courses.update_one({'_id': ObjectId(course_id)}, {'$set': thumbnail})
+        
+        # Drop the reference held by the previous thumbnail
+        if course.get('thumbnail_sha256'):
+            release_blob(db, course['thumbnail_sha256'])
+        
+        thumbnail.pop('updated_at')
+        return jsonify({'message': 'Thumbnail uploaded successfully', **thumbnail}), 201
+        
+    except ImageError as e:
+        return jsonify({'error': e.message}), e.status_code
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@courses_bp.route('/<course_id>/upload-image', methods=['POST'])
+@jwt_required()
+def upload_image(course_id):
+    """Upload an image material"""
+    try:
+        user_id = get_jwt_identity()
+        db = current_app.db
+        
+        course = db.courses.find_one({'_id': ObjectId(course_id)})
+        if not course:
+            return jsonify({'error': 'Course not found'}), 404
+        
+        user = db.users.find_one({'_id': ObjectId(user_id)})
+        if user['role'] != 'admin' and course['teacher_id'] != user_id:
+            return jsonify({'error': 'Access denied'}), 403
+        
+        title = request.form.get('title')
+        if not title:
+            return jsonify({'error': 'Image title is required'}), 400
+        
+        temp_path, extension, file_size, sha256 = read_image_upload('image')
+        blob = ingest_image(db, temp_path, extension, sha256, file_size)
+        
+        image_data = {
+            'course_id': course_id,
+            'title': title,
+            'description': request.form.get('description', ''),
+            'type': 'image',
+            'file_size': blob['size'],
+            'storage_key': blob['key'],
+            'blob_sha256': blob['_id'],
+            'width': blob['media_info'].get('width'),
+            'height': blob['media_info'].get('height'),
+            'url': variant_url(blob['_id'], '1280.webp'),
+            'variants': variant_urls(blob['_id']),
+            'order': int(request.form.get('order', 0)),
+            'is_required': False,
+            'uploaded_by': user_id,
+            'created_at': datetime.utcnow()
+        }
+        
+        result = db.materials.insert_one(image_data)
+        image_data['_id'] = str(result.inserted_id)
+        queue_course_index(db, course_id)
+        
+        return jsonify({
+            'message': 'Image uploaded successfully',
+            'material': image_data
+        }), 201
+        
+    except ImageError as e:
+        return jsonify({'error': e.message}), e.status_code
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@courses_bp.route('/<course_id>/upload-document', methods=['POST'])
+@jwt_required()
+def upload_document(course_id):
+    """Upload a PDF handout; the AI workers index and summarize its text"""
+    try:
+        user_id = get_jwt_identity()
+        db = current_app.db
+        
+        course = db.courses.find_one({'_id': ObjectId(course_id)})
+        if not course:
+            return jsonify({'error': 'Course not found'}), 404
+        
+        user = db.users.find_one({'_id': ObjectId(user_id)})
+        if user['role'] != 'admin' and course['teacher_id'] != user_id:
+            return jsonify({'error': 'Access denied'}), 403
+        
+        title = request.form.get('title')
+        if not title:
+            return jsonify({'error': 'Document title is required'}), 400
+        
+        document = request.files.get('file')
+        if not document or document.filename == '':
+            return jsonify({'error': 'No document file provided'}), 400
+        
+        try:
+            validate_file_type(document.filename, ['pdf'])
+            if request.content_length:
+                validate_file_size(request.content_length, MAX_PDF_SIZE_MB)
+        except ValidationError as e:
+            return jsonify({'error': e.message, 'field': e.field}), 400
+        
+        temp_path, file_size, sha256 = save_upload(document)
+        try:
+            # Content-Length can be missing or wrong; check what was actually read
+            validate_file_size(file_size, MAX_PDF_SIZE_MB)
+            with open(temp_path, 'rb') as f:
+                if f.read(5) != b'%PDF-':
+                    raise ValidationError('file is not a PDF document', 'file')
+        except ValidationError as e:
+            os.remove(temp_path)
+            return jsonify({'error': e.message, 'field': e.field}), 400
+        
+        blob = store_blob(db, temp_path, 'pdf', sha256, file_size)
+        
+        material_id = ObjectId()
+        document_data = {
+            '_id': material_id,
+            'course_id': course_id,
+            'title': title,
+            'description': request.form.get('description', ''),
+            'type': 'pdf',
+            'filename': secure_filename(document.filename),
+            'file_size': blob['size'],
+            'storage_key': blob['key'],
+            'blob_sha256': blob['_id'],
+            'url': f'/api/courses/{course_id}/materials/{material_id}/file',
+            'order': int(request.form.get('order', 0)),
+            'is_required': request.form.get('is_required', 'false').lower() == 'true',
+            'uploaded_by': user_id,
+            'created_at': datetime.utcnow()
+        }
+        
+        db.materials.insert_one(document_data)
+        document_data['_id'] = str(material_id)
+        
+        # The Q&A retrieval index and the summary are built by the AI workers
+        queue_course_index(db, course_id)
+        queue_material_summaries(db, [document_data])
+        
+        return jsonify({
+            'message': 'Document uploaded successfully',
+            'material': document_data
+        }), 201
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@courses_bp.route('/<course_id>/materials/<material_id>/file', methods=['GET'])
+@jwt_required()
+def serve_material_file(course_id, material_id):
+    """Download the file of an uploaded document material"""
+    try:
+        user_id = get_jwt_identity()
+        db = current_app.db
+        
+        course = db.courses.find_one({'_id': ObjectId(course_id)}, {'teacher_id': 1, 'is_public': 1})
+        user = db.users.find_one({'_id': ObjectId(user_id)})
+        if not course or not can_view_course(db, course, user, user_id):
+            return jsonify({'error': 'Material not found'}), 404
+        
+        material = db.materials.find_one(
+            {'_id': ObjectId(material_id), 'course_id': course_id},
+            {'storage_key': 1, 'type': 1}
+        )
+        if not material or material.get('type') != 'pdf' or not material.get('storage_key'):
+            return jsonify({'error': 'Material not found'}), 404
+        
+        return send_blob(material['storage_key'])
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@courses_bp.route('/images/<sha256>/<variant>', methods=['GET'])
+def serve_image(sha256, variant):
+    """
+    Serve a resized image variant; names are content-addressed so they never change.
+    
+    Course thumbnails are public. Image materials need the same access as
+    get_material, and anyone else gets the same 404 as for an unknown image.
+    """
+    verify_jwt_in_request(optional=True)
+    try:
+        user_id = get_jwt_identity()
+        db = current_app.db
+        sha256 = sha256.lower()
+        
+        is_thumbnail = db.courses.find_one({'thumbnail_sha256': sha256}, {'_id': 1}) is not None
+        if not is_thumbnail and not (user_id and can_view_image(db, sha256, user_id)):
+            return jsonify({'error': 'Image not found'}), 404
+        
+        key, is_variant = image_variant(db, sha256, variant)
+        if not key:
+            return jsonify({'error': 'Image not found'}), 404
+        
+        response = send_blob(key)
+        visibility = 'public' if is_thumbnail else 'private'
+        if is_variant:
+            response.headers['Cache-Control'] = f'{visibility}, max-age=31536000, immutable'
+        else:
+            # The original stands in until the variant is rendered
+            response.headers['Cache-Control'] = f'{visibility}, no-cache'
+        return response
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@job_handler('image_variants')
+def run_image_variants_job(db, job):
+    sha256 = job['payload']['sha256']
+    try:
+        render_variants(db, sha256)
+    except Exception:
+        release_render(db, sha256)
+        raise
+    return None
+
 @courses_bp.route('/<course_id>/materials', methods=['POST'])
 @jwt_required()
 def upload_material(course_id):
@@ -621,6 +1121,10 @@ def upload_material(course_id):
         result = db.materials.insert_one(material_data)
         material_data['_id'] = str(result.inserted_id)
         
+        # The Q&A retrieval index and the summary are built by the AI workers
+        queue_course_index(db, course_id)
+        queue_material_summaries(db, [material_data])
+        
         return jsonify({
             'message': 'Material uploaded successfully',
             'material': material_data
@@ -663,10 +1167,7 @@ def update_progress(course_id):
             )
             
             # Mark material as completed by this user
-            db.materials.update_one(
-                {'_id': ObjectId(material_id)},
-                {'$addToSet': {'completed_by': user_id}}
-            )
+            record_completion(db, material_id, user_id, course_id)
         
         # Calculate overall progress
         total_materials = db.materials.count_documents({'course_id': course_id, 'is_required': True})
@@ -183,6 +183,33 @@ def create_notification(db, user_id, title, message, notification_type='info', l
     result = db.notifications.insert_one(notification)
     return str(result.inserted_id)
 
+def create_notifications(db, notifications):
+    """
+    Create many notifications with a single write
+    
+    Args:
+        db: Database instance
+        notifications: List of dicts with user_id, title, message and optional
+            notification_type and link
+    """
+    if not notifications:
+        return 0
+    
+    now = datetime.utcnow()
+    documents = [{
+        'user_id': n['user_id'],
+        'title': n['title'],
+        'message': n['message'],
+        'type': n.get('notification_type', 'info'),
+        'link': n.get('link'),
+        'read': False,
+        'created_at': now,
+        'read_at': None
+    } for n in notifications]
+    
+    result = db.notifications.insert_many(documents, ordered=False)
+    return len(result.inserted_ids)
+
 @notifications_bp.route('/notifications/test', methods=['POST'])
 @jwt_required()
 def create_test_notifications():
@@ -2,6 +2,7 @@ from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from bson import ObjectId
 from datetime import datetime
+from utils.completions import record_completion
 
 progress_bp = Blueprint('progress', __name__)
 
@@ -151,6 +152,8 @@ def mark_material_complete(material_id):
                 {'$set': {'progress': progress}}
             )
         
+        record_completion(db, material_id, user_id, course_id)
+        
         return jsonify({'message': 'Material marked as complete'}), 200
         
     except Exception as e:
@@ -173,6 +176,15 @@ def update_watch_time(video_id):
         if not material:
             return jsonify({'error': 'Video not found'}), 404
         
+        # Prefer the duration probed at ingest over the one sent by the player
+        duration_seconds = material.get('duration_seconds')
+        if not duration_seconds and ObjectId.is_valid(video_id):
+            video = db.videos.find_one({'_id': ObjectId(video_id)}, {'durationSeconds': 1})
+            duration_seconds = video.get('durationSeconds') if video else None
+        if duration_seconds:
+            total_duration = duration_seconds
+            watch_time = min(watch_time, total_duration)
+        
         # Update or create watch progress
         watch_progress = {
             'student_id': user_id,
@@ -213,6 +225,8 @@ def update_watch_time(video_id):
                             }
                         }
                     )
+                
+                record_completion(db, material['_id'], user_id, material['course_id'])
         
         return jsonify({'message': 'Watch time updated'}), 200
         
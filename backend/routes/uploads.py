@@ -0,0 +1,261 @@
+from flask import Blueprint, request, jsonify, current_app, url_for
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from werkzeug.utils import secure_filename
+from bson import ObjectId
+from datetime import datetime
+import uuid
+from routes.videos import create_video_record, allowed_file
+from routes.courses import create_video_material, is_video_file
+from utils.media_store import ingest_media, release_blob
+from utils.ai_jobs import enqueue_job, job_handler, PRIORITY_NORMAL
+from utils.chunked_upload import (
+    create_session,
+    get_session,
+    write_chunk,
+    missing_chunks,
+    claim_session,
+    verify_upload,
+    release_session,
+    complete_session,
+    abort_session,
+    UploadError
+)
+
+uploads_bp = Blueprint('uploads', __name__)
+
+UPLOAD_TARGETS = ('video', 'course_video')
+
+
+def serialize_session(session):
+    body = {
+        'upload_id': str(session['_id']),
+        'filename': session['filename'],
+        'total_size': session['total_size'],
+        'chunk_size': session['chunk_size'],
+        'chunk_count': session['chunk_count'],
+        'received_chunks': sorted(int(i) for i in session.get('chunks', {})),
+        'missing_chunks': missing_chunks(session),
+        'status': session['status'],
+        'expires_at': session['expires_at'].isoformat()
+    }
+    if session.get('result'):
+        body['result'] = session['result']
+    if session.get('error'):
+        body['error'] = session['error']
+    return body
+
+
+@uploads_bp.route('/', methods=['POST'])
+@jwt_required()
+def create_upload():
+    """Start a resumable upload for a lecture video"""
+    try:
+        user_id = get_jwt_identity()
+        db = current_app.db
+        data = request.get_json() or {}
+
+        filename = secure_filename(data.get('filename', ''))
+        target = data.get('target', 'video')
+        if not filename:
+            return jsonify({'error': 'filename is required'}), 400
+        if target not in UPLOAD_TARGETS:
+            return jsonify({'error': f'target must be one of: {", ".join(UPLOAD_TARGETS)}'}), 400
+
+        user = db.users.find_one({'_id': ObjectId(user_id)}, {'role': 1})
+        if not user:
+            return jsonify({'error': 'User not found'}), 404
+
+        course_id = data.get('course_id') or data.get('courseId') or ''
+        if target == 'video':
+            if user.get('role') != 'teacher':
+                return jsonify({'error': 'Only teachers can upload videos'}), 403
+            if not allowed_file(filename):
+                return jsonify({'error': 'Invalid file type'}), 400
+        else:
+            if not is_video_file(filename):
+                return jsonify({'error': 'Invalid video file format'}), 400
+            if not data.get('title'):
+                return jsonify({'error': 'Video title is required'}), 400
+            course = db.courses.find_one({'_id': ObjectId(course_id)}, {'teacher_id': 1}) if course_id else None
+            if not course:
+                return jsonify({'error': 'Course not found'}), 404
+            if user['role'] != 'admin' and course['teacher_id'] != user_id:
+                return jsonify({'error': 'Access denied'}), 403
+
+        metadata = {
+            'title': data.get('title', ''),
+            'description': data.get('description', ''),
+            'course_id': course_id,
+            'order': data.get('order', 0),
+            'duration': data.get('duration', '')
+        }
+
+        session = create_session(
+            db, user_id, filename,
+            total_size=data.get('total_size'),
+            chunk_size=data.get('chunk_size'),
+            sha256=data.get('sha256'),
+            target=target,
+            metadata=metadata
+        )
+
+        return jsonify(serialize_session(session)), 201
+
+    except UploadError as e:
+        return jsonify({'error': e.message}), e.status_code
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@uploads_bp.route('/<upload_id>', methods=['GET'])
+@jwt_required()
+def get_upload(upload_id):
+    """Report which chunks have been received so a client can resume"""
+    try:
+        session = get_session(current_app.db, upload_id, get_jwt_identity())
+        return jsonify(serialize_session(session)), 200
+
+    except UploadError as e:
+        return jsonify({'error': e.message}), e.status_code
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@uploads_bp.route('/<upload_id>/chunks/<int:index>', methods=['PUT'])
+@jwt_required()
+def upload_chunk(upload_id, index):
+    """Receive one chunk as the raw request body"""
+    try:
+        db = current_app.db
+        session = get_session(db, upload_id, get_jwt_identity())
+
+        chunk = write_chunk(
+            db, session, index,
+            request.stream,
+            request.content_length,
+            request.headers.get('X-Chunk-Sha256')
+        )
+
+        return jsonify(chunk), 200
+
+    except UploadError as e:
+        return jsonify({'error': e.message}), e.status_code
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@uploads_bp.route('/<upload_id>/complete', methods=['POST'])
+@jwt_required()
+def complete_upload(upload_id):
+    """
+    Finalize the upload. The file is verified and the video record created by
+    the job queue (ai_worker.py); poll GET /api/uploads/<id> until `status` is
+    `completed` (`result` holds the video) or `failed`.
+    """
+    try:
+        user_id = get_jwt_identity()
+        db = current_app.db
+        session = get_session(db, upload_id, user_id)
+
+        # Retried finalize after success returns the original result
+        if session['status'] == 'completed':
+            return jsonify(session['result']), 200
+        if session['status'] == 'finalizing':
+            return finalizing_response(session)
+        if session['status'] == 'failed':
+            return jsonify({'error': f"Upload failed: {session.get('error')}. Please upload the file again"}), 409
+
+        if session['target'] == 'course_video':
+            course = db.courses.find_one({'_id': ObjectId(session['metadata']['course_id'])}, {'_id': 1})
+            if not course:
+                return jsonify({'error': 'Course not found'}), 404
+
+        claim_session(db, session)
+        try:
+            enqueue_job(db, 'finalize_upload', {'upload_id': str(session['_id'])}, priority=PRIORITY_NORMAL)
+        except Exception as e:
+            release_session(db, session, str(e))
+            raise
+
+        session['status'] = 'finalizing'
+        return finalizing_response(session)
+
+    except UploadError as e:
+        return jsonify({'error': e.message}), e.status_code
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+def finalizing_response(session):
+    body = serialize_session(session)
+    body['status_url'] = url_for('uploads.get_upload', upload_id=str(session['_id']))
+    return jsonify(body), 202
+
+
+def finish_upload(db, session):
+    """Move a claimed upload into the media store and create its video record"""
+    metadata = session['metadata']
+    user_id = session['user_id']
+    extension = session['filename'].rsplit('.', 1)[1].lower()
+
+    path, size, sha256 = verify_upload(session)
+    blob = ingest_media(db, path, extension, sha256, size)
+    try:
+        if session['target'] == 'video':
+            unique_filename = f"{uuid.uuid4()}.{extension}"
+            result = create_video_record(
+                db, user_id, blob, unique_filename, session['filename'],
+                metadata.get('title', ''), metadata.get('description', ''), metadata.get('course_id', '')
+            )
+        else:
+            course = db.courses.find_one({'_id': ObjectId(metadata['course_id'])})
+            if not course:
+                raise UploadError('Course not found', 404)
+            timestamp = datetime.utcnow().strftime('%Y%m%d_%H%M%S')
+            unique_filename = f"{metadata['course_id']}_{timestamp}_{session['filename']}"
+            video_data = create_video_material(
+                db, course, user_id, blob, unique_filename, metadata['title'],
+                metadata.get('description', ''), metadata.get('order', 0), metadata.get('duration', '')
+            )
+            result = {'message': 'Video uploaded successfully', 'video': video_data}
+    except Exception:
+        # Nothing points at the blob; drop the reference ingest took
+        release_blob(db, blob['_id'])
+        raise
+
+    complete_session(db, session, result)
+    return result
+
+
+@job_handler('finalize_upload')
+def run_finalize_upload_job(db, job):
+    session = db.upload_sessions.find_one({'_id': ObjectId(job['payload']['upload_id'])})
+    if not session or session['status'] != 'finalizing':
+        return None
+    try:
+        return finish_upload(db, session)
+    except Exception as e:
+        release_session(db, session, getattr(e, 'message', str(e)))
+        raise
+
+
+@uploads_bp.route('/<upload_id>', methods=['DELETE'])
+@jwt_required()
+def cancel_upload(upload_id):
+    """Abort an upload and discard received chunks"""
+    try:
+        db = current_app.db
+        session = get_session(db, upload_id, get_jwt_identity())
+        if session['status'] == 'completed':
+            return jsonify({'error': 'Upload already completed'}), 409
+        if session['status'] == 'finalizing':
+            return jsonify({'error': 'Upload is being finalized'}), 409
+
+        if not abort_session(db, session):
+            return jsonify({'error': 'Upload is being finalized'}), 409
+        return jsonify({'message': 'Upload cancelled'}), 200
+
+    except UploadError as e:
+        return jsonify({'error': e.message}), e.status_code
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
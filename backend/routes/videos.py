@@ -1,21 +1,19 @@
-from flask import Blueprint, request, jsonify, current_app, send_from_directory
+from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from werkzeug.utils import secure_filename
 from bson import ObjectId
 from datetime import datetime
 import os
 import uuid
+from utils.media_delivery import send_media, send_blob
+from utils.media_store import save_upload, ingest_media, release_blob
 
 videos_bp = Blueprint('videos', __name__)
 
 # Configuration
-UPLOAD_FOLDER = 'uploads/videos'
 ALLOWED_EXTENSIONS = {'mp4', 'avi', 'mov', 'wmv', 'flv', 'mkv', 'webm'}
 MAX_FILE_SIZE = 100 * 1024 * 1024  # 100MB
 
-# Ensure upload directory exists
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
@@ -38,6 +36,52 @@ def require_teacher(f):
     decorated_function.__name__ = f.__name__
     return decorated_function
 
+def create_video_record(db, user_id, blob, unique_filename, original_filename, title='', description='', course_id=''):
+    """Create the video document for a stored blob and attach it to its course"""
+    video_doc = {
+        'filename': unique_filename,
+        'originalFilename': secure_filename(original_filename),
+        'title': title or secure_filename(original_filename),
+        'description': description,
+        'filePath': blob['path'],
+        'storageKey': blob['key'],
+        'fileSize': blob['size'],
+        'blobSha256': blob['_id'],
+        'durationSeconds': blob.get('media_info', {}).get('duration_seconds'),
+        'bitrate': blob.get('media_info', {}).get('bitrate'),
+        'uploadedBy': ObjectId(user_id),
+        'courseId': ObjectId(course_id) if course_id else None,
+        'uploadedAt': datetime.utcnow(),
+        'views': 0,
+        'status': 'active'
+    }
+    
+    result = db.videos.insert_one(video_doc)
+    video_id = str(result.inserted_id)
+    
+    # Update course if courseId provided
+    if course_id:
+        db.courses.update_one(
+            {'_id': ObjectId(course_id)},
+            {
+                '$push': {
+                    'videos': {
+                        'videoId': ObjectId(video_id),
+                        'title': video_doc['title'],
+                        'addedAt': datetime.utcnow()
+                    }
+                }
+            }
+        )
+    
+    return {
+        'message': 'Video uploaded successfully',
+        'videoId': video_id,
+        'videoUrl': f'/api/videos/stream/{video_id}',
+        'filename': unique_filename,
+        'title': video_doc['title']
+    }
+
 @videos_bp.route('/upload', methods=['POST'])
 @require_teacher
 def upload_video():
@@ -46,6 +90,10 @@ def upload_video():
         user_id = get_jwt_identity()
         db = current_app.db
         
+        # Enforce the upload size limit before reading the body
+        if request.content_length and request.content_length > MAX_FILE_SIZE:
+            return jsonify({'error': f'File too large. Maximum size is {MAX_FILE_SIZE // (1024 * 1024)}MB. Use the chunked upload API for larger videos.'}), 413
+        
         # Check if file is in request
         if 'video' not in request.files:
             return jsonify({'error': 'No video file provided'}), 400
@@ -67,54 +115,19 @@ def upload_video():
         # Generate unique filename
         file_extension = file.filename.rsplit('.', 1)[1].lower()
         unique_filename = f"{uuid.uuid4()}.{file_extension}"
-        file_path = os.path.join(UPLOAD_FOLDER, unique_filename)
-        
-        # Save file
-        file.save(file_path)
-        
-        # Get file size
-        file_size = os.path.getsize(file_path)
-        
-        # Create video document in database
-        video_doc = {
-            'filename': unique_filename,
-            'originalFilename': secure_filename(file.filename),
-            'title': title or secure_filename(file.filename),
-            'description': description,
-            'filePath': file_path,
-            'fileSize': file_size,
-            'uploadedBy': ObjectId(user_id),
-            'courseId': ObjectId(course_id) if course_id else None,
-            'uploadedAt': datetime.utcnow(),
-            'views': 0,
-            'status': 'active'
-        }
-        
-        result = db.videos.insert_one(video_doc)
-        video_id = str(result.inserted_id)
-        
-        # Update course if courseId provided
-        if course_id:
-            db.courses.update_one(
-                {'_id': ObjectId(course_id)},
-                {
-                    '$push': {
-                        'videos': {
-                            'videoId': ObjectId(video_id),
-                            'title': video_doc['title'],
-                            'addedAt': datetime.utcnow()
-                        }
-                    }
-                }
-            )
         
-        return jsonify({
-            'message': 'Video uploaded successfully',
-            'videoId': video_id,
-            'videoUrl': f'/api/videos/stream/{video_id}',
-            'filename': unique_filename,
-            'title': video_doc['title']
-        }), 201
+        # Save file into the content-addressed store
+        temp_path, file_size, sha256 = save_upload(file, max_size=MAX_FILE_SIZE)
+        
+        if file_size > MAX_FILE_SIZE:
+            os.remove(temp_path)
+            return jsonify({'error': f'File too large. Maximum size is {MAX_FILE_SIZE // (1024 * 1024)}MB'}), 413
+        
+        blob = ingest_media(db, temp_path, file_extension, sha256, file_size)
+        
+        return jsonify(create_video_record(
+            db, user_id, blob, unique_filename, file.filename, title, description, course_id
+        )), 201
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -137,11 +150,14 @@ def stream_video(video_id):
             {'$inc': {'views': 1}}
         )
         
-        # Get the directory and filename
+        if video.get('storageKey'):
+            return send_blob(video['storageKey'])
+        
+        # Legacy videos saved before the blob store
         directory = os.path.dirname(video['filePath'])
-        filename = video['filename']
+        filename = os.path.basename(video['filePath'])
         
-        return send_from_directory(directory, filename, as_attachment=False)
+        return send_media(directory, filename)
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -258,13 +274,15 @@ def delete_video(video_id):
         if str(video['uploadedBy']) != user_id:
             return jsonify({'error': 'You can only delete your own videos'}), 403
         
-        # Delete file from filesystem
-        if os.path.exists(video['filePath']):
-            os.remove(video['filePath'])
-        
         # Delete from database
         db.videos.delete_one({'_id': ObjectId(video_id)})
         
+        # Release the stored blob; legacy uploads own their file outright
+        if video.get('blobSha256'):
+            release_blob(db, video['blobSha256'])
+        elif os.path.exists(video['filePath']):
+            os.remove(video['filePath'])
+        
         # Remove from courses
         db.courses.update_many(
             {},
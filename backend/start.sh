@@ -0,0 +1,17 @@
+#!/bin/bash
+
+# Start the web server with the job worker next to it (render.yaml start command)
+#
+# The worker finalizes chunked uploads from the .part files the web workers
+# write and reads local media blobs, so both must run on the same disk.
+
+# Restart the worker if it exits; gunicorn keeps serving meanwhile
+(
+    while true; do
+        python ai_worker.py
+        echo "AI worker exited with status $?, restarting in 5s"
+        sleep 5
+    done
+) &
+
+exec gunicorn app:app
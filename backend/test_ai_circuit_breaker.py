@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Circuit breaker check for the AI assistant.
+
+Starts a local stand-in for the Gemini REST API that can inject latency and
+errors, points the shared Gemini client at it and checks that
+
+- healthy calls go through,
+- repeated errors or timeouts open the circuit,
+- while open, the chat helpers answer with their fallback text at once and
+  the upstream sees no traffic apart from the background probe,
+- the probe closes the circuit once the upstream recovers.
+
+Run: python test_ai_circuit_breaker.py
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+UPSTREAM = {'status': 200, 'delay': 0.0, 'requests': 0}
+
+
+class FakeGeminiHandler(BaseHTTPRequestHandler):
+    """Answers generateContent like the Gemini REST API, with injected faults"""
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        UPSTREAM['requests'] += 1
+        time.sleep(UPSTREAM['delay'])
+
+        if UPSTREAM['status'] == 200:
+            body = {'candidates': [{
+                'content': {'parts': [{'text': 'Answer from the fake upstream'}], 'role': 'model'},
+                'finishReason': 'STOP',
+                'index': 0
+            }]}
+        else:
+            body = {'error': {'code': UPSTREAM['status'], 'message': 'injected failure', 'status': 'INTERNAL'}}
+
+        payload = json.dumps(body).encode()
+        self.send_response(UPSTREAM['status'])
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+upstream = ThreadingHTTPServer(('127.0.0.1', 0), FakeGeminiHandler)
+threading.Thread(target=upstream.serve_forever, daemon=True).start()
+
+# The client reads its configuration at import time
+os.environ.update({
+    'GEMINI_API_KEY': 'test-key',
+    'GEMINI_API_ENDPOINT': f'http://127.0.0.1:{upstream.server_port}',
+    'AI_TIMEOUT_SECONDS': '1',
+    'AI_MAX_RETRIES': '0',
+    'AI_BREAKER_FAILURES': '3',
+    'AI_BREAKER_RESET_SECONDS': '1'
+})
+
+from flask import Flask
+
+from routes.ai import generate_ai_response
+from utils import ai_client
+
+
+def print_section(title):
+    print(f"\n{'='*50}")
+    print(f" {title}")
+    print(f"{'='*50}")
+
+
+def timed_chat(app):
+    """Call the general chat helper (never cached) and time it"""
+    with app.app_context():
+        started = time.perf_counter()
+        response = generate_ai_response('What is recursion?', 'Role: student')
+        return response, time.perf_counter() - started
+
+
+def breaker_state():
+    return ai_client.model_breaker().snapshot()['state']
+
+
+def wait_for_state(state, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if breaker_state() == state:
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def check(condition, message):
+    print(f"{'✅' if condition else '❌'} {message}")
+    return condition
+
+
+def run_outage(app, label, status, delay):
+    print_section(f"Outage: {label}")
+    UPSTREAM.update(status=status, delay=delay)
+
+    ok = True
+    for i in range(3):
+        response, elapsed = timed_chat(app)
+        print(f"  failing call {i + 1}: {elapsed:.2f}s")
+    ok &= check(breaker_state() == 'open', 'circuit opened after 3 failures')
+
+    before = UPSTREAM['requests']
+    timings = [timed_chat(app) for _ in range(20)]
+    slowest = max(elapsed for _, elapsed in timings)
+    ok &= check(all('Contact your administrator' in r for r, _ in timings),
+                'open circuit serves the fallback response')
+    ok &= check(slowest < 0.05, f'fallback served immediately (slowest {slowest * 1000:.1f} ms)')
+    ok &= check(UPSTREAM['requests'] - before <= 1, 'no upstream calls while open (besides the probe)')
+
+    print_section(f"Recovery after {label}")
+    UPSTREAM.update(status=200, delay=0.0)
+    ok &= check(wait_for_state('closed'), 'background probe closed the circuit')
+    response, elapsed = timed_chat(app)
+    ok &= check(response == 'Answer from the fake upstream', f'calls reach the model again ({elapsed:.2f}s)')
+    return ok
+
+
+def main():
+    app = Flask(__name__)
+    app.db = None  # the general chat is never cached
+
+    try:
+        print_section("Healthy upstream")
+        response, elapsed = timed_chat(app)
+        ok = check(response == 'Answer from the fake upstream', f'model answered in {elapsed:.2f}s')
+        ok &= check(breaker_state() == 'closed', 'circuit is closed')
+
+        ok &= run_outage(app, 'HTTP 500 errors', 500, 0.0)
+        ok &= run_outage(app, 'slow upstream', 200, 3.0)
+
+        print_section("Client metrics")
+        print(json.dumps(ai_client.latency_stats(), indent=2))
+        return 0 if ok else 1
+    finally:
+        upstream.shutdown()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
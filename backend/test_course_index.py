@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+Course material index check for grounded Q&A.
+
+Uploads a PDF handout through POST /api/courses/<id>/upload-document, runs
+the queued AI jobs the way ai_worker.py does and checks that
+
+- the upload queues a course_index job and the search waits for it,
+- the index holds the text extracted from the PDF, not just its title,
+- Q&A excerpts for the course quote the PDF,
+- the uploaded file can be downloaded by the teacher but not by others.
+
+Needs a MongoDB server (MONGO_URI); uses and then drops its own database.
+
+Run: python test_course_index.py
+"""
+
+import io
+import os
+import shutil
+import sys
+import tempfile
+from datetime import timedelta
+
+# Storage locations are read at import time
+WORK_DIR = tempfile.mkdtemp(prefix='edunexa-index-')
+os.environ['MEDIA_ROOT'] = os.path.join(WORK_DIR, 'media')
+os.environ['STORAGE_BACKEND'] = 'local'
+
+from flask import Flask
+from flask_jwt_extended import JWTManager, create_access_token
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+
+from routes.ai import ai_bp, course_material_context
+from routes.courses import courses_bp
+from utils.ai_jobs import claim_job, run_job
+from utils.course_index import search_course
+
+TEST_DATABASE = 'edunexa_lms_test_course_index'
+
+HANDOUT_PAGES = [
+    'Hash tables store key value pairs in an array of buckets.',
+    'Collisions are resolved by separate chaining or by open addressing with linear probing.',
+    'The load factor is the number of entries divided by the number of buckets.'
+]
+
+
+def make_pdf(pages):
+    """Bytes of a minimal PDF with one line of Helvetica text per page"""
+    count = len(pages)
+    kids = ' '.join(f'{3 + 2 * i} 0 R' for i in range(count))
+    objects = [
+        '<< /Type /Catalog /Pages 2 0 R >>',
+        f'<< /Type /Pages /Kids [{kids}] /Count {count} >>'
+    ]
+    font_id = 3 + 2 * count
+    for i, text in enumerate(pages):
+        stream = f'BT /F1 12 Tf 72 720 Td ({text}) Tj ET'
+        objects.append(f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents {4 + 2 * i} 0 R '
+                       f'/Resources << /Font << /F1 {font_id} 0 R >> >> >>')
+        objects.append(f'<< /Length {len(stream)} >>\nstream\n{stream}\nendstream')
+    objects.append('<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>')
+
+    data, offsets = b'%PDF-1.4\n', []
+    for i, body in enumerate(objects):
+        offsets.append(len(data))
+        data += f'{i + 1} 0 obj\n{body}\nendobj\n'.encode()
+    xref = len(data)
+    data += f'xref\n0 {len(objects) + 1}\n0000000000 65535 f \n'.encode()
+    for offset in offsets:
+        data += f'{offset:010d} 00000 n \n'.encode()
+    data += f'trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n'.encode()
+    return data
+
+
+def print_section(title):
+    print(f"\n{'='*50}")
+    print(f" {title}")
+    print(f"{'='*50}")
+
+
+def check(condition, message):
+    print(f"{'✅' if condition else '❌'} {message}")
+    return condition
+
+
+def make_app(db):
+    app = Flask(__name__)
+    app.config['JWT_SECRET_KEY'] = 'test-secret'
+    app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(minutes=10)
+    JWTManager(app)
+    app.db = db
+    app.register_blueprint(courses_bp, url_prefix='/api/courses')
+    app.register_blueprint(ai_bp, url_prefix='/api/ai')
+    return app
+
+
+def auth_headers(app, user_id):
+    with app.app_context():
+        return {'Authorization': f'Bearer {create_access_token(identity=user_id)}'}
+
+
+def run_queued_jobs(app):
+    """Run every queued AI job, like one ai_worker.py thread"""
+    ran = []
+    while True:
+        job = claim_job(app.db, 'test-worker')
+        if not job:
+            return ran
+        with app.app_context():
+            run_job(app.db, job)
+        ran.append(job['kind'])
+
+
+def main():
+    client = MongoClient(os.getenv('MONGO_URI', 'mongodb://localhost:27017/'), serverSelectionTimeoutMS=3000)
+    try:
+        client.admin.command('ping')
+    except PyMongoError as e:
+        print(f"❌ MongoDB is not reachable: {e}")
+        return 1
+
+    db = client[TEST_DATABASE]
+    app = make_app(db)
+    http = app.test_client()
+
+    try:
+        teacher_id = str(db.users.insert_one({'name': 'Teacher', 'role': 'teacher'}).inserted_id)
+        other_id = str(db.users.insert_one({'name': 'Other Teacher', 'role': 'teacher'}).inserted_id)
+        course_id = str(db.courses.insert_one({
+            'title': 'Data Structures', 'teacher_id': teacher_id, 'is_public': False, 'is_active': True
+        }).inserted_id)
+
+        print_section("Upload a PDF handout")
+        pdf = make_pdf(HANDOUT_PAGES)
+        response = http.post(
+            f'/api/courses/{course_id}/upload-document',
+            data={'title': 'Week 3 handout', 'file': (io.BytesIO(b'not a pdf'), 'week3.pdf')},
+            headers=auth_headers(app, teacher_id),
+            content_type='multipart/form-data'
+        )
+        ok = check(response.status_code == 400, f'non-PDF content rejected ({response.status_code})')
+
+        response = http.post(
+            f'/api/courses/{course_id}/upload-document',
+            data={'title': 'Week 3 handout', 'file': (io.BytesIO(pdf), 'week3.pdf')},
+            headers=auth_headers(app, teacher_id),
+            content_type='multipart/form-data'
+        )
+        ok &= check(response.status_code == 201, f'document uploaded ({response.status_code})')
+        material = response.get_json()['material']
+        ok &= check(material['storage_key'].endswith('.pdf'), 'stored as a PDF blob')
+
+        print_section("Index built by the AI worker")
+        ok &= check(search_course(db, course_id, 'collisions chaining') == [],
+                    'no results before the index job ran')
+        ran = run_queued_jobs(app)
+        ok &= check('course_index' in ran, f'queued jobs ran: {", ".join(ran)}')
+
+        results = search_course(db, course_id, 'How are collisions resolved?')
+        ok &= check(bool(results) and results[0]['material_id'] == material['_id'],
+                    'the handout is the best match')
+        ok &= check(bool(results) and 'linear probing' in results[0]['text'],
+                    'the passage holds text extracted from the PDF')
+
+        context = course_material_context(db, course_id, 'What is the load factor?')
+        ok &= check('(Week 3 handout)' in context and 'number of buckets' in context,
+                    'Q&A excerpts quote the handout')
+
+        print_section("File download")
+        url = material['url']
+        response = http.get(url, headers=auth_headers(app, teacher_id))
+        ok &= check(response.status_code == 200 and response.get_data() == pdf, 'teacher downloads the PDF')
+        response = http.get(url, headers=auth_headers(app, other_id))
+        ok &= check(response.status_code == 404, f'other teacher gets 404 ({response.status_code})')
+
+        return 0 if ok else 1
+    finally:
+        client.drop_database(TEST_DATABASE)
+        client.close()
+        shutil.rmtree(WORK_DIR, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
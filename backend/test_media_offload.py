@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Throughput comparison for media delivery modes.
+
+Starts a single-threaded Flask backend (one sync worker, like a gunicorn
+worker) behind a small local stand-in for nginx, then downloads the same
+video concurrently through the proxy with MEDIA_DELIVERY_MODE=direct and
+MEDIA_DELIVERY_MODE=x-accel.
+
+Run: python test_media_offload.py [--size-mb 32] [--clients 8]
+"""
+
+import argparse
+import http.client
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote
+
+# MEDIA_ROOT must be set before utils.media_delivery is imported
+MEDIA_DIR = tempfile.mkdtemp(prefix='edunexa-media-')
+os.environ['MEDIA_ROOT'] = MEDIA_DIR
+os.environ['MEDIA_INTERNAL_PREFIX'] = '/protected-media/'
+
+from flask import Flask
+from werkzeug.serving import WSGIRequestHandler, make_server
+
+from utils.media_delivery import send_media, MEDIA_INTERNAL_PREFIX
+
+VIDEO_NAME = 'lecture.mp4'
+
+
+def print_section(title):
+    print(f"\n{'='*50}")
+    print(f" {title}")
+    print(f"{'='*50}")
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+def create_backend():
+    """Minimal app exposing the same send_media call the video routes use"""
+    app = Flask(__name__)
+
+    @app.route('/media/<filename>')
+    def media(filename):
+        return send_media(os.path.join(MEDIA_DIR, 'videos'), filename)
+
+    return app
+
+
+def create_proxy(backend_port):
+    """Threaded stand-in for nginx that honours X-Accel-Redirect with sendfile"""
+
+    class ProxyHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            upstream = http.client.HTTPConnection('127.0.0.1', backend_port)
+            upstream.request('GET', self.path)
+            response = upstream.getresponse()
+            accel = response.getheader('X-Accel-Redirect')
+
+            if accel and accel.startswith(MEDIA_INTERNAL_PREFIX):
+                response.read()
+                upstream.close()
+                path = os.path.join(MEDIA_DIR, unquote(accel[len(MEDIA_INTERNAL_PREFIX):]))
+                size = os.path.getsize(path)
+                self.send_response(200)
+                self.send_header('Content-Type', response.getheader('Content-Type'))
+                self.send_header('Content-Length', str(size))
+                self.end_headers()
+                with open(path, 'rb') as f:
+                    self.connection.sendfile(f)
+                return
+
+            self.send_response(response.status)
+            self.send_header('Content-Type', response.getheader('Content-Type', 'application/octet-stream'))
+            self.send_header('Content-Length', response.getheader('Content-Length', '0'))
+            self.end_headers()
+            while True:
+                chunk = response.read(256 * 1024)
+                if not chunk:
+                    break
+                self.wfile.write(chunk)
+            upstream.close()
+
+    return ThreadingHTTPServer(('127.0.0.1', 0), ProxyHandler)
+
+
+def download(port, expected_size, results):
+    conn = http.client.HTTPConnection('127.0.0.1', port)
+    conn.request('GET', f'/media/{VIDEO_NAME}')
+    response = conn.getresponse()
+    received = 0
+    while True:
+        chunk = response.read(256 * 1024)
+        if not chunk:
+            break
+        received += len(chunk)
+    conn.close()
+    results.append(received == expected_size and response.status == 200)
+
+
+def run_mode(mode, proxy_port, clients, file_size):
+    os.environ['MEDIA_DELIVERY_MODE'] = mode
+    results = []
+    threads = [threading.Thread(target=download, args=(proxy_port, file_size, results)) for _ in range(clients)]
+
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    total_mb = file_size * clients / (1024 * 1024)
+    print(f"{mode:>8}: {clients} clients, {total_mb:.0f} MB in {elapsed:.2f}s "
+          f"-> {total_mb / elapsed:.1f} MB/s ({results.count(True)}/{clients} complete)")
+    return elapsed, all(results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size-mb', type=int, default=32)
+    parser.add_argument('--clients', type=int, default=8)
+    args = parser.parse_args()
+
+    os.makedirs(os.path.join(MEDIA_DIR, 'videos'))
+    file_size = args.size_mb * 1024 * 1024
+    with open(os.path.join(MEDIA_DIR, 'videos', VIDEO_NAME), 'wb') as f:
+        f.write(os.urandom(file_size))
+
+    # threaded=False: one request at a time, like a single sync worker
+    backend = make_server('127.0.0.1', 0, create_backend(), threaded=False,
+                          request_handler=QuietRequestHandler)
+    proxy = create_proxy(backend.server_port)
+    for server in (backend, proxy):
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    try:
+        print_section("Media Delivery Throughput")
+        direct_time, direct_ok = run_mode('direct', proxy.server_port, args.clients, file_size)
+        accel_time, accel_ok = run_mode('x-accel', proxy.server_port, args.clients, file_size)
+
+        print(f"\nSpeed-up with offload: {direct_time / accel_time:.1f}x")
+        if not (direct_ok and accel_ok):
+            print("❌ Some downloads were incomplete")
+            return 1
+        print("✅ Both delivery modes returned complete files")
+        return 0
+    finally:
+        backend.shutdown()
+        proxy.shutdown()
+        shutil.rmtree(MEDIA_DIR, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
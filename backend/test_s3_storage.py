@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+S3 storage backend check.
+
+Stores files through S3Storage and reads them back the way send_blob does:
+
+- a file larger than the multipart part size is uploaded in parallel parts
+  and downloads byte for byte,
+- a small file goes up with a single PUT,
+- read_range returns exactly the requested bytes, including ranges that
+  cross a part boundary,
+- send_blob answers Range requests with 206 and the matching Content-Range,
+  and unsatisfiable ranges with 416.
+
+Runs against moto's in-process S3 (pip install moto) by default, or against
+a real endpoint such as MinIO when S3_ENDPOINT_URL is set (the bucket named
+by S3_BUCKET, default edunexa-test, is created if missing).
+
+Run: python test_s3_storage.py
+"""
+
+import contextlib
+import hashlib
+import os
+import shutil
+import sys
+import tempfile
+
+# MEDIA_ROOT must be set before utils.storage is imported
+WORK_DIR = tempfile.mkdtemp(prefix='edunexa-s3-')
+os.environ['MEDIA_ROOT'] = os.path.join(WORK_DIR, 'media')
+
+from flask import Flask
+
+from utils import storage as storage_module
+from utils.media_delivery import send_blob
+from utils.storage import S3Storage, S3_MIN_PART_SIZE
+
+BUCKET = os.getenv('S3_BUCKET', 'edunexa-test')
+PART_SIZE = S3_MIN_PART_SIZE
+LARGE_SIZE = PART_SIZE * 2 + 123457
+SMALL_SIZE = 4096
+
+
+def print_section(title):
+    print(f"\n{'='*50}")
+    print(f" {title}")
+    print(f"{'='*50}")
+
+
+def check(condition, message):
+    print(f"{'✅' if condition else '❌'} {message}")
+    return condition
+
+
+def s3_backend():
+    """Context for the S3 stand-in: moto unless a real endpoint is configured"""
+    if os.getenv('S3_ENDPOINT_URL'):
+        return contextlib.nullcontext()
+    try:
+        from moto import mock_aws
+    except ImportError:
+        print("❌ Set S3_ENDPOINT_URL (e.g. MinIO) or install moto")
+        sys.exit(1)
+    os.environ.setdefault('AWS_ACCESS_KEY_ID', 'testing')
+    os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'testing')
+    return mock_aws()
+
+
+def write_file(name, size):
+    """Random file of `size` bytes; returns (path, bytes)"""
+    data = os.urandom(size)
+    path = os.path.join(WORK_DIR, name)
+    with open(path, 'wb') as f:
+        f.write(data)
+    return path, data
+
+
+def read_range(storage, key, start, end):
+    return b''.join(storage.read_range(key, start, end).iter_chunks(64 * 1024))
+
+
+def make_app():
+    app = Flask(__name__)
+
+    @app.route('/blob/<path:key>')
+    def blob(key):
+        return send_blob(key)
+
+    return app
+
+
+def main():
+    with s3_backend():
+        storage = S3Storage(
+            bucket=BUCKET,
+            endpoint_url=os.getenv('S3_ENDPOINT_URL'),
+            region=os.getenv('S3_REGION', 'us-east-1'),
+            prefix='test',
+            part_size=PART_SIZE,
+            concurrency=3
+        )
+        existing = [b['Name'] for b in storage.client.list_buckets().get('Buckets', [])]
+        if BUCKET not in existing:
+            storage.client.create_bucket(Bucket=BUCKET)
+
+        print_section("Multipart upload")
+        path, data = write_file('large.bin', LARGE_SIZE)
+        key = 'blobs/aa/bb/large.bin'
+        storage.put_file(key, path, 'application/octet-stream')
+        ok = check(not os.path.exists(path), 'local file removed after upload')
+        ok &= check(storage.exists(key), 'object exists')
+        ok &= check(storage.size(key) == LARGE_SIZE, f'size is {LARGE_SIZE} bytes ({storage.size(key)})')
+        etag = storage.client.head_object(Bucket=BUCKET, Key='test/' + key)['ETag']
+        ok &= check(etag.strip('"').endswith('-3'), f'uploaded in 3 parts (ETag {etag})')
+
+        downloaded = os.path.join(WORK_DIR, 'large.download')
+        storage.download_file(key, downloaded)
+        with open(downloaded, 'rb') as f:
+            ok &= check(hashlib.sha256(f.read()).digest() == hashlib.sha256(data).digest(),
+                        'download matches the original')
+
+        print_section("Single PUT")
+        path, small = write_file('small.bin', SMALL_SIZE)
+        small_key = 'blobs/cc/dd/small.bin'
+        storage.put_file(small_key, path)
+        ok &= check(read_range(storage, small_key, 0, SMALL_SIZE - 1) == small, 'small file round-trips')
+
+        print_section("Range reads")
+        ranges = [
+            (0, 0),
+            (0, 1023),
+            (PART_SIZE - 10, PART_SIZE + 9),          # across the first part boundary
+            (2 * PART_SIZE - 1, 2 * PART_SIZE),
+            (LARGE_SIZE - 100, LARGE_SIZE - 1)        # last bytes
+        ]
+        for start, end in ranges:
+            ok &= check(read_range(storage, key, start, end) == data[start:end + 1],
+                        f'bytes {start}-{end} match')
+
+        print_section("send_blob")
+        storage_module._storage = storage
+        http = make_app().test_client()
+
+        response = http.get(f'/blob/{key}', headers={'Range': f'bytes={PART_SIZE - 5}-{PART_SIZE + 4}'})
+        ok &= check(response.status_code == 206, f'range request answered with 206 ({response.status_code})')
+        ok &= check(response.headers.get('Content-Range') == f'bytes {PART_SIZE - 5}-{PART_SIZE + 4}/{LARGE_SIZE}',
+                    f'Content-Range {response.headers.get("Content-Range")}')
+        ok &= check(response.get_data() == data[PART_SIZE - 5:PART_SIZE + 5], 'range body matches')
+
+        response = http.get(f'/blob/{key}', headers={'Range': 'bytes=-50'})
+        ok &= check(response.status_code == 206 and response.get_data() == data[-50:], 'suffix range matches')
+
+        response = http.get(f'/blob/{key}', headers={'Range': f'bytes={LARGE_SIZE}-'})
+        ok &= check(response.status_code == 416, f'range past the end answered with 416 ({response.status_code})')
+
+        response = http.get(f'/blob/{small_key}')
+        ok &= check(response.status_code == 200 and response.get_data() == small, 'full GET without Range')
+
+        for cleanup_key in (key, small_key):
+            storage.delete(cleanup_key)
+        ok &= check(not storage.exists(key), 'objects deleted')
+
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    try:
+        sys.exit(main())
+    finally:
+        shutil.rmtree(WORK_DIR, ignore_errors=True)
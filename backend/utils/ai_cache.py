@@ -0,0 +1,171 @@
+"""
+Response cache for Gemini calls.
+
+Two tiers: a per-process LRU answers repeated questions without leaving the
+worker, and the ``ai_response_cache`` collection (with a TTL index on
+``expires_at``) shares answers between workers and survives restarts. Entries
+are keyed by a hash of (chat type, normalized prompt, context), so only
+callers that pass a context shared by many users - e.g. the course rather
+than the student - get hits across users.
+
+Each chat type has a policy; types whose answers are personalized (the
+general chat uses the student's name and courses) are not cached. Only
+successful model responses are stored - fallbacks raise past the cache.
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+from collections import OrderedDict, defaultdict
+from datetime import datetime, timedelta
+
+from pymongo.errors import PyMongoError
+
+AI_CACHE_ENABLED = os.getenv('AI_CACHE_ENABLED', 'true').lower() == 'true'
+LRU_SIZE = int(os.getenv('AI_CACHE_LRU_SIZE', 1000))
+
+# TTL per chat type; None means never cached
+CACHE_POLICIES = {
+    'explain': timedelta(days=7),
+    'qa': timedelta(days=1),
+    'summarize': timedelta(days=30),
+    'summary': timedelta(days=30),
+    'summary_section': timedelta(days=30),
+    'general': None
+}
+
+_lock = threading.Lock()
+_lru = OrderedDict()
+_stats = defaultdict(lambda: {'lru_hits': 0, 'db_hits': 0, 'misses': 0})
+
+
+def normalize_prompt(text):
+    """Case-fold, collapse whitespace and drop trailing punctuation"""
+    return re.sub(r'\s+', ' ', text or '').strip().rstrip('?!.').strip().casefold()
+
+
+def cache_key(chat_type, prompt, context=''):
+    payload = json.dumps([chat_type, normalize_prompt(prompt), context or ''])
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def cache_ttl(chat_type):
+    if not AI_CACHE_ENABLED:
+        return None
+    return CACHE_POLICIES.get(chat_type)
+
+
+def _record(chat_type, outcome):
+    with _lock:
+        _stats[chat_type][outcome] += 1
+
+
+def _lru_get(key):
+    with _lock:
+        entry = _lru.get(key)
+        if entry is None:
+            return None
+        response, expires_at = entry
+        if expires_at <= datetime.utcnow():
+            del _lru[key]
+            return None
+        _lru.move_to_end(key)
+        return response
+
+
+def _lru_put(key, response, expires_at):
+    with _lock:
+        _lru[key] = (response, expires_at)
+        _lru.move_to_end(key)
+        while len(_lru) > LRU_SIZE:
+            _lru.popitem(last=False)
+
+
+def lookup(db, chat_type, prompt, context):
+    """Cached response for (chat_type, prompt, context), or None"""
+    ttl = cache_ttl(chat_type)
+    if ttl is None:
+        return None
+
+    key = cache_key(chat_type, prompt, context)
+    response = _lru_get(key)
+    if response is not None:
+        _record(chat_type, 'lru_hits')
+        return response
+
+    try:
+        entry = db.ai_response_cache.find_one_and_update(
+            {'_id': key, 'expires_at': {'$gt': datetime.utcnow()}},
+            {'$inc': {'hits': 1}},
+            projection={'response': 1, 'expires_at': 1}
+        )
+    except PyMongoError as e:
+        print(f"AI cache lookup failed: {e}")
+        entry = None
+
+    if entry:
+        _record(chat_type, 'db_hits')
+        _lru_put(key, entry['response'], entry['expires_at'])
+        return entry['response']
+
+    _record(chat_type, 'misses')
+    return None
+
+
+def store(db, chat_type, prompt, context, response):
+    """Cache a model response if the chat type's policy allows it"""
+    ttl = cache_ttl(chat_type)
+    if ttl is None:
+        return
+
+    key = cache_key(chat_type, prompt, context)
+    now = datetime.utcnow()
+    expires_at = now + ttl
+    _lru_put(key, response, expires_at)
+    try:
+        db.ai_response_cache.replace_one(
+            {'_id': key},
+            {'type': chat_type, 'response': response, 'hits': 0, 'created_at': now, 'expires_at': expires_at},
+            upsert=True
+        )
+    except PyMongoError as e:
+        print(f"AI cache write failed: {e}")
+
+
+def get_or_generate(db, chat_type, prompt, context, generate):
+    """
+    Return the cached response for (chat_type, prompt, context) or call
+    generate() and cache its result. Exceptions from generate() propagate
+    and nothing is cached.
+    """
+    if cache_ttl(chat_type) is None:
+        return generate()
+
+    response = lookup(db, chat_type, prompt, context)
+    if response is not None:
+        return response
+
+    response = generate()
+    store(db, chat_type, prompt, context, response)
+    return response
+
+
+def cache_stats(db):
+    """Hit ratios of this process per chat type, plus the size of both tiers"""
+    with _lock:
+        types = {}
+        for chat_type, counts in _stats.items():
+            lookups = sum(counts.values())
+            hits = counts['lru_hits'] + counts['db_hits']
+            types[chat_type] = {**counts, 'hit_ratio': round(hits / lookups, 4) if lookups else 0}
+        lru_entries = len(_lru)
+
+    return {
+        'enabled': AI_CACHE_ENABLED,
+        'types': types,
+        'lru_entries': lru_entries,
+        'lru_size': LRU_SIZE,
+        'stored_entries': db.ai_response_cache.estimated_document_count(),
+        'policies': {t: (int(ttl.total_seconds()) if ttl else None) for t, ttl in CACHE_POLICIES.items()}
+    }
@@ -0,0 +1,316 @@
+"""
+Shared Gemini client.
+
+Every call to the model goes through ``generate``, which
+
+- reuses one ``GenerativeModel`` (and its gRPC channel) per worker process,
+  re-created after a fork because gRPC channels do not survive one;
+- bounds the calls in flight per process with a semaphore, so a slow
+  upstream makes AI requests fail fast with 503 instead of tying up every
+  worker;
+- enforces a deadline per call (the 0.3 SDK has no request timeout, so the
+  call runs on a small thread pool and the request stops waiting for it);
+- retries rate-limit and 5xx errors with jittered exponential backoff while
+  the deadline allows;
+- records a latency histogram per mode (explain, qa, summarize, ...);
+- stops calling a failing model altogether: timeouts and upstream errors
+  feed a circuit breaker per model, and while it is open calls fail at once
+  so the routes answer with their fallback text (see utils.circuit_breaker).
+
+``stream`` is the token-by-token variant used by the streaming chat: same
+breaker and concurrency limit, but the deadline applies to the wait for each
+chunk rather than the whole response, and streams are not retried.
+"""
+import os
+import queue
+import random
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
+
+from utils.circuit_breaker import get_breaker, breaker_states, CircuitOpenError
+
+GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
+GEMINI_MODEL = os.getenv('GEMINI_MODEL', 'gemini-2.5-flash')
+# Optional REST endpoint override, e.g. a proxy or a local stand-in for tests
+GEMINI_API_ENDPOINT = os.getenv('GEMINI_API_ENDPOINT')
+
+AI_TIMEOUT = float(os.getenv('AI_TIMEOUT_SECONDS', 30))
+AI_MAX_CONCURRENCY = int(os.getenv('AI_MAX_CONCURRENCY', 4))
+AI_QUEUE_TIMEOUT = float(os.getenv('AI_QUEUE_TIMEOUT_SECONDS', 2))
+AI_MAX_RETRIES = int(os.getenv('AI_MAX_RETRIES', 2))
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 8.0
+PROBE_TIMEOUT = 10
+
+# Upstream failures: retried, and counted by the circuit breaker. OSError
+# covers refused or dropped connections on the REST transport.
+RETRYABLE_ERRORS = (
+    google_exceptions.ResourceExhausted,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.InternalServerError,
+    google_exceptions.DeadlineExceeded,
+    OSError
+)
+
+# Upper bounds in seconds; the last bucket catches everything slower
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 30, 60, float('inf'))
+
+
+class AIError(Exception):
+    """Raised when the model could not produce a response"""
+    def __init__(self, message, status_code=502):
+        self.message = message
+        self.status_code = status_code
+        super().__init__(self.message)
+
+
+class AIBusyError(AIError):
+    def __init__(self, message='AI service is busy, please try again shortly'):
+        super().__init__(message, 503)
+
+
+class AITimeoutError(AIError):
+    def __init__(self, message='AI service did not respond in time'):
+        super().__init__(message, 504)
+
+
+class AIUnavailableError(AIError):
+    def __init__(self, message='AI service is temporarily unavailable'):
+        super().__init__(message, 503)
+
+
+_lock = threading.Lock()
+_pid = None
+_model = None
+_executor = None
+_semaphore = None
+_histograms = defaultdict(lambda: {
+    'buckets': [0] * len(LATENCY_BUCKETS), 'count': 0, 'sum': 0.0,
+    'errors': 0, 'timeouts': 0, 'rejected': 0, 'retries': 0, 'short_circuited': 0
+})
+
+
+def is_configured():
+    return bool(GEMINI_API_KEY)
+
+
+def _worker_state():
+    """Model, executor and semaphore of this process, created on first use"""
+    global _pid, _model, _executor, _semaphore
+    with _lock:
+        if _pid != os.getpid():
+            # Fresh client after fork: the parent's gRPC channel is unusable here
+            if GEMINI_API_ENDPOINT:
+                genai.configure(api_key=GEMINI_API_KEY, transport='rest',
+                                client_options={'api_endpoint': GEMINI_API_ENDPOINT})
+            else:
+                genai.configure(api_key=GEMINI_API_KEY)
+            _model = genai.GenerativeModel(GEMINI_MODEL)
+            _executor = ThreadPoolExecutor(max_workers=AI_MAX_CONCURRENCY, thread_name_prefix='gemini')
+            _semaphore = threading.BoundedSemaphore(AI_MAX_CONCURRENCY)
+            _pid = os.getpid()
+        return _model, _executor, _semaphore
+
+
+def _observe(mode, seconds=None, outcome=None):
+    with _lock:
+        histogram = _histograms[mode]
+        if seconds is not None:
+            histogram['buckets'][bisect_left(LATENCY_BUCKETS, seconds)] += 1
+            histogram['count'] += 1
+            histogram['sum'] += seconds
+        if outcome:
+            histogram[outcome] += 1
+
+
+def _call_once(call, mode, deadline):
+    model, executor, semaphore = _worker_state()
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise AITimeoutError()
+
+    if not semaphore.acquire(timeout=min(remaining, AI_QUEUE_TIMEOUT)):
+        _observe(mode, outcome='rejected')
+        raise AIBusyError()
+
+    try:
+        future = executor.submit(call, model)
+    except Exception:
+        semaphore.release()
+        raise
+    # The slot is freed when the call really ends, even after we stop waiting
+    future.add_done_callback(lambda _: semaphore.release())
+
+    try:
+        return future.result(timeout=max(0, deadline - time.monotonic()))
+    except FutureTimeout:
+        raise AITimeoutError()
+
+
+def _probe():
+    """Cheap request used by the circuit breaker to detect recovery"""
+    _call_once(lambda model: model.generate_content('ping').text, 'probe', time.monotonic() + PROBE_TIMEOUT)
+
+
+def model_breaker():
+    return get_breaker(GEMINI_MODEL, _probe)
+
+
+def call_model(call, mode='general', timeout=None):
+    """
+    Run call(model) under the circuit breaker, concurrency limit, deadline
+    and retry policy.
+
+    Raises AIUnavailableError, AIBusyError, AITimeoutError or the SDK's own
+    exception.
+    """
+    if not is_configured():
+        raise AIError('GEMINI_API_KEY is not configured', 503)
+
+    breaker = model_breaker()
+    started = time.monotonic()
+    deadline = started + (timeout or AI_TIMEOUT)
+    attempt = 0
+    while True:
+        try:
+            breaker.before_call()
+            result = _call_once(call, mode, deadline)
+            breaker.record_success()
+            _observe(mode, time.monotonic() - started)
+            return result
+        except CircuitOpenError:
+            _observe(mode, outcome='short_circuited')
+            raise AIUnavailableError()
+        except AITimeoutError:
+            breaker.record_failure()
+            _observe(mode, time.monotonic() - started, 'timeouts')
+            raise
+        except AIBusyError:
+            raise
+        except RETRYABLE_ERRORS:
+            breaker.record_failure()
+            attempt += 1
+            delay = random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** (attempt - 1)))
+            if attempt > AI_MAX_RETRIES or time.monotonic() + delay >= deadline:
+                _observe(mode, time.monotonic() - started, 'errors')
+                raise
+            _observe(mode, outcome='retries')
+            time.sleep(delay)
+        except Exception:
+            # Rejected prompts and similar client errors mean the model is up
+            breaker.record_success()
+            _observe(mode, time.monotonic() - started, 'errors')
+            raise
+
+
+def generate(prompt, mode='general', timeout=None):
+    """Generate a text response for a prompt"""
+    return call_model(lambda model: model.generate_content(prompt).text, mode, timeout)
+
+
+def stream(prompt, mode='general', timeout=None):
+    """
+    Yield the response text chunk by chunk as the model produces it.
+
+    Raises like generate(); timeout bounds the wait for the first chunk and
+    between chunks. Closing the generator stops reading the upstream stream.
+    """
+    if not is_configured():
+        raise AIError('GEMINI_API_KEY is not configured', 503)
+
+    breaker = model_breaker()
+    try:
+        breaker.before_call()
+    except CircuitOpenError:
+        _observe(mode, outcome='short_circuited')
+        raise AIUnavailableError()
+
+    model, executor, semaphore = _worker_state()
+    if not semaphore.acquire(timeout=AI_QUEUE_TIMEOUT):
+        _observe(mode, outcome='rejected')
+        raise AIBusyError()
+
+    chunks = queue.Queue()
+    cancelled = threading.Event()
+
+    def produce():
+        try:
+            for chunk in model.generate_content(prompt, stream=True):
+                if cancelled.is_set():
+                    return
+                chunks.put(('chunk', chunk.text))
+            chunks.put(('done', None))
+        except Exception as e:
+            chunks.put(('error', e))
+
+    try:
+        future = executor.submit(produce)
+    except Exception:
+        semaphore.release()
+        raise
+    future.add_done_callback(lambda _: semaphore.release())
+
+    started = time.monotonic()
+    idle_timeout = timeout or AI_TIMEOUT
+    first_chunk = True
+    try:
+        while True:
+            try:
+                kind, value = chunks.get(timeout=idle_timeout)
+            except queue.Empty:
+                breaker.record_failure()
+                _observe(mode, time.monotonic() - started, 'timeouts')
+                raise AITimeoutError()
+
+            if kind == 'chunk':
+                if first_chunk:
+                    first_chunk = False
+                    _observe(f'{mode}_first_chunk', time.monotonic() - started)
+                yield value
+            elif kind == 'done':
+                breaker.record_success()
+                _observe(mode, time.monotonic() - started)
+                return
+            else:
+                if isinstance(value, RETRYABLE_ERRORS):
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()
+                _observe(mode, time.monotonic() - started, 'errors')
+                raise value
+    finally:
+        cancelled.set()
+
+
+def latency_stats():
+    """Latency histograms per mode for this process"""
+    with _lock:
+        stats = {}
+        for mode, histogram in _histograms.items():
+            stats[mode] = {
+                'buckets': {
+                    ('+Inf' if bound == float('inf') else str(bound)): count
+                    for bound, count in zip(LATENCY_BUCKETS, histogram['buckets'])
+                },
+                'count': histogram['count'],
+                'average_seconds': round(histogram['sum'] / histogram['count'], 3) if histogram['count'] else 0,
+                'errors': histogram['errors'],
+                'timeouts': histogram['timeouts'],
+                'rejected': histogram['rejected'],
+                'retries': histogram['retries'],
+                'short_circuited': histogram['short_circuited']
+            }
+
+    return {
+        'model': GEMINI_MODEL,
+        'timeout_seconds': AI_TIMEOUT,
+        'max_concurrency': AI_MAX_CONCURRENCY,
+        'modes': stats,
+        'circuits': breaker_states()
+    }
@@ -0,0 +1,102 @@
+"""
+Per-user context for the AI assistant.
+
+The chat, the welcome message and learning paths all describe the student to
+the model by name, role and enrolled course titles. The user is read on every
+call with a small projection, which also returns its ``ai_context_rev``; the
+enrolled courses are cached per process under the user id together with that
+revision, and rebuilt on a miss with one projected query on enrollments and
+one ``$in`` on courses.
+
+The revision is bumped in the same write that changes a student's
+enrollments (see utils.enrollments) and for every enrolled student when a
+course is renamed, so all workers notice at their next lookup. Entries also
+expire after ``CONTEXT_TTL`` to bound staleness from changes that do not bump
+the revision, such as a deleted course.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from bson import ObjectId
+
+CONTEXT_CACHE_SIZE = int(os.getenv('AI_CONTEXT_CACHE_SIZE', 5000))
+CONTEXT_TTL = int(os.getenv('AI_CONTEXT_TTL_SECONDS', 600))
+
+USER_PROJECTION = {'name': 1, 'role': 1, 'department': 1, 'year': 1, 'total_points': 1, 'ai_context_rev': 1}
+
+_lock = threading.Lock()
+_cache = OrderedDict()
+
+
+def _cache_get(user_id, rev):
+    with _lock:
+        entry = _cache.get(user_id)
+        if entry is None:
+            return None
+        cached_rev, courses, expires_at = entry
+        if cached_rev != rev or expires_at <= time.monotonic():
+            del _cache[user_id]
+            return None
+        _cache.move_to_end(user_id)
+        return courses
+
+
+def _cache_put(user_id, rev, courses):
+    with _lock:
+        _cache[user_id] = (rev, courses, time.monotonic() + CONTEXT_TTL)
+        _cache.move_to_end(user_id)
+        while len(_cache) > CONTEXT_CACHE_SIZE:
+            _cache.popitem(last=False)
+
+
+def enrolled_courses(db, user_id):
+    """[{course_id, title}] for the student's enrollments, in enrollment order"""
+    course_ids = [
+        e['course_id'] for e in db.enrollments.find({'student_id': user_id}, {'course_id': 1, '_id': 0})
+    ]
+    valid_ids = [ObjectId(cid) for cid in course_ids if ObjectId.is_valid(cid)]
+    if not valid_ids:
+        return []
+
+    titles = {str(c['_id']): c['title'] for c in db.courses.find({'_id': {'$in': valid_ids}}, {'title': 1})}
+    return [{'course_id': cid, 'title': titles[cid]} for cid in course_ids if cid in titles]
+
+
+def get_user_context(db, user_id):
+    """
+    Context of a user for the AI routes, or None if the user does not exist.
+
+    Returns {'user': {name, role, department, ...}, 'courses': [{course_id, title}],
+    'context': prompt string}. Only students have courses.
+    """
+    user = db.users.find_one({'_id': ObjectId(user_id)}, USER_PROJECTION)
+    if not user:
+        return None
+
+    courses = []
+    if user.get('role') == 'student':
+        rev = user.get('ai_context_rev', 0)
+        courses = _cache_get(user_id, rev)
+        if courses is None:
+            courses = enrolled_courses(db, user_id)
+            _cache_put(user_id, rev, courses)
+
+    context_parts = [f"User: {user['name']}", f"Role: {user['role']}"]
+    if courses:
+        context_parts.append(f"Enrolled courses: {', '.join(course['title'] for course in courses)}")
+
+    return {'user': user, 'courses': courses, 'context': "; ".join(context_parts)}
+
+
+def invalidate_users(db, user_ids):
+    """Make every process rebuild the context of these users"""
+    object_ids = [ObjectId(uid) for uid in user_ids if ObjectId.is_valid(uid)]
+    if object_ids:
+        db.users.update_many({'_id': {'$in': object_ids}}, {'$inc': {'ai_context_rev': 1}})
+
+
+def invalidate_course(db, course_id):
+    """Rebuild the context of every student enrolled in a course, e.g. after a rename"""
+    invalidate_users(db, db.enrollments.distinct('student_id', {'course_id': course_id}))
@@ -0,0 +1,272 @@
+"""
+Background queue for Gemini calls.
+
+With ``async`` set, the AI endpoints store a job in ``ai_jobs`` and answer
+202 with its id straight away; ``ai_worker.py`` runs the model call in a
+separate process pool and the client polls ``GET /api/ai/jobs/<id>`` for the
+result. Web workers then never wait on the model, however slow it is.
+
+Jobs are claimed in (priority, turn, created_at) order with an atomic
+``find_one_and_update``. A job's turn is the number of jobs its user already
+had waiting when it was queued, so a burst from one student is interleaved
+with everybody else's first request instead of running ahead of it, and each
+user may have at most ``MAX_JOBS_PER_USER`` jobs in flight. The limit is kept
+in a per-user counter (``ai_job_slots``) that is only incremented by a
+conditional ``find_one_and_update``, so concurrent requests cannot both take
+the last slot; finishing a job gives its slot back.
+
+A claimed job carries a lease that the worker renews every
+``LEASE_RENEW_INTERVAL`` while the handler runs, so a long map-reduce summary
+is not re-queued under a live worker. Jobs whose worker died are re-queued
+once the lease runs out (at most ``MAX_ATTEMPTS`` runs in total). Finished
+jobs are removed by a TTL index after ``JOB_RETENTION``.
+"""
+import os
+import threading
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+PRIORITY_INTERACTIVE = 0  # chat answers a student is waiting for
+PRIORITY_NORMAL = 1       # summaries and learning paths
+PRIORITY_BACKGROUND = 2   # precomputed content nobody is waiting for
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+MAX_JOBS_PER_USER = int(os.getenv('AI_JOBS_MAX_PER_USER', 5))
+JOB_LEASE = timedelta(seconds=int(os.getenv('AI_JOB_LEASE_SECONDS', 300)))
+JOB_MAX_WAIT = timedelta(seconds=int(os.getenv('AI_JOB_MAX_WAIT_SECONDS', 600)))
+JOB_RETENTION = timedelta(hours=int(os.getenv('AI_JOB_RETENTION_HOURS', 24)))
+MAX_ATTEMPTS = 2
+LEASE_RENEW_INTERVAL = JOB_LEASE / 3
+# Counters untouched for this long are checked against the jobs they count
+SLOT_RECONCILE_AGE = timedelta(minutes=5)
+
+QUEUE_ORDER = [('priority', 1), ('turn', 1), ('created_at', 1)]
+
+# kind -> fn(db, job) returning the job's result; registered by the routes
+JOB_HANDLERS = {}
+
+
+class JobQueueFullError(Exception):
+    """Raised when a user already has MAX_JOBS_PER_USER jobs in flight"""
+    def __init__(self, message='Too many AI requests in progress, please wait for them to finish'):
+        self.message = message
+        self.status_code = 429
+        super().__init__(self.message)
+
+
+def job_handler(kind):
+    """Decorator registering the handler for a job kind"""
+    def register(handler):
+        JOB_HANDLERS[kind] = handler
+        return handler
+    return register
+
+
+def _take_slot(db, user_id):
+    """Take one of the user's in-flight slots and return how many were taken before"""
+    try:
+        slots = db.ai_job_slots.find_one_and_update(
+            {'_id': user_id, 'in_flight': {'$lt': MAX_JOBS_PER_USER}},
+            {'$inc': {'in_flight': 1}, '$set': {'updated_at': datetime.utcnow()}},
+            upsert=True,
+            return_document=ReturnDocument.BEFORE
+        )
+    except DuplicateKeyError:
+        # The counter exists but is full, so the upsert tried to insert another
+        raise JobQueueFullError()
+    return slots['in_flight'] if slots else 0
+
+
+def _release_slot(db, user_id):
+    if user_id:
+        db.ai_job_slots.update_one(
+            {'_id': user_id, 'in_flight': {'$gt': 0}},
+            {'$inc': {'in_flight': -1}, '$set': {'updated_at': datetime.utcnow()}}
+        )
+
+
+def enqueue_job(db, kind, payload, user_id=None, priority=PRIORITY_NORMAL):
+    """Queue a job and return its id"""
+    turn = _take_slot(db, user_id) if user_id else 0
+    try:
+        result = db.ai_jobs.insert_one({
+            'kind': kind,
+            'payload': payload,
+            'user_id': user_id,
+            'priority': priority,
+            'turn': turn,
+            'status': QUEUED,
+            'attempts': 0,
+            'created_at': datetime.utcnow()
+        })
+    except Exception:
+        _release_slot(db, user_id)
+        raise
+    return str(result.inserted_id)
+
+
+def claim_job(db, worker_id):
+    """Atomically take the next queued job, or return None"""
+    now = datetime.utcnow()
+    return db.ai_jobs.find_one_and_update(
+        {'status': QUEUED},
+        {
+            '$set': {'status': RUNNING, 'worker': worker_id, 'started_at': now, 'lease_expires_at': now + JOB_LEASE},
+            '$inc': {'attempts': 1}
+        },
+        sort=QUEUE_ORDER,
+        return_document=ReturnDocument.AFTER
+    )
+
+
+def _finish(db, job, fields):
+    now = datetime.utcnow()
+    # Matching on the worker keeps a re-queued job from being overwritten
+    finished = db.ai_jobs.update_one(
+        {'_id': job['_id'], 'status': RUNNING, 'worker': job['worker']},
+        {'$set': {**fields, 'finished_at': now, 'expires_at': now + JOB_RETENTION},
+         '$unset': {'lease_expires_at': ''}}
+    )
+    if finished.modified_count:
+        _release_slot(db, job.get('user_id'))
+
+
+def renew_lease(db, job):
+    """Push back the lease of a job this worker is still running; False if it lost the job"""
+    result = db.ai_jobs.update_one(
+        {'_id': job['_id'], 'status': RUNNING, 'worker': job['worker']},
+        {'$set': {'lease_expires_at': datetime.utcnow() + JOB_LEASE}}
+    )
+    return result.modified_count == 1
+
+
+def _renew_until(db, job, done):
+    while not done.wait(LEASE_RENEW_INTERVAL.total_seconds()):
+        try:
+            if not renew_lease(db, job):
+                return
+        except Exception as e:
+            print(f"Could not renew the lease of AI job {job['_id']}: {e}")
+
+
+def run_job(db, job):
+    """Run a claimed job through its handler and store the outcome"""
+    handler = JOB_HANDLERS.get(job['kind'])
+    if handler is None:
+        _finish(db, job, {'status': FAILED, 'error': f"Unknown job kind: {job['kind']}"})
+        return
+
+    # Heartbeat for handlers that outlast one lease
+    done = threading.Event()
+    heartbeat = threading.Thread(target=_renew_until, args=(db, job, done), daemon=True)
+    heartbeat.start()
+    try:
+        result = handler(db, job)
+    except Exception as e:
+        print(f"AI job {job['_id']} ({job['kind']}) failed: {e}")
+        _finish(db, job, {'status': FAILED, 'error': getattr(e, 'message', str(e))})
+        return
+    finally:
+        done.set()
+    _finish(db, job, {'status': DONE, 'result': result})
+
+
+def recover_expired_leases(db):
+    """Re-queue jobs whose worker stopped mid-run; returns the number re-queued"""
+    try:
+        now = datetime.utcnow()
+        expired = {'status': RUNNING, 'lease_expires_at': {'$lt': now}}
+        requeued = db.ai_jobs.update_many(
+            {**expired, 'attempts': {'$lt': MAX_ATTEMPTS}},
+            {'$set': {'status': QUEUED}, '$unset': {'worker': '', 'lease_expires_at': ''}}
+        ).modified_count
+        failed = 0
+        for job in db.ai_jobs.find(expired, {'user_id': 1}):
+            # One by one, so each failed job gives back its user's slot once
+            if db.ai_jobs.update_one(
+                {'_id': job['_id'], **expired},
+                {'$set': {'status': FAILED, 'error': 'AI worker stopped while running the job',
+                          'finished_at': now, 'expires_at': now + JOB_RETENTION}}
+            ).modified_count:
+                _release_slot(db, job.get('user_id'))
+                failed += 1
+
+        if requeued or failed:
+            print(f"Re-queued {requeued} AI jobs with expired leases, gave up on {failed}")
+        reconcile_slots(db)
+        return requeued
+
+    except Exception as e:
+        print(f"Error recovering AI jobs: {e}")
+        return 0
+
+
+def reconcile_slots(db):
+    """
+    Lower per-user counters that count more jobs than are in flight, e.g.
+    after a web worker died between taking a slot and inserting its job.
+    Only counters that have not changed for a while are touched, so a slot
+    taken for a job that is being inserted right now is left alone.
+    """
+    cutoff = datetime.utcnow() - SLOT_RECONCILE_AGE
+    for slots in db.ai_job_slots.find({'in_flight': {'$gt': 0}, 'updated_at': {'$lt': cutoff}}):
+        in_flight = db.ai_jobs.count_documents({'user_id': slots['_id'], 'status': {'$in': [QUEUED, RUNNING]}})
+        if in_flight < slots['in_flight']:
+            db.ai_job_slots.update_one(
+                {'_id': slots['_id'], 'in_flight': slots['in_flight'], 'updated_at': slots['updated_at']},
+                {'$set': {'in_flight': in_flight}}
+            )
+
+
+def queue_position(db, job):
+    """Number of queued jobs that will be claimed before this one"""
+    return db.ai_jobs.count_documents({'status': QUEUED, '$or': [
+        {'priority': {'$lt': job['priority']}},
+        {'priority': job['priority'], 'turn': {'$lt': job['turn']}},
+        {'priority': job['priority'], 'turn': job['turn'], 'created_at': {'$lt': job['created_at']}}
+    ]})
+
+
+def get_job(db, job_id, user_id):
+    """The user's job as returned by the API, or None"""
+    if not ObjectId.is_valid(job_id):
+        return None
+    job = db.ai_jobs.find_one({'_id': ObjectId(job_id), 'user_id': user_id})
+    if not job:
+        return None
+
+    now = datetime.utcnow()
+    if job['status'] == QUEUED and job['created_at'] < now - JOB_MAX_WAIT:
+        # No worker is draining the queue; stop the client from polling forever
+        expired = db.ai_jobs.find_one_and_update(
+            {'_id': job['_id'], 'status': QUEUED},
+            {'$set': {'status': FAILED, 'error': 'No AI worker picked up the request in time',
+                      'finished_at': now, 'expires_at': now + JOB_RETENTION}},
+            return_document=ReturnDocument.AFTER
+        )
+        if expired:
+            _release_slot(db, user_id)
+        job = expired or db.ai_jobs.find_one({'_id': job['_id']})
+
+    body = {
+        'job_id': str(job['_id']),
+        'kind': job['kind'],
+        'status': job['status'],
+        'created_at': job['created_at'].isoformat(),
+        'started_at': job['started_at'].isoformat() if job.get('started_at') else None,
+        'finished_at': job['finished_at'].isoformat() if job.get('finished_at') else None
+    }
+    if job['status'] == QUEUED:
+        body['position'] = queue_position(db, job)
+    elif job['status'] == DONE:
+        body['result'] = job['result']
+    elif job['status'] == FAILED:
+        body['error'] = job.get('error')
+    return body
@@ -0,0 +1,93 @@
+"""
+Course catalog search.
+
+Search runs against the ``course_catalog_text`` text index (title,
+description, category and learning objectives, weighted towards the title)
+and is answered by a single aggregation: a ``$facet`` stage returns the
+relevance-ranked page, the total and the category/difficulty counts together.
+Facet counts are disjunctive - the category counts apply every filter except
+the category one, and likewise for difficulty - so a client can show how many
+results each alternative would give.
+"""
+from bson import ObjectId
+
+CATALOG_PAGE_SIZE = 20
+MAX_CATALOG_PAGE_SIZE = 100
+MAX_QUERY_LENGTH = 200
+
+CATALOG_FIELDS = ('title', 'description', 'category', 'difficulty', 'duration', 'thumbnail',
+                  'thumbnail_variants', 'learning_objectives', 'teacher_id', 'enrolled_count',
+                  'max_students', 'created_at')
+
+
+def _count_by(field, match):
+    return [
+        {'$match': match},
+        {'$group': {'_id': f'${field}', 'count': {'$sum': 1}}},
+        {'$sort': {'count': -1, '_id': 1}}
+    ]
+
+
+def search_courses(db, text='', category=None, difficulty=None, page=1, limit=CATALOG_PAGE_SIZE):
+    """
+    Search active public courses.
+
+    Returns (courses, total, facets) for the requested page; without search
+    text the newest courses come first.
+    """
+    text = (text or '').strip()[:MAX_QUERY_LENGTH]
+    base = {'is_active': True, 'is_public': {'$ne': False}}
+    if text:
+        base['$text'] = {'$search': text}
+
+    category_filter = {'category': category} if category else {}
+    difficulty_filter = {'difficulty': difficulty} if difficulty else {}
+
+    projection = {field: 1 for field in CATALOG_FIELDS}
+    if text:
+        projection['score'] = {'$meta': 'textScore'}
+        order = {'score': {'$meta': 'textScore'}, '_id': 1}
+    else:
+        order = {'created_at': -1, '_id': 1}
+
+    pipeline = [
+        {'$match': base},
+        {'$facet': {
+            'results': [
+                {'$match': {**category_filter, **difficulty_filter}},
+                {'$sort': order},
+                {'$skip': (page - 1) * limit},
+                {'$limit': limit},
+                {'$project': projection}
+            ],
+            'total': [
+                {'$match': {**category_filter, **difficulty_filter}},
+                {'$count': 'count'}
+            ],
+            'category': _count_by('category', difficulty_filter),
+            'difficulty': _count_by('difficulty', category_filter)
+        }}
+    ]
+    result = next(db.courses.aggregate(pipeline), {})
+
+    courses = result.get('results', [])
+    total = result['total'][0]['count'] if result.get('total') else 0
+    facets = {
+        name: [{'value': row['_id'], 'count': row['count']} for row in result.get(name, []) if row['_id']]
+        for name in ('category', 'difficulty')
+    }
+
+    # One lookup for the teachers of the whole page
+    teacher_ids = {c['teacher_id'] for c in courses if ObjectId.is_valid(c.get('teacher_id', ''))}
+    teachers = {
+        str(t['_id']): t.get('name', '')
+        for t in db.users.find({'_id': {'$in': [ObjectId(t) for t in teacher_ids]}}, {'name': 1})
+    } if teacher_ids else {}
+
+    for course in courses:
+        course['_id'] = str(course['_id'])
+        course['course_id'] = course['_id']
+        course['teacher_name'] = teachers.get(course.get('teacher_id'), '')
+        course['enrolled_students'] = course.get('enrolled_count', 0)
+
+    return courses, total, facets
@@ -0,0 +1,268 @@
+"""
+Resumable chunked uploads.
+
+An upload session is created first, numbered chunks are then PUT in any order
+(and retried as often as needed) and the session is finalized. Every chunk is
+written straight into a preallocated ``.part`` file at its offset while being
+hashed, so finalizing only verifies the file and hands it to the media store
+to be renamed into place - no second copy.
+
+Finalizing still reads the whole file once (the SHA-256 of the content is the
+blob's address), so the request only claims the session ('finalizing') and
+the rest runs on the job queue in ``ai_worker.py``. If that work fails the
+session goes back to 'uploading' while the part file still exists, so the
+client can finalize again, and to 'failed' once the file has been handed on.
+The manifest lives in the ``upload_sessions`` collection.
+"""
+import hashlib
+import os
+import time
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from bson.errors import InvalidId
+
+from utils.storage import MEDIA_ROOT
+
+# Below MEDIA_ROOT so finished uploads are renamed into place on the same filesystem
+UPLOAD_TMP_FOLDER = os.path.join(MEDIA_ROOT, 'tmp')
+os.makedirs(UPLOAD_TMP_FOLDER, exist_ok=True)
+
+DEFAULT_CHUNK_SIZE = 8 * 1024 * 1024  # 8MB
+MIN_CHUNK_SIZE = 256 * 1024
+MAX_CHUNK_SIZE = 64 * 1024 * 1024
+MAX_UPLOAD_SIZE = int(os.getenv('MAX_UPLOAD_SIZE_MB', 2048)) * 1024 * 1024
+SESSION_TTL = timedelta(hours=24)
+COPY_BUFFER_SIZE = 1024 * 1024
+
+
+class UploadError(Exception):
+    """Raised when an upload request cannot be accepted"""
+    def __init__(self, message, status_code=400):
+        self.message = message
+        self.status_code = status_code
+        super().__init__(self.message)
+
+
+def part_path(upload_id):
+    return os.path.join(UPLOAD_TMP_FOLDER, f'{upload_id}.part')
+
+
+def chunk_count(total_size, chunk_size):
+    return max(1, (total_size + chunk_size - 1) // chunk_size)
+
+
+def create_session(db, user_id, filename, total_size, chunk_size=None, sha256=None, target='video', metadata=None):
+    """Create an upload session and preallocate its part file"""
+    try:
+        total_size = int(total_size)
+        chunk_size = int(chunk_size or DEFAULT_CHUNK_SIZE)
+    except (TypeError, ValueError):
+        raise UploadError('total_size and chunk_size must be integers')
+
+    if total_size <= 0:
+        raise UploadError('total_size must be greater than 0')
+    if total_size > MAX_UPLOAD_SIZE:
+        raise UploadError(f'File too large. Maximum size is {MAX_UPLOAD_SIZE // (1024 * 1024)}MB', 413)
+    if not MIN_CHUNK_SIZE <= chunk_size <= MAX_CHUNK_SIZE:
+        raise UploadError(f'chunk_size must be between {MIN_CHUNK_SIZE} and {MAX_CHUNK_SIZE} bytes')
+
+    now = datetime.utcnow()
+    session = {
+        'user_id': user_id,
+        'filename': filename,
+        'total_size': total_size,
+        'chunk_size': chunk_size,
+        'chunk_count': chunk_count(total_size, chunk_size),
+        'sha256': sha256.lower() if sha256 else None,
+        'target': target,
+        'metadata': metadata or {},
+        'chunks': {},
+        'status': 'uploading',
+        'created_at': now,
+        'updated_at': now,
+        'expires_at': now + SESSION_TTL
+    }
+    result = db.upload_sessions.insert_one(session)
+    session['_id'] = result.inserted_id
+
+    # Sparse preallocation: chunks are written at their final offsets
+    with open(part_path(str(result.inserted_id)), 'wb') as f:
+        f.truncate(total_size)
+
+    return session
+
+
+def get_session(db, upload_id, user_id):
+    """Load an upload session owned by user_id"""
+    try:
+        session = db.upload_sessions.find_one({'_id': ObjectId(upload_id), 'user_id': user_id})
+    except (InvalidId, TypeError):
+        session = None
+    if not session:
+        raise UploadError('Upload not found', 404)
+    return session
+
+
+def expected_chunk_size(session, index):
+    offset = index * session['chunk_size']
+    return min(session['chunk_size'], session['total_size'] - offset)
+
+
+def write_chunk(db, session, index, stream, content_length, expected_sha256=None):
+    """Stream one chunk to its offset in the part file, hashing as it goes"""
+    if session['status'] != 'uploading':
+        raise UploadError(f'Upload is {session["status"]}', 409)
+    if not 0 <= index < session['chunk_count']:
+        raise UploadError(f'Chunk index must be between 0 and {session["chunk_count"] - 1}')
+
+    size = expected_chunk_size(session, index)
+    if content_length is None:
+        raise UploadError('Content-Length header is required', 411)
+    if content_length != size:
+        raise UploadError(f'Chunk {index} must be exactly {size} bytes', 413 if content_length > size else 400)
+
+    digest = hashlib.sha256()
+    written = 0
+    with open(part_path(str(session['_id'])), 'r+b') as f:
+        f.seek(index * session['chunk_size'])
+        while written < size:
+            data = stream.read(min(COPY_BUFFER_SIZE, size - written))
+            if not data:
+                break
+            digest.update(data)
+            f.write(data)
+            written += len(data)
+
+    if written != size:
+        raise UploadError(f'Chunk {index} was truncated ({written} of {size} bytes received)')
+
+    chunk_sha256 = digest.hexdigest()
+    if expected_sha256 and expected_sha256.lower() != chunk_sha256:
+        raise UploadError(f'Checksum mismatch for chunk {index}', 422)
+
+    now = datetime.utcnow()
+    db.upload_sessions.update_one(
+        {'_id': session['_id']},
+        {'$set': {
+            f'chunks.{index}': {'size': written, 'sha256': chunk_sha256, 'received_at': now},
+            'updated_at': now,
+            'expires_at': now + SESSION_TTL
+        }}
+    )
+    return {'index': index, 'size': written, 'sha256': chunk_sha256}
+
+
+def missing_chunks(session):
+    received = session.get('chunks', {})
+    return [i for i in range(session['chunk_count']) if str(i) not in received]
+
+
+def hash_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(COPY_BUFFER_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def claim_session(db, session):
+    """Mark a fully received upload as finalizing, so it is finalized only once"""
+    missing = missing_chunks(session)
+    if missing:
+        raise UploadError(f'Upload incomplete. Missing chunks: {missing[:20]}', 409)
+
+    claimed = db.upload_sessions.find_one_and_update(
+        {'_id': session['_id'], 'status': 'uploading'},
+        {'$set': {'status': 'finalizing', 'updated_at': datetime.utcnow()}, '$unset': {'error': ''}}
+    )
+    if not claimed:
+        raise UploadError('Upload is already being finalized', 409)
+
+
+def verify_upload(session):
+    """
+    Check the assembled file of a claimed session.
+
+    Returns the path, size and SHA-256 of the file, which stays in the temp
+    folder until the caller moves it.
+    """
+    path = part_path(str(session['_id']))
+    file_size = os.path.getsize(path)
+    if file_size != session['total_size']:
+        raise UploadError('Assembled file size does not match total_size', 422)
+
+    sha256 = hash_file(path)
+    if session.get('sha256') and session['sha256'] != sha256:
+        raise UploadError('Checksum mismatch for assembled file', 422)
+    return path, file_size, sha256
+
+
+def release_session(db, session, error):
+    """Record a failed finalize; the upload can be finalized again while its part file exists"""
+    status = 'uploading' if os.path.exists(part_path(str(session['_id']))) else 'failed'
+    db.upload_sessions.update_one(
+        {'_id': session['_id'], 'status': 'finalizing'},
+        {'$set': {'status': status, 'error': error, 'updated_at': datetime.utcnow()}}
+    )
+
+
+def complete_session(db, session, result):
+    """Record the outcome of a finalized upload on the manifest"""
+    db.upload_sessions.update_one(
+        {'_id': session['_id']},
+        {'$set': {'status': 'completed', 'result': result, 'updated_at': datetime.utcnow()}}
+    )
+
+
+def abort_session(db, session):
+    """Delete the session and its part file; False if it is being finalized or done"""
+    deleted = db.upload_sessions.delete_one(
+        {'_id': session['_id'], 'status': {'$nin': ['finalizing', 'completed']}}
+    ).deleted_count
+    if not deleted:
+        return False
+    if os.path.exists(part_path(str(session['_id']))):
+        os.remove(part_path(str(session['_id'])))
+    return True
+
+
+def cleanup_stale_uploads(db):
+    """
+    Remove part files whose session expired or no longer exists (the TTL
+    index on upload_sessions deletes expired sessions on its own), and other
+    temp files older than SESSION_TTL that an interrupted request left behind
+    """
+    try:
+        db.upload_sessions.delete_many({
+            'status': {'$ne': 'completed'},
+            'expires_at': {'$lt': datetime.utcnow()}
+        })
+
+        removed = 0
+        stale_before = time.time() - SESSION_TTL.total_seconds()
+        for name in os.listdir(UPLOAD_TMP_FOLDER):
+            path = os.path.join(UPLOAD_TMP_FOLDER, name)
+            if not os.path.isfile(path):
+                continue
+            try:
+                if name.endswith('.part'):
+                    upload_id = name[:-len('.part')]
+                    stale = not ObjectId.is_valid(upload_id) or not db.upload_sessions.find_one(
+                        {'_id': ObjectId(upload_id), 'status': {'$in': ['uploading', 'finalizing']}}, {'_id': 1})
+                else:
+                    # save_upload, faststart and PDF/image staging files
+                    stale = os.path.getmtime(path) < stale_before
+                if stale:
+                    os.remove(path)
+                    removed += 1
+            except FileNotFoundError:
+                # Finished or removed by its request meanwhile
+                continue
+
+        print(f"Cleaned up {removed} stale partial uploads")
+        return removed
+
+    except Exception as e:
+        print(f"Error during upload cleanup: {e}")
+        return 0
@@ -0,0 +1,130 @@
+"""
+Circuit breaker for upstream services.
+
+A breaker starts closed and opens after ``failure_threshold`` consecutive
+failures. While it is open every call is refused at once, so callers can
+serve a fallback instead of waiting for an upstream that is down. Recovery is
+checked off the request path: a background thread waits ``reset_timeout``
+seconds, moves the breaker to half-open and runs the probe; success closes the
+breaker, failure re-opens it for another interval.
+
+Breakers are kept per process and per key (e.g. the model name) and shared by
+all threads of a worker.
+"""
+import os
+import threading
+import time
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+BREAKER_FAILURE_THRESHOLD = int(os.getenv('AI_BREAKER_FAILURES', 5))
+BREAKER_RESET_TIMEOUT = float(os.getenv('AI_BREAKER_RESET_SECONDS', 30))
+
+
+class CircuitOpenError(Exception):
+    """Raised when a call is refused because the circuit is open"""
+    def __init__(self, name):
+        self.message = f'{name} is unavailable, circuit open'
+        self.status_code = 503
+        super().__init__(self.message)
+
+
+class CircuitBreaker:
+    def __init__(self, name, probe, failure_threshold=BREAKER_FAILURE_THRESHOLD,
+                 reset_timeout=BREAKER_RESET_TIMEOUT):
+        self.name = name
+        self.probe = probe
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.times_opened = 0
+        self.rejected = 0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """Raise CircuitOpenError unless the circuit is closed"""
+        with self._lock:
+            if self.state != CLOSED:
+                self.rejected += 1
+                raise CircuitOpenError(self.name)
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == CLOSED and self.failures >= self.failure_threshold:
+                self._open()
+
+    def _open(self):
+        self.state = OPEN
+        self.opened_at = time.time()
+        self.times_opened += 1
+        print(f"Circuit for {self.name} opened after {self.failures} failures")
+        if not self._probing:
+            self._probing = True
+            threading.Thread(target=self._probe_until_closed, daemon=True,
+                             name=f'circuit-probe-{self.name}').start()
+
+    def _probe_until_closed(self):
+        while True:
+            time.sleep(self.reset_timeout)
+            with self._lock:
+                self.state = HALF_OPEN
+            try:
+                self.probe()
+            except Exception as e:
+                with self._lock:
+                    self.state = OPEN
+                    self.opened_at = time.time()
+                print(f"Circuit probe for {self.name} failed: {e}")
+                continue
+
+            with self._lock:
+                self.state = CLOSED
+                self.failures = 0
+                self.opened_at = None
+                self._probing = False
+            print(f"Circuit for {self.name} closed")
+            return
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'state': self.state,
+                'consecutive_failures': self.failures,
+                'opened_at': self.opened_at,
+                'times_opened': self.times_opened,
+                'rejected': self.rejected
+            }
+
+
+_breakers = {}
+_breakers_pid = None
+_registry_lock = threading.Lock()
+
+
+def get_breaker(name, probe, **options):
+    """Return the breaker for name in this process, creating it on first use"""
+    global _breakers, _breakers_pid
+    with _registry_lock:
+        # Probe threads do not survive a fork; start over in the child
+        if _breakers_pid != os.getpid():
+            _breakers = {}
+            _breakers_pid = os.getpid()
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker(name, probe, **options)
+        return _breakers[name]
+
+
+def breaker_states():
+    with _registry_lock:
+        breakers = list(_breakers.values()) if _breakers_pid == os.getpid() else []
+    return {breaker.name: breaker.snapshot() for breaker in breakers}
@@ -0,0 +1,71 @@
+"""
+Per-student material completion.
+
+Completions are kept in the ``material_completions`` collection - one small
+document per (material, student), unique on the pair - instead of a
+``completed_by`` array on the material, so material documents stay the same
+size however many students a course has. Each material carries a
+``completion_count`` counter that is incremented only when a completion is
+actually inserted.
+"""
+from datetime import datetime
+
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+
+def record_completion(db, material_id, student_id, course_id):
+    """Record that a student completed a material; returns True if it is new"""
+    try:
+        db.material_completions.insert_one({
+            'material_id': str(material_id),
+            'student_id': student_id,
+            'course_id': course_id,
+            'completed_at': datetime.utcnow()
+        })
+    except DuplicateKeyError:
+        return False
+
+    db.materials.update_one({'_id': ObjectId(material_id)}, {'$inc': {'completion_count': 1}})
+    return True
+
+
+def migrate_completed_by(db):
+    """Move legacy ``completed_by`` arrays into material_completions"""
+    try:
+        migrated = 0
+        for material in db.materials.find({'completed_by': {'$exists': True}}, {'completed_by': 1, 'course_id': 1}):
+            material_id = str(material['_id'])
+            students = material.get('completed_by') or []
+            if students:
+                now = datetime.utcnow()
+                try:
+                    db.material_completions.bulk_write([
+                        UpdateOne(
+                            {'material_id': material_id, 'student_id': student_id},
+                            {'$setOnInsert': {'course_id': material.get('course_id'), 'completed_at': now}},
+                            upsert=True
+                        )
+                        for student_id in students
+                    ], ordered=False)
+                except BulkWriteError as e:
+                    # Concurrent upserts of the same pair; the row exists either way
+                    if any(err.get('code') != 11000 for err in e.details.get('writeErrors', [])):
+                        raise
+
+            db.materials.update_one(
+                {'_id': material['_id']},
+                {
+                    '$set': {'completion_count': db.material_completions.count_documents({'material_id': material_id})},
+                    '$unset': {'completed_by': ''}
+                }
+            )
+            migrated += 1
+
+        print(f"Migrated completion lists of {migrated} materials")
+        return migrated
+
+    except Exception as e:
+        print(f"Error during completion migration: {e}")
+        return 0
@@ -0,0 +1,416 @@
+"""
+Course creation and cloning as one batched write.
+
+A course, its materials and its assignments are written inside a single
+transaction - one insert for the course, one ``insert_many`` per child
+collection and one update of the teacher's ``courses_created`` - instead of a
+round-trip per lesson, so a failure never leaves a half-created course behind.
+
+``export_course`` produces a course bundle (JSON, optionally zipped as
+``course.json``) and ``import_course`` creates a new course from one, which is
+how a course is cloned into a new term. Cloned media take another reference
+on the existing blobs rather than copying files, and assignment due dates are
+stored relative to the course start and re-anchored on the new term.
+"""
+import io
+import json
+import zipfile
+from datetime import datetime, timedelta, timezone
+
+from bson import ObjectId
+
+from utils.images import variant_url, variant_urls
+from utils.media_store import add_ref, release_blob
+from utils.storage import get_storage
+from utils.transactions import run_in_transaction
+from utils.validation import (
+    validate_course_data,
+    validate_material_data,
+    validate_assignment_data,
+    validate_date,
+    sanitize_string,
+    ValidationError
+)
+
+BUNDLE_FORMAT = 'course-bundle'
+BUNDLE_VERSION = 1
+BUNDLE_FILENAME = 'course.json'
+MAX_BUNDLE_SIZE = 20 * 1024 * 1024  # 20MB
+MAX_BUNDLE_MATERIALS = 2000
+MAX_BUNDLE_ASSIGNMENTS = 500
+
+COURSE_FIELDS = ('title', 'description', 'category', 'difficulty', 'duration', 'prerequisites',
+                 'learning_objectives', 'thumbnail', 'thumbnail_sha256', 'is_public', 'max_students')
+MATERIAL_FIELDS = ('title', 'description', 'type', 'content', 'order', 'is_required',
+                   'duration', 'duration_seconds', 'bitrate', 'width', 'height', 'blob_sha256')
+MATERIAL_TYPES = ('video', 'document', 'pdf', 'link', 'assignment', 'image')
+ASSIGNMENT_FIELDS = ('title', 'description', 'instructions', 'max_points', 'submission_type',
+                     'allowed_file_types', 'max_file_size')
+
+
+class BundleError(Exception):
+    """Raised when an uploaded course bundle cannot be read"""
+    def __init__(self, message, status_code=400):
+        self.message = message
+        self.status_code = status_code
+        super().__init__(self.message)
+
+
+def new_course(validated_data, user_id):
+    """Course document with the defaults every new course starts from"""
+    return {
+        **validated_data,
+        'teacher_id': user_id,
+        'difficulty': validated_data.get('difficulty', 'Beginner'),
+        'duration': validated_data.get('duration', ''),
+        'prerequisites': validated_data.get('prerequisites', []),
+        'learning_objectives': validated_data.get('learning_objectives', []),
+        'thumbnail': validated_data.get('thumbnail', ''),
+        'is_active': True,
+        'is_public': validated_data.get('is_public', True),
+        'max_students': validated_data.get('max_students', 0),  # 0 means unlimited
+        'enrolled_count': 0,
+        'created_at': datetime.utcnow(),
+        'updated_at': datetime.utcnow()
+    }
+
+
+def lesson_materials(modules, user_id):
+    """Material documents for the lessons of a create-course payload"""
+    now = datetime.utcnow()
+    materials = []
+    for module in modules or []:
+        for lesson in module.get('lessons', []):
+            if lesson.get('content') and lesson.get('title'):
+                materials.append({
+                    'title': lesson['title'],
+                    'description': lesson.get('description', ''),
+                    'type': lesson.get('type', 'video'),
+                    'content': lesson['content'],  # This is the video ID
+                    'order': lesson.get('order', 0),
+                    'is_required': lesson.get('is_required', False),
+                    'uploaded_by': user_id,
+                    'created_at': now
+                })
+    return materials
+
+
+def create_course_bundle(db, course, materials=(), assignments=(), user_id=None, blob_refs=()):
+    """
+    Insert a course with its materials and assignments in one transaction.
+
+    blob_refs lists the media blobs (one entry per reference) that the new
+    documents point at; their reference counts are taken in the same
+    transaction. Sets course_id on every child document and returns the new
+    course id.
+    """
+    course.setdefault('_id', ObjectId())
+    course_id = str(course['_id'])
+    materials, assignments = list(materials), list(assignments)
+    for document in materials + assignments:
+        document['course_id'] = course_id
+    refs_taken = []
+
+    def write(session):
+        refs_taken.clear()
+        db.courses.insert_one(course, session=session)
+        if materials:
+            db.materials.insert_many(materials, session=session)
+        if assignments:
+            db.assignments.insert_many(assignments, session=session)
+        db.users.update_one(
+            {'_id': ObjectId(user_id)},
+            {'$push': {'courses_created': course_id}},
+            session=session
+        )
+        for sha256 in blob_refs:
+            add_ref(db, sha256, session=session)
+            refs_taken.append(sha256)
+
+    def compensate():
+        for sha256 in refs_taken:
+            release_blob(db, sha256)
+        db.materials.delete_many({'course_id': course_id})
+        db.assignments.delete_many({'course_id': course_id})
+        db.courses.delete_one({'_id': course['_id']})
+        db.users.update_one({'_id': ObjectId(user_id)}, {'$pull': {'courses_created': course_id}})
+
+    run_in_transaction(db, write, compensate)
+    return course_id
+
+
+def _jsonable(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, dict):
+        return {k: _jsonable(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_jsonable(v) for v in value]
+    return value
+
+
+def export_course(db, course):
+    """Build the bundle for a course, without ids, students or per-term state"""
+    course_id = str(course['_id'])
+    started = course.get('created_at') or datetime.utcnow()
+
+    materials = [
+        {field: material[field] for field in MATERIAL_FIELDS if material.get(field) is not None}
+        for material in db.materials.find({'course_id': course_id}).sort([('order', 1), ('_id', 1)])
+    ]
+
+    assignments = []
+    for assignment in db.assignments.find({'course_id': course_id}).sort('due_date', 1):
+        item = {field: assignment[field] for field in ASSIGNMENT_FIELDS if field in assignment}
+        if isinstance(assignment.get('due_date'), datetime):
+            item['due_offset_days'] = round((assignment['due_date'] - started).total_seconds() / 86400, 3)
+        assignments.append(item)
+
+    return _jsonable({
+        'format': BUNDLE_FORMAT,
+        'version': BUNDLE_VERSION,
+        'exported_at': datetime.utcnow(),
+        'course': {field: course[field] for field in COURSE_FIELDS if field in course},
+        'materials': materials,
+        'assignments': assignments
+    })
+
+
+def bundle_archive(bundle):
+    """Zip a bundle as course.json; returns a file object positioned at the start"""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr(BUNDLE_FILENAME, json.dumps(bundle, indent=2))
+    buffer.seek(0)
+    return buffer
+
+
+def load_bundle(data=None, upload=None):
+    """Read a bundle from a parsed JSON body or an uploaded .json/.zip file"""
+    if upload is not None:
+        raw = upload.read(MAX_BUNDLE_SIZE + 1)
+        if len(raw) > MAX_BUNDLE_SIZE:
+            raise BundleError('Bundle is too large', 413)
+
+        if zipfile.is_zipfile(io.BytesIO(raw)):
+            try:
+                with zipfile.ZipFile(io.BytesIO(raw)) as archive:
+                    info = archive.getinfo(BUNDLE_FILENAME)
+                    if info.file_size > MAX_BUNDLE_SIZE:
+                        raise BundleError('Bundle is too large', 413)
+                    raw = archive.read(info)
+            except KeyError:
+                raise BundleError(f'{BUNDLE_FILENAME} not found in archive')
+            except zipfile.BadZipFile:
+                raise BundleError('Archive is corrupted')
+
+        try:
+            data = json.loads(raw)
+        except ValueError:
+            raise BundleError('Bundle is not valid JSON')
+
+    if not isinstance(data, dict) or data.get('format') != BUNDLE_FORMAT:
+        raise BundleError('Not a course bundle')
+    if data.get('version') != BUNDLE_VERSION:
+        raise BundleError(f'Unsupported bundle version: {data.get("version")}')
+    if not isinstance(data.get('course'), dict):
+        raise BundleError('Bundle has no course')
+    if not isinstance(data.get('materials', []), list) or not isinstance(data.get('assignments', []), list):
+        raise BundleError('materials and assignments must be lists')
+    if len(data.get('materials', [])) > MAX_BUNDLE_MATERIALS:
+        raise BundleError(f'A bundle can hold at most {MAX_BUNDLE_MATERIALS} materials')
+    if len(data.get('assignments', [])) > MAX_BUNDLE_ASSIGNMENTS:
+        raise BundleError(f'A bundle can hold at most {MAX_BUNDLE_ASSIGNMENTS} assignments')
+    return data
+
+
+def parse_term_start(value):
+    """Parse an ISO date for the new term as naive UTC"""
+    if not value:
+        return None
+    term_start = validate_date(value, 'term_start')
+    if term_start.tzinfo:
+        term_start = term_start.astimezone(timezone.utc).replace(tzinfo=None)
+    return term_start
+
+
+def _clone_material(item, index, blobs, user_id, course_id, now):
+    """Material document for a bundle entry, or None when its media is not available"""
+    if not isinstance(item, dict):
+        raise ValidationError(f'materials[{index}] must be an object', f'materials[{index}]')
+    try:
+        material = validate_material_data({
+            field: item[field] for field in ('title', 'description', 'content', 'order', 'is_required')
+            if field in item
+        })
+    except ValidationError as e:
+        raise ValidationError(f'materials[{index}]: {e.message}', f'materials[{index}].{e.field}')
+
+    if 'title' not in material:
+        raise ValidationError(f'materials[{index}]: title is required', f'materials[{index}].title')
+    material_type = item.get('type', 'document')
+    if material_type not in MATERIAL_TYPES:
+        raise ValidationError(f'materials[{index}]: unknown type {material_type}', f'materials[{index}].type')
+
+    material.update({
+        'type': material_type,
+        'description': material.get('description', ''),
+        'order': material.get('order', 0),
+        'is_required': material.get('is_required', False),
+        'uploaded_by': user_id,
+        'created_at': now
+    })
+    if isinstance(item.get('duration'), str):
+        material['duration'] = sanitize_string(item['duration'], max_length=100)
+    for field in ('duration_seconds', 'bitrate', 'width', 'height'):
+        if isinstance(item.get(field), (int, float)) and not isinstance(item.get(field), bool):
+            material[field] = item[field]
+
+    sha256 = item.get('blob_sha256')
+    if not sha256:
+        return material
+    blob = blobs.get(sha256)
+    if not blob:
+        return None
+
+    # File locations always come from the blob record, never from the bundle
+    material.update({
+        'blob_sha256': sha256,
+        'storage_key': blob['key'],
+        'file_path': get_storage().local_path(blob['key']),
+        'file_size': blob.get('size')
+    })
+    if material_type == 'video':
+        filename = f"{course_id}_{index}_{sha256[:12]}.{blob.get('extension', 'mp4')}"
+        material.update({
+            'filename': filename,
+            'url': f'/api/courses/videos/{filename}',
+            'views': 0,
+            'completion_count': 0
+        })
+    elif material_type == 'image':
+        material.update({'url': variant_url(sha256, '1280.webp'), 'variants': variant_urls(sha256)})
+    return material
+
+
+def _clone_assignment(item, index, user_id, term_start):
+    if not isinstance(item, dict):
+        raise ValidationError(f'assignments[{index}] must be an object', f'assignments[{index}]')
+    try:
+        validated = validate_assignment_data({field: item[field] for field in ASSIGNMENT_FIELDS if field in item})
+    except ValidationError as e:
+        raise ValidationError(f'assignments[{index}]: {e.message}', f'assignments[{index}].{e.field}')
+
+    for field in ('title', 'description'):
+        if field not in validated:
+            raise ValidationError(f'assignments[{index}]: {field} is required', f'assignments[{index}].{field}')
+
+    offset = item.get('due_offset_days')
+    due_date = term_start + timedelta(days=offset) if isinstance(offset, (int, float)) else None
+    now = datetime.utcnow()
+    return {
+        **validated,
+        'due_date': due_date,
+        'instructions': validated.get('instructions', ''),
+        'max_points': validated.get('max_points', 100),
+        'submission_type': validated.get('submission_type', 'file'),
+        'allowed_file_types': validated.get('allowed_file_types', []),
+        'max_file_size': validated.get('max_file_size', 10),
+        'is_active': True,
+        'created_by': user_id,
+        'created_at': now,
+        'updated_at': now
+    }
+
+
+def reachable_blobs(db, user_id, shas):
+    """
+    The blobs among shas that user_id can already reach: media of the courses
+    they teach and videos they uploaded
+    """
+    shas = [sha256 for sha256 in shas if isinstance(sha256, str)]
+    if not shas:
+        return set()
+    course_ids = [str(course['_id']) for course in db.courses.find({'teacher_id': user_id}, {'_id': 1})]
+    reachable = set(db.materials.distinct(
+        'blob_sha256', {'course_id': {'$in': course_ids}, 'blob_sha256': {'$in': shas}}
+    ))
+    reachable.update(db.courses.distinct(
+        'thumbnail_sha256', {'teacher_id': user_id, 'thumbnail_sha256': {'$in': shas}}
+    ))
+    reachable.update(db.videos.distinct(
+        'blobSha256', {'uploadedBy': ObjectId(user_id), 'blobSha256': {'$in': shas}}
+    ))
+    return reachable
+
+
+def import_course(db, bundle, user_id, term_start=None, title=None, is_admin=False):
+    """
+    Create a new course owned by user_id from a bundle.
+
+    Media are only cloned from blobs the user can already reach (any blob for
+    admins), so a bundle cannot name another course's files by their hash.
+    Returns (course, materials, assignments, skipped); skipped lists the
+    materials whose media files are not available to the user.
+    """
+    term_start = term_start or datetime.utcnow()
+    source = dict(bundle['course'])
+    if title:
+        source['title'] = title
+
+    validated_data = validate_course_data({field: source[field] for field in COURSE_FIELDS if field in source})
+    for field in ('title', 'description', 'category'):
+        if field not in validated_data:
+            raise ValidationError(f'{field} is required', field)
+
+    entries = bundle.get('materials', [])
+    shas = {item.get('blob_sha256') for item in entries if isinstance(item, dict) and item.get('blob_sha256')}
+    if source.get('thumbnail_sha256'):
+        shas.add(source['thumbnail_sha256'])
+    if not is_admin:
+        shas = reachable_blobs(db, user_id, shas)
+    blobs = {
+        blob['_id']: blob
+        for blob in db.media_blobs.find({'_id': {'$in': [s for s in shas if isinstance(s, str)]},
+                                         'deleting_at': {'$exists': False}},
+                                        {'key': 1, 'size': 1, 'extension': 1})
+    } if shas else {}
+
+    course = new_course(validated_data, user_id)
+    course['_id'] = ObjectId()
+    course_id = str(course['_id'])
+
+    thumbnail_sha = source.get('thumbnail_sha256')
+    if thumbnail_sha in blobs:
+        course.update({
+            'thumbnail': variant_url(thumbnail_sha),
+            'thumbnail_sha256': thumbnail_sha,
+            'thumbnail_variants': variant_urls(thumbnail_sha)
+        })
+    elif course['thumbnail'].startswith('/api/courses/images/'):
+        course['thumbnail'] = ''
+
+    now = datetime.utcnow()
+    materials, skipped = [], []
+    for index, item in enumerate(entries):
+        material = _clone_material(item, index, blobs, user_id, course_id, now)
+        if material is None:
+            skipped.append({'index': index, 'title': item.get('title'), 'reason': 'Media file is not available'})
+        else:
+            materials.append(material)
+
+    assignments = [
+        _clone_assignment(item, index, user_id, term_start)
+        for index, item in enumerate(bundle.get('assignments', []))
+    ]
+
+    # The new documents reference the shared blobs; count them with the inserts
+    blob_refs = [material['blob_sha256'] for material in materials if material.get('blob_sha256')]
+    if course.get('thumbnail_sha256'):
+        blob_refs.append(course['thumbnail_sha256'])
+
+    create_course_bundle(db, course, materials, assignments, user_id, blob_refs)
+
+    return course, materials, assignments, skipped
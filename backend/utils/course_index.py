@@ -0,0 +1,301 @@
+"""
+Lexical retrieval over course materials for grounded Q&A.
+
+Each course has a BM25 index over its materials: the title, description and
+text content of every material, plus the extracted text of PDF materials.
+The text is cut into overlapping passages of about ``PASSAGE_WORDS`` words.
+Every passage is stored with its sparse term-frequency vector, as one gzipped
+JSON document per course in the ``course_indexes`` collection, so the AI
+workers and every web instance see the same index; document frequencies come
+from the postings lists built when the index is loaded.
+
+The index is kept current incrementally by the AI workers: the routes that
+add materials queue a ``course_index`` job (see utils.ai_jobs), and
+``sync_course_index`` compares every material's fingerprint (its
+``updated_at`` or ``created_at``) with one projected query, re-indexing only
+the materials that were added, changed or removed since the index was
+saved. Tokenizing and PDF extraction therefore never run in a request.
+
+Searches only read the last saved index: until the job has run, questions are
+answered from the previous index, and a course without an index gets no
+excerpts and queues a build. Loaded indexes are kept per process, with
+postings lists built at load time; every save gets a new ``revision``, which
+a search checks with a projected query before reloading. A search only
+scores the passages that contain a query term - milliseconds, with no
+external service.
+"""
+import gzip
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter, defaultdict
+from datetime import datetime
+
+from bson import Binary, ObjectId
+from pymongo.errors import DuplicateKeyError
+
+from utils.ai_jobs import enqueue_job, QUEUED, PRIORITY_NORMAL
+from utils.chunked_upload import UPLOAD_TMP_FOLDER
+from utils.pdf_text import extract_pdf_text, PDFError
+from utils.storage import get_storage
+
+INDEX_VERSION = 1
+PASSAGE_WORDS = 120
+PASSAGE_OVERLAP = 30
+TOP_K = int(os.getenv('COURSE_INDEX_TOP_K', 4))
+# Characters of a PDF material that are indexed
+PDF_INDEX_CHARS = int(os.getenv('COURSE_INDEX_PDF_CHARS', 200000))
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+TOKEN_RE = re.compile(r'[a-z0-9]+')
+STOPWORDS = frozenset("""
+a an and are as at be but by can do does for from has have how i if in into is it its
+of on or so such than that the their then there these this to was what when where which
+who why will with you your
+""".split())
+
+_lock = threading.Lock()
+_course_locks = defaultdict(threading.Lock)
+# course_id -> (revision, index, postings)
+_loaded = {}
+
+
+def tokenize(text):
+    """Lowercase terms of text without stopwords and single characters"""
+    terms = []
+    for term in TOKEN_RE.findall(text.lower()):
+        if len(term) < 2 or term in STOPWORDS:
+            continue
+        # Crude plural folding so "arrays" finds "array"
+        if len(term) > 4 and term.endswith('s') and not term.endswith('ss'):
+            term = term[:-1]
+        terms.append(term)
+    return terms
+
+
+def _empty_index():
+    return {'version': INDEX_VERSION, 'materials': {}, 'passages': []}
+
+
+def _postings(index):
+    """term -> [(passage number, term frequency)]"""
+    postings = defaultdict(list)
+    for number, passage in enumerate(index['passages']):
+        for term, tf in passage['tf'].items():
+            postings[term].append((number, tf))
+    return postings
+
+
+def _remember(course_id, revision, index):
+    entry = (revision, index, _postings(index))
+    _loaded[course_id] = entry
+    return entry
+
+
+def _load(db, course_id):
+    """(revision, index, postings) of a course, from memory or the database"""
+    stored = db.course_indexes.find_one({'_id': course_id}, {'revision': 1, 'version': 1})
+    if not stored or stored.get('version') != INDEX_VERSION:
+        return None, _empty_index(), {}
+
+    cached = _loaded.get(course_id)
+    if cached and cached[0] == stored['revision']:
+        return cached
+
+    stored = db.course_indexes.find_one({'_id': course_id})
+    if not stored:
+        return None, _empty_index(), {}
+    try:
+        index = json.loads(gzip.decompress(stored['data']).decode('utf-8'))
+    except (OSError, ValueError) as e:
+        print(f"Discarding unreadable index of course {course_id}: {e}")
+        return None, _empty_index(), {}
+    return _remember(course_id, stored['revision'], index)
+
+
+def _save(db, course_id, revision, index):
+    """
+    Store the index unless another worker saved a newer one since `revision`
+    was loaded (None: no usable index yet); returns (revision, index,
+    postings), or None if the other worker's index was kept
+    """
+    document = {
+        'version': INDEX_VERSION,
+        'revision': ObjectId(),
+        'data': Binary(gzip.compress(json.dumps(index, separators=(',', ':')).encode('utf-8'))),
+        'updated_at': datetime.utcnow()
+    }
+    try:
+        if revision is None:
+            # A first build (or one replacing an outdated index) holds every material
+            saved = True
+            db.course_indexes.replace_one({'_id': course_id}, document, upsert=True)
+        else:
+            saved = db.course_indexes.update_one(
+                {'_id': course_id, 'revision': revision}, {'$set': document}
+            ).matched_count == 1
+    except DuplicateKeyError:
+        saved = False
+    if not saved:
+        return None
+    return _remember(course_id, document['revision'], index)
+
+
+def material_fingerprint(material):
+    changed = material.get('updated_at') or material.get('created_at')
+    return changed.isoformat() if changed else ''
+
+
+def _pdf_text(db, material):
+    """Extracted text of a PDF material stored as a blob, or ''"""
+    storage = get_storage()
+    source = storage.local_path(material['storage_key'])
+    downloaded = None
+    try:
+        if source is None:
+            source = downloaded = os.path.join(UPLOAD_TMP_FOLDER, f'{os.urandom(8).hex()}.pdf')
+            storage.download_file(material['storage_key'], source)
+        with open(source, 'rb') as f:
+            return extract_pdf_text(db, f.read(), budget=PDF_INDEX_CHARS)
+    except (OSError, PDFError) as e:
+        print(f"Could not index PDF material {material['_id']}: {e}")
+        return ''
+    finally:
+        if downloaded and os.path.exists(downloaded):
+            os.remove(downloaded)
+
+
+def material_body(db, material):
+    """Text of a material itself: inline content and the text of an uploaded PDF"""
+    parts = []
+    content = material.get('content')
+    if isinstance(content, str) and not content.startswith(('http://', 'https://')):
+        parts.append(content)
+    if material.get('storage_key', '').lower().endswith('.pdf'):
+        parts.append(_pdf_text(db, material))
+    return '\n'.join(part for part in parts if part)
+
+
+def material_text(db, material):
+    """All searchable text of a material"""
+    parts = [material.get('title', ''), material.get('description', ''), material_body(db, material)]
+    return '\n'.join(part for part in parts if part)
+
+
+def passages(text, size=PASSAGE_WORDS, overlap=PASSAGE_OVERLAP):
+    """Overlapping windows of about `size` words"""
+    words = text.split()
+    if len(words) <= size:
+        return [' '.join(words)] if words else []
+    step = size - overlap
+    return [' '.join(words[start:start + size]) for start in range(0, len(words) - overlap, step)]
+
+
+def _remove_material(index, material_id):
+    index['passages'] = [p for p in index['passages'] if p['m'] != material_id]
+    index['materials'].pop(material_id, None)
+
+
+def _add_material(index, material, text, fingerprint):
+    material_id = str(material['_id'])
+    for passage_text in passages(text):
+        tf = Counter(tokenize(passage_text))
+        if not tf:
+            continue
+        index['passages'].append({
+            'm': material_id,
+            't': material.get('title', ''),
+            'x': passage_text,
+            'tf': tf,
+            'n': sum(tf.values())
+        })
+    index['materials'][material_id] = fingerprint
+
+
+def sync_course_index(db, course_id):
+    """
+    Bring the course's index up to date with its materials; returns
+    (revision, index, postings).
+    """
+    with _lock:
+        course_lock = _course_locks[course_id]
+    with course_lock:
+        while True:
+            loaded = _load(db, course_id)
+            revision, index = loaded[0], loaded[1]
+            current = {
+                str(m['_id']): material_fingerprint(m)
+                for m in db.materials.find({'course_id': course_id}, {'created_at': 1, 'updated_at': 1})
+            }
+            removed = [mid for mid in index['materials'] if mid not in current]
+            changed = [mid for mid, fingerprint in current.items() if index['materials'].get(mid) != fingerprint]
+            if revision is not None and not removed and not changed:
+                return loaded
+
+            # Work on a copy so concurrent searches never see a partial update
+            index = json.loads(json.dumps(index))
+            for material_id in removed + changed:
+                _remove_material(index, material_id)
+            for material in db.materials.find({'_id': {'$in': [ObjectId(mid) for mid in changed]}}):
+                _add_material(index, material, material_text(db, material), current[str(material['_id'])])
+
+            saved = _save(db, course_id, revision, index)
+            if saved:
+                print(f"Indexed course {course_id}: {len(changed)} materials updated, {len(removed)} removed")
+                return saved
+            # Another worker saved first; start again from its index
+
+
+def queue_course_index(db, course_id):
+    """Have an AI worker bring the course's index up to date"""
+    try:
+        if db.ai_jobs.find_one({'kind': 'course_index', 'payload.course_id': course_id, 'status': QUEUED}, {'_id': 1}):
+            return
+        enqueue_job(db, 'course_index', {'course_id': course_id}, priority=PRIORITY_NORMAL)
+    except Exception as e:
+        print(f"Could not queue index update for course {course_id}: {e}")
+
+
+def search_course(db, course_id, query, k=TOP_K):
+    """
+    Top-k passages of the course's materials for a question, best first, as
+    [{material_id, title, text, score}], from the last saved index.
+    """
+    terms = set(tokenize(query))
+    if not terms:
+        return []
+
+    revision, index, postings = _load(db, course_id)
+    if revision is None:
+        # Never built (or unreadable): answer without excerpts this time
+        queue_course_index(db, course_id)
+        return []
+    all_passages = index['passages']
+    if not all_passages:
+        return []
+    count = len(all_passages)
+    average_length = sum(p['n'] for p in all_passages) / count
+
+    scores = defaultdict(float)
+    for term in terms:
+        if term not in postings:
+            continue
+        df = len(postings[term])
+        idf = math.log(1 + (count - df + 0.5) / (df + 0.5))
+        for number, tf in postings[term]:
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * all_passages[number]['n'] / average_length)
+            scores[number] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+
+    best = sorted(scores, key=scores.get, reverse=True)[:k]
+    return [
+        {
+            'material_id': all_passages[number]['m'],
+            'title': all_passages[number]['t'],
+            'text': all_passages[number]['x'],
+            'score': round(scores[number], 4)
+        }
+        for number in best
+    ]
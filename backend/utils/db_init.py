@@ -42,6 +42,14 @@ def create_indexes(db):
     db.courses.create_index("teacher_id")
     db.courses.create_index("category")
     db.courses.create_index("is_active")
+    # Popular courses fill recommendations when co-enrollment runs out
+    db.courses.create_index([("is_active", 1), ("enrolled_count", -1)])
+    # Catalog search; a collection can only have one text index
+    db.courses.create_index(
+        [("title", "text"), ("description", "text"), ("category", "text"), ("learning_objectives", "text")],
+        name="course_catalog_text",
+        weights={"title": 10, "learning_objectives": 4, "category": 3, "description": 1}
+    )
     
     # Enrollments collection indexes
     db.enrollments.create_index([("student_id", 1), ("course_id", 1)], unique=True)
@@ -55,6 +63,17 @@ def create_indexes(db):
     # Submissions collection indexes
     db.submissions.create_index([("assignment_id", 1), ("student_id", 1)], unique=True)
     db.submissions.create_index("student_id")
+    # Grading queue: only ungraded submissions are indexed
+    db.submissions.create_index(
+        [("teacher_id", 1), ("due_date", 1), ("submitted_at", 1), ("_id", 1)],
+        name="grading_queue_teacher",
+        partialFilterExpression={"status": "submitted"}
+    )
+    db.submissions.create_index(
+        [("course_id", 1), ("due_date", 1), ("submitted_at", 1), ("_id", 1)],
+        name="grading_queue_course",
+        partialFilterExpression={"status": "submitted"}
+    )
     
 
     
@@ -62,6 +81,36 @@ def create_indexes(db):
     db.chat_history.create_index("user_id")
     db.chat_history.create_index("timestamp")
     
+    # Cached AI responses expire on their own
+    db.ai_response_cache.create_index("expires_at", expireAfterSeconds=0)  # TTL index
+    
+    # Extracted PDF text by file hash
+    db.pdf_text_cache.create_index("expires_at", expireAfterSeconds=0)  # TTL index
+    
+    # Queued AI requests, claimed in priority/fairness order
+    db.ai_jobs.create_index([("status", 1), ("priority", 1), ("turn", 1), ("created_at", 1)])
+    db.ai_jobs.create_index([("user_id", 1), ("status", 1)])
+    db.ai_jobs.create_index("expires_at", expireAfterSeconds=0)  # TTL index
+    
+    # Material completions (one document per student and material)
+    db.material_completions.create_index([("material_id", 1), ("student_id", 1)], unique=True)
+    db.material_completions.create_index([("student_id", 1), ("course_id", 1)])
+    
+    # Course outlines list materials in order
+    db.materials.create_index([("course_id", 1), ("order", 1)])
+    # Precomputed summaries are shared between copies of the same handout
+    db.materials.create_index("ai_summary.content_hash", sparse=True)
+    
+    # Media blob references
+    db.media_blobs.create_index("ref_count")
+    db.videos.create_index("blobSha256", sparse=True)
+    db.materials.create_index("blob_sha256", sparse=True)
+    db.courses.create_index("thumbnail_sha256", sparse=True)
+    
+    # Resumable upload sessions
+    db.upload_sessions.create_index("user_id")
+    db.upload_sessions.create_index("expires_at", expireAfterSeconds=0)  # TTL index
+    
     # Password reset tokens indexes
     db.password_resets.create_index("token_hash", unique=True)
     db.password_resets.create_index("user_id")
@@ -0,0 +1,310 @@
+"""
+Course enrollment with a seat counter.
+
+Each course keeps an ``enrolled_count``. A seat is reserved with one
+conditional ``find_one_and_update`` (only while ``enrolled_count <
+max_students``), so concurrent enrollments can never overbook a course.
+Existing enrollments are looked up before a seat is taken, so retries do not
+hold seats, and concurrent duplicates are still rejected by the unique
+(student_id, course_id) index on ``enrollments``. A client may send an
+idempotency key; a retry carrying the same key gets the original success
+back instead of a conflict.
+
+Cohorts are enrolled with ``bulk_enroll``: students are resolved with a single
+query, students who are already enrolled are dropped with one ``$in`` lookup,
+seats for the remaining new students are reserved at once and their
+enrollments are written with one unordered ``bulk_write``. Re-submitting a
+roster therefore only needs seats for the students that are actually new.
+"""
+from datetime import datetime
+
+from bson import ObjectId
+from pymongo import InsertOne, ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+BACKFILL_ATTEMPTS = 5
+
+
+class EnrollmentError(Exception):
+    """Raised when a student cannot be enrolled"""
+    def __init__(self, message, status_code=400):
+        self.message = message
+        self.status_code = status_code
+        super().__init__(self.message)
+
+
+def new_enrollment(course_id, student_id, idempotency_key=None):
+    enrollment = {
+        'course_id': course_id,
+        'student_id': student_id,
+        'enrolled_at': datetime.utcnow(),
+        'progress': 0,
+        'completed_materials': [],
+        'completed_assignments': [],
+        'is_active': True
+    }
+    if idempotency_key:
+        enrollment['idempotency_key'] = idempotency_key
+    return enrollment
+
+
+def reserve_seats(db, course_id, seats=1):
+    """
+    Atomically take `seats` seats on an active course.
+
+    Returns the course (title, max_students, enrolled_count) or None when the
+    course is missing, inactive or does not have enough free seats.
+    """
+    return db.courses.find_one_and_update(
+        {
+            '_id': ObjectId(course_id),
+            'is_active': {'$ne': False},
+            '$or': [
+                {'max_students': {'$not': {'$gt': 0}}},  # 0 or missing means unlimited
+                {'$expr': {'$lte': [{'$add': [{'$ifNull': ['$enrolled_count', 0]}, seats]}, '$max_students']}}
+            ]
+        },
+        {'$inc': {'enrolled_count': seats}},
+        projection={'title': 1, 'max_students': 1, 'enrolled_count': 1},
+        return_document=ReturnDocument.AFTER
+    )
+
+
+def release_seats(db, course_id, seats=1):
+    if seats:
+        db.courses.update_one({'_id': ObjectId(course_id)}, {'$inc': {'enrolled_count': -seats}})
+
+
+def _check_duplicate(db, course_id, student_id, idempotency_key):
+    """
+    Look for an existing enrollment.
+
+    Returns True when it was created by a request with the same idempotency
+    key (a replay), raises a 409 for any other existing enrollment and
+    returns False when there is none.
+    """
+    existing = db.enrollments.find_one(
+        {'course_id': course_id, 'student_id': student_id},
+        {'idempotency_key': 1}
+    )
+    if not existing:
+        return False
+    if idempotency_key and existing.get('idempotency_key') == idempotency_key:
+        return True
+    raise EnrollmentError('Already enrolled in this course', 409)
+
+
+def enroll_student(db, course_id, student_id, idempotency_key=None):
+    """
+    Enroll one student.
+
+    Returns (course, created); created is False when the request replays an
+    earlier one with the same idempotency key.
+    """
+    # Replays and duplicates are answered before a seat is taken, so retries
+    # cannot fill a course that is close to capacity
+    if _check_duplicate(db, course_id, student_id, idempotency_key):
+        course = db.courses.find_one({'_id': ObjectId(course_id)}, {'title': 1, 'is_active': 1})
+        if not course:
+            raise EnrollmentError('Course not found', 404)
+        return course, False
+
+    course = reserve_seats(db, course_id)
+    if course is None:
+        course = db.courses.find_one({'_id': ObjectId(course_id)}, {'title': 1, 'is_active': 1})
+        if not course:
+            raise EnrollmentError('Course not found', 404)
+        if not course.get('is_active', True):
+            raise EnrollmentError('Course is not active')
+        raise EnrollmentError('Course is full')
+
+    try:
+        db.enrollments.insert_one(new_enrollment(course_id, student_id, idempotency_key))
+    except DuplicateKeyError:
+        release_seats(db, course_id)
+        if _check_duplicate(db, course_id, student_id, idempotency_key):
+            return course, False
+        # The conflicting enrollment disappeared in between; let the client retry
+        raise EnrollmentError('Enrollment changed concurrently, please retry', 409)
+
+    # Bumping ai_context_rev refreshes the AI assistant's cached context
+    db.users.update_one(
+        {'_id': ObjectId(student_id)},
+        {'$addToSet': {'enrolled_courses': course_id}, '$inc': {'ai_context_rev': 1}}
+    )
+    return course, True
+
+
+def classify_identifiers(identifiers):
+    """Split raw identifiers into student ids, emails and roll numbers"""
+    ids, emails, roll_numbers = [], [], []
+    for identifier in identifiers:
+        if ObjectId.is_valid(identifier):
+            ids.append(identifier)
+        elif '@' in identifier:
+            emails.append(identifier.lower())
+        else:
+            roll_numbers.append(identifier)
+    return ids, emails, roll_numbers
+
+
+def resolve_students(db, identifiers):
+    """
+    Resolve student ids, emails or roll numbers with one query.
+
+    Returns (students, not_found, not_students) where students maps a user id
+    to its user document, in request order and without duplicates.
+    """
+    ids, emails, roll_numbers = classify_identifiers(identifiers)
+    clauses = []
+    if ids:
+        clauses.append({'_id': {'$in': [ObjectId(i) for i in ids]}})
+    if emails:
+        clauses.append({'email': {'$in': emails}})
+    if roll_numbers:
+        clauses.append({'roll_number': {'$in': roll_numbers}})
+        clauses.append({'roll_no': {'$in': roll_numbers}})
+
+    users = list(db.users.find({'$or': clauses}, {'name': 1, 'email': 1, 'role': 1, 'roll_number': 1, 'roll_no': 1})) \
+        if clauses else []
+
+    lookup = {}
+    for user in users:
+        lookup[str(user['_id'])] = user
+        lookup[user.get('email', '').lower()] = user
+        for field in ('roll_number', 'roll_no'):
+            if user.get(field):
+                lookup.setdefault(user[field], user)
+
+    students, not_found, not_students = {}, [], []
+    for identifier in identifiers:
+        user = lookup.get(identifier.lower() if '@' in identifier else identifier)
+        if not user:
+            not_found.append(identifier)
+        elif user.get('role') != 'student':
+            not_students.append(identifier)
+        else:
+            students.setdefault(str(user['_id']), user)
+    return students, not_found, not_students
+
+
+def bulk_enroll(db, course_id, student_ids):
+    """
+    Enroll many students at once.
+
+    Returns (enrolled, already_enrolled) lists of student ids. Raises when the
+    course cannot take the whole batch.
+    """
+    student_ids = list(dict.fromkeys(student_ids))
+    if not student_ids:
+        return [], []
+
+    existing = {
+        e['student_id'] for e in db.enrollments.find(
+            {'course_id': course_id, 'student_id': {'$in': student_ids}}, {'student_id': 1, '_id': 0}
+        )
+    }
+    already_enrolled = [student_id for student_id in student_ids if student_id in existing]
+    student_ids = [student_id for student_id in student_ids if student_id not in existing]
+    if not student_ids:
+        return [], already_enrolled
+
+    course = reserve_seats(db, course_id, len(student_ids))
+    if course is None:
+        course = db.courses.find_one({'_id': ObjectId(course_id)}, {'is_active': 1, 'max_students': 1, 'enrolled_count': 1})
+        if not course:
+            raise EnrollmentError('Course not found', 404)
+        if not course.get('is_active', True):
+            raise EnrollmentError('Course is not active')
+        available = max(0, course['max_students'] - course.get('enrolled_count', 0))
+        raise EnrollmentError(f'Not enough seats: {available} available, {len(student_ids)} requested')
+
+    failed = set()
+    try:
+        db.enrollments.bulk_write(
+            [InsertOne(new_enrollment(course_id, student_id)) for student_id in student_ids],
+            ordered=False
+        )
+    except BulkWriteError as e:
+        errors = e.details.get('writeErrors', [])
+        failed = {error['index'] for error in errors}
+        if any(error.get('code') != 11000 for error in errors):
+            release_seats(db, course_id, len(failed))
+            raise
+
+    # Seats reserved for students enrolled concurrently since the lookup go back
+    release_seats(db, course_id, len(failed))
+
+    enrolled = [student_id for i, student_id in enumerate(student_ids) if i not in failed]
+    already_enrolled += [student_id for i, student_id in enumerate(student_ids) if i in failed]
+
+    if enrolled:
+        db.users.update_many(
+            {'_id': {'$in': [ObjectId(student_id) for student_id in enrolled]}},
+            {'$addToSet': {'enrolled_courses': course_id}, '$inc': {'ai_context_rev': 1}}
+        )
+    return enrolled, already_enrolled
+
+
+def unenroll_student(db, course_id, student_id):
+    """Remove an enrollment and give its seat back; returns False if there was none"""
+    result = db.enrollments.delete_one({'course_id': course_id, 'student_id': student_id})
+    if not result.deleted_count:
+        return False
+
+    release_seats(db, course_id)
+    db.users.update_one(
+        {'_id': ObjectId(student_id)},
+        {'$pull': {'enrolled_courses': course_id}, '$inc': {'ai_context_rev': 1}}
+    )
+    return True
+
+
+def _correct_enrolled_count(db, course_id):
+    """
+    Set a course's enrolled_count to its number of enrollments unless
+    reserve_seats changed the counter since it was read, in which case both
+    are read again. Returns True when the counter was corrected.
+    """
+    for _ in range(BACKFILL_ATTEMPTS):
+        course = db.courses.find_one({'_id': course_id}, {'enrolled_count': 1})
+        if not course:
+            return False
+        count = db.enrollments.count_documents({'course_id': str(course_id)})
+        if course.get('enrolled_count') == count:
+            return False
+        result = db.courses.update_one(
+            {'_id': course_id, 'enrolled_count': course.get('enrolled_count')},
+            {'$set': {'enrolled_count': count}}
+        )
+        if result.modified_count:
+            return True
+    print(f"enrolled_count of course {course_id} kept changing; left as it is")
+    return False
+
+
+def backfill_enrolled_counts(db):
+    """
+    Recompute enrolled_count for every course from the enrollments collection.
+
+    Runs while the previous release still serves traffic, so each counter is
+    only replaced if it still holds the value that was read.
+    """
+    try:
+        counts = {
+            row['_id']: row['count']
+            for row in db.enrollments.aggregate([{'$group': {'_id': '$course_id', 'count': {'$sum': 1}}}])
+        }
+        updated = 0
+        for course in db.courses.find({}, {'enrolled_count': 1}):
+            # The aggregate only picks the candidates; each is re-read before the update
+            if course.get('enrolled_count') != counts.get(str(course['_id']), 0) and \
+                    _correct_enrolled_count(db, course['_id']):
+                updated += 1
+
+        print(f"Updated enrolled_count on {updated} courses")
+        return updated
+
+    except Exception as e:
+        print(f"Error during enrollment count backfill: {e}")
+        return 0
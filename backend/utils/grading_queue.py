@@ -0,0 +1,108 @@
+"""
+Teacher grading queue.
+
+Submissions carry the course teacher's id and the assignment due date (copied
+at submit time), so ungraded work can be listed straight from a partial index
+on ``status: 'submitted'`` in priority order - earliest due date first, then
+oldest submission - without touching graded history. Pages are fetched with
+a keyset cursor over (due_date, submitted_at, _id) instead of skip/limit.
+"""
+import base64
+import json
+from datetime import datetime
+
+from bson import ObjectId
+from bson.errors import InvalidId
+
+QUEUE_SORT = [('due_date', 1), ('submitted_at', 1), ('_id', 1)]
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+class CursorError(Exception):
+    """Raised when a client sends a cursor that cannot be decoded"""
+
+
+def encode_cursor(submission):
+    position = {
+        'due_date': submission['due_date'].isoformat() if submission.get('due_date') else None,
+        'submitted_at': submission['submitted_at'].isoformat(),
+        'id': str(submission['_id'])
+    }
+    return base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        position = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        due_date = datetime.fromisoformat(position['due_date']) if position['due_date'] else None
+        return due_date, datetime.fromisoformat(position['submitted_at']), ObjectId(position['id'])
+    except (ValueError, KeyError, TypeError, InvalidId):
+        raise CursorError('Invalid cursor')
+
+
+def after_cursor(due_date, submitted_at, submission_id):
+    """Filter matching every queue entry that sorts after the given position"""
+    # Submissions without a due date sort first, before every dated one;
+    # {'$gt': None} would match nothing
+    later_due = {'$ne': None} if due_date is None else {'$gt': due_date}
+    return {'$or': [
+        {'due_date': later_due},
+        {'due_date': due_date, 'submitted_at': {'$gt': submitted_at}},
+        {'due_date': due_date, 'submitted_at': submitted_at, '_id': {'$gt': submission_id}}
+    ]}
+
+
+def pending_submissions(db, teacher_id=None, course_id=None, cursor=None, limit=DEFAULT_PAGE_SIZE):
+    """
+    Return one page of ungraded submissions and the cursor for the next page.
+    """
+    query = {'status': 'submitted'}
+    if teacher_id:
+        query['teacher_id'] = teacher_id
+    if course_id:
+        query['course_id'] = course_id
+    if cursor:
+        query.update(after_cursor(*decode_cursor(cursor)))
+
+    page = list(db.submissions.find(query, {'text_content': 0}).sort(QUEUE_SORT).limit(limit + 1))
+    next_cursor = encode_cursor(page[limit - 1]) if len(page) > limit else None
+    return page[:limit], next_cursor
+
+
+def backfill_queue_fields(db):
+    """Copy teacher_id and due_date onto submissions created before they were stored"""
+    try:
+        assignment_ids = db.submissions.distinct('assignment_id', {'teacher_id': {'$exists': False}})
+        if not assignment_ids:
+            return 0
+
+        assignments = list(db.assignments.find(
+            {'_id': {'$in': [ObjectId(a) for a in assignment_ids if ObjectId.is_valid(a)]}},
+            {'course_id': 1, 'due_date': 1}
+        ))
+        courses = {
+            str(c['_id']): c['teacher_id']
+            for c in db.courses.find(
+                {'_id': {'$in': list({ObjectId(a['course_id']) for a in assignments})}},
+                {'teacher_id': 1}
+            )
+        }
+
+        updated = 0
+        for assignment in assignments:
+            result = db.submissions.update_many(
+                {'assignment_id': str(assignment['_id']), 'teacher_id': {'$exists': False}},
+                {'$set': {
+                    'teacher_id': courses.get(assignment['course_id']),
+                    'due_date': assignment.get('due_date')
+                }}
+            )
+            updated += result.modified_count
+
+        print(f"Backfilled grading queue fields on {updated} submissions")
+        return updated
+
+    except Exception as e:
+        print(f"Error during grading queue backfill: {e}")
+        return 0
@@ -0,0 +1,222 @@
+"""
+Resized variants for course thumbnails and image materials.
+
+Uploaded images are kept as blobs like any other media. WebP and JPEG variants
+at fixed widths are rendered by an ``image_variants`` job on the job queue
+(see utils.ai_jobs), so resizing never runs in a web worker, and stored under
+``variants/<aa>/<sha256>/<width>.<format>``; because the name is derived from
+the content hash a variant never changes and can be cached forever.
+
+Variants are rendered once per image: the blob is first claimed by setting
+``rendering_at`` with a conditional update and only the request that claimed
+it queues the job, so requests (in any process) that arrive before the
+variants exist are served the original and queue nothing.
+"""
+import os
+import re
+from datetime import datetime, timedelta
+
+from PIL import Image, ImageOps
+
+from utils.ai_jobs import enqueue_job, PRIORITY_NORMAL
+from utils.chunked_upload import UPLOAD_TMP_FOLDER
+from utils.media_store import store_blob, variant_prefix
+from utils.storage import get_storage
+
+IMAGE_EXTENSIONS = {'jpg', 'jpeg', 'png', 'webp'}
+MAX_IMAGE_SIZE = 10 * 1024 * 1024  # 10MB
+MAX_IMAGE_PIXELS = 40_000_000
+
+VARIANT_WIDTHS = (160, 320, 640, 1280)
+VARIANT_FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True})
+}
+VARIANT_NAMES = [f'{width}.{fmt}' for width in VARIANT_WIDTHS for fmt in VARIANT_FORMATS]
+DEFAULT_VARIANT = '640.webp'
+SHA256_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+# A render that has not finished by then is assumed to have died or never run
+RENDER_LEASE = timedelta(minutes=10)
+
+Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
+
+
+class ImageError(Exception):
+    """Raised when an uploaded file is not a usable image"""
+    def __init__(self, message, status_code=400):
+        self.message = message
+        self.status_code = status_code
+        super().__init__(self.message)
+
+
+def is_image_file(filename):
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in IMAGE_EXTENSIONS
+
+
+def variant_key(sha256, name):
+    return variant_prefix(sha256) + name
+
+
+def variant_url(sha256, name=DEFAULT_VARIANT):
+    return f'/api/courses/images/{sha256}/{name}'
+
+
+def variant_urls(sha256):
+    return {name: variant_url(sha256, name) for name in VARIANT_NAMES}
+
+
+def inspect_image(path):
+    """Check that a file is a decodable image and return (width, height)"""
+    try:
+        with Image.open(path) as img:
+            width, height = img.size
+            img.verify()
+    except (Image.DecompressionBombError, OSError, SyntaxError):
+        raise ImageError('File is not a valid image')
+
+    if width * height > MAX_IMAGE_PIXELS:
+        raise ImageError('Image dimensions are too large', 413)
+    return width, height
+
+
+def _normalize(img):
+    """Apply EXIF orientation and convert to RGB/RGBA"""
+    img = ImageOps.exif_transpose(img)
+    has_alpha = img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info)
+    return img.convert('RGBA' if has_alpha else 'RGB')
+
+
+def _flatten(img):
+    """JPEG has no alpha channel; composite onto white"""
+    if img.mode != 'RGBA':
+        return img
+    background = Image.new('RGB', img.size, (255, 255, 255))
+    background.paste(img, mask=img.getchannel('A'))
+    return background
+
+
+def render_variants(db, sha256):
+    """Render every missing variant of an image blob"""
+    blob = db.media_blobs.find_one({'_id': sha256})
+    if not blob or blob.get('extension') not in IMAGE_EXTENSIONS:
+        return []
+
+    storage = get_storage()
+    missing = [name for name in VARIANT_NAMES if not storage.exists(variant_key(sha256, name))]
+
+    if missing:
+        source = storage.local_path(blob['key'])
+        downloaded = None
+        if source is None:
+            source = downloaded = os.path.join(UPLOAD_TMP_FOLDER, f'{sha256}-{os.urandom(4).hex()}.source')
+            storage.download_file(blob['key'], source)
+
+        try:
+            with Image.open(source) as original:
+                img = _normalize(original)
+
+            for width in VARIANT_WIDTHS:
+                names = [name for name in missing if name.startswith(f'{width}.')]
+                if not names:
+                    continue
+
+                # Never upscale; small images get variants at their own size
+                resized = img
+                if img.width > width:
+                    resized = img.resize((width, max(1, round(img.height * width / img.width))),
+                                         Image.LANCZOS, reducing_gap=3.0)
+
+                for name in names:
+                    fmt = name.split('.', 1)[1]
+                    pil_format, options = VARIANT_FORMATS[fmt]
+                    output = _flatten(resized) if pil_format == 'JPEG' else resized
+                    temp_path = os.path.join(UPLOAD_TMP_FOLDER, f'{sha256}-{os.urandom(4).hex()}-{name}')
+                    output.save(temp_path, pil_format, **options)
+                    storage.put_file(variant_key(sha256, name), temp_path, f'image/{fmt}')
+        finally:
+            if downloaded and os.path.exists(downloaded):
+                os.remove(downloaded)
+
+    db.media_blobs.update_one(
+        {'_id': sha256},
+        {'$set': {'variants': VARIANT_NAMES}, '$unset': {'rendering_at': ''}}
+    )
+    return VARIANT_NAMES
+
+
+def claim_render(db, sha256):
+    """Take the render lock of an image blob; False if it is rendered or being rendered"""
+    now = datetime.utcnow()
+    result = db.media_blobs.update_one(
+        {
+            '_id': sha256,
+            'variants': {'$exists': False},
+            '$or': [
+                {'rendering_at': {'$exists': False}},
+                {'rendering_at': {'$lt': now - RENDER_LEASE}}
+            ]
+        },
+        {'$set': {'rendering_at': now}}
+    )
+    return result.modified_count == 1
+
+
+def release_render(db, sha256):
+    """Drop the render lock so the next request queues the render again"""
+    db.media_blobs.update_one({'_id': sha256}, {'$unset': {'rendering_at': ''}})
+
+
+def queue_variants(db, sha256):
+    """Queue the render of an image's variants unless it is rendered or already queued"""
+    if not claim_render(db, sha256):
+        return
+    try:
+        enqueue_job(db, 'image_variants', {'sha256': sha256}, priority=PRIORITY_NORMAL)
+    except Exception as e:
+        print(f"Could not queue image variants for {sha256}: {e}")
+        release_render(db, sha256)
+
+
+def ingest_image(db, temp_path, extension, sha256, size=None):
+    """
+    Store an uploaded image and queue its variants.
+
+    Returns the blob document; the variants appear shortly afterwards, and
+    until then image_variant hands out the original.
+    """
+    try:
+        width, height = inspect_image(temp_path)
+    except ImageError:
+        os.remove(temp_path)
+        raise
+
+    blob = store_blob(db, temp_path, extension, sha256, size)
+    if not blob.get('media_info'):
+        blob['media_info'] = {'width': width, 'height': height}
+        db.media_blobs.update_one({'_id': sha256}, {'$set': {'media_info': blob['media_info']}})
+
+    if not blob.get('variants'):
+        queue_variants(db, sha256)
+    return blob
+
+
+def image_variant(db, sha256, name):
+    """
+    (storage key, is_variant) to serve for a variant request, or (None, False).
+
+    A variant that is not rendered yet is never rendered in the request: the
+    original is returned instead and a render is queued if none is running.
+    """
+    if name not in VARIANT_NAMES or not SHA256_PATTERN.match(sha256):
+        return None, False
+
+    key = variant_key(sha256, name)
+    if get_storage().exists(key):
+        return key, True
+
+    blob = db.media_blobs.find_one({'_id': sha256}, {'key': 1, 'extension': 1})
+    if not blob or blob.get('extension') not in IMAGE_EXTENSIONS:
+        return None, False
+    queue_variants(db, sha256)
+    return blob['key'], False
@@ -0,0 +1,94 @@
+"""
+Summaries of course materials, computed ahead of time.
+
+Students ask the assistant to summarize the same handouts over and over. When
+a teacher uploads a PDF or adds a material with enough inline text, a
+``material_summary`` job is queued at background priority (see
+utils.ai_jobs), so the worker pool summarizes it while no interactive request
+is waiting. Materials that only hold a URL are not queued. The result is
+stored on the material as ``ai_summary``; ``/api/ai/summarize`` and summarize
+chats with a ``material_id`` serve it without extracting or summarizing
+anything.
+
+A stored summary is current while the material's fingerprint (its
+``updated_at`` or ``created_at``) is unchanged. It also records the SHA-256 of
+the summarized text, so an edit that leaves the text as it was, or a copy of
+the same handout in a cloned course, reuses the existing summary instead of
+calling the model again.
+"""
+import hashlib
+from datetime import datetime
+
+from bson import ObjectId
+
+from utils.ai_jobs import enqueue_job, PRIORITY_BACKGROUND
+from utils.course_index import material_body, material_fingerprint
+from utils.summarizer import MAX_DOCUMENT_CHARS
+
+# Shorter materials are not worth a summary
+MIN_SUMMARY_CHARS = 200
+
+
+def is_summarizable(db, material):
+    """
+    Whether a material has enough text to summarize. Inline text is checked
+    with summary_source itself; uploaded PDFs are left to the worker, which
+    extracts them.
+    """
+    if material.get('storage_key', '').lower().endswith('.pdf'):
+        return True
+    # Without a PDF this reads no files
+    return bool(summary_source(db, material)[0])
+
+
+def queue_material_summaries(db, materials):
+    """Queue background summaries for the summarizable materials among new material documents"""
+    for material in materials:
+        if not is_summarizable(db, material):
+            continue
+        try:
+            enqueue_job(db, 'material_summary', {'material_id': str(material['_id'])},
+                        priority=PRIORITY_BACKGROUND)
+        except Exception as e:
+            print(f"Could not queue summary of material {material['_id']}: {e}")
+
+
+def summary_source(db, material):
+    """
+    (text, sha256) to summarize for a material; text is '' if there is too
+    little. Only the material's own text counts: a URL in content is not
+    text, and neither are the title and description.
+    """
+    text = material_body(db, material)[:MAX_DOCUMENT_CHARS]
+    if len(text) < MIN_SUMMARY_CHARS:
+        return '', None
+    return text, hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def stored_summary(material):
+    """The material's ai_summary if it matches the current material, else None"""
+    summary = material.get('ai_summary')
+    if summary and summary.get('fingerprint') == material_fingerprint(material):
+        return summary
+    return None
+
+
+def summary_by_hash(db, content_hash):
+    """A summary already stored on any material for the same text, or None"""
+    other = db.materials.find_one({'ai_summary.content_hash': content_hash}, {'ai_summary': 1})
+    return other['ai_summary'] if other else None
+
+
+def save_summary(db, material, content_hash, result):
+    """Store a summary on the material and return the stored document"""
+    summary = {
+        'summary': result['summary'],
+        'word_count_original': result['word_count_original'],
+        'word_count_summary': result['word_count_summary'],
+        'sections': result['sections'],
+        'content_hash': content_hash,
+        'fingerprint': material_fingerprint(material),
+        'created_at': datetime.utcnow()
+    }
+    db.materials.update_one({'_id': ObjectId(material['_id'])}, {'$set': {'ai_summary': summary}})
+    return summary
@@ -0,0 +1,122 @@
+"""
+Media delivery helpers.
+
+Video routes only authorize the request; the bytes themselves are sent either
+directly by Flask (the default) or by a front proxy when an offload mode is
+configured:
+
+- ``direct``     - stream the file through the Python worker (send_from_directory)
+- ``x-accel``    - return an ``X-Accel-Redirect`` header for nginx to serve
+- ``x-sendfile`` - return an ``X-Sendfile`` header (Apache mod_xsendfile, lighttpd)
+
+Blobs kept in object storage are streamed with byte-range reads instead.
+"""
+import mimetypes
+import os
+from urllib.parse import quote
+
+from flask import Response, current_app, request, send_from_directory, stream_with_context
+from werkzeug.exceptions import NotFound
+from werkzeug.security import safe_join
+
+# Root directory the proxy knows about; X-Accel paths are relative to it
+from utils.storage import MEDIA_ROOT, get_storage
+
+DELIVERY_MODES = ('direct', 'x-accel', 'x-sendfile')
+
+# nginx `internal` location that aliases MEDIA_ROOT
+MEDIA_INTERNAL_PREFIX = '/' + os.getenv('MEDIA_INTERNAL_PREFIX', '/protected-media/').strip('/') + '/'
+
+STREAM_CHUNK_SIZE = 256 * 1024
+
+
+def get_delivery_mode():
+    """Return the configured delivery mode, falling back to direct"""
+    mode = os.getenv('MEDIA_DELIVERY_MODE', 'direct').strip().lower()
+    return mode if mode in DELIVERY_MODES else 'direct'
+
+
+def _resolve_path(directory, filename):
+    """Resolve directory/filename the same way send_from_directory does"""
+    if not os.path.isabs(directory):
+        directory = os.path.join(current_app.root_path, directory)
+
+    path = safe_join(directory, filename)
+    if path is None or not os.path.isfile(path):
+        raise NotFound()
+    return os.path.abspath(path)
+
+
+def _offload_response(header, value, path, mimetype=None):
+    """Build an empty response carrying the internal-redirect header"""
+    response = Response(status=200)
+    response.headers[header] = value
+    response.headers['Content-Type'] = mimetype or mimetypes.guess_type(path)[0] or 'application/octet-stream'
+    # Let the proxy answer Range requests itself
+    response.headers['Accept-Ranges'] = 'bytes'
+    return response
+
+
+def send_media(directory, filename, mimetype=None):
+    """
+    Send a media file using the configured delivery mode.
+
+    Files outside MEDIA_ROOT cannot be mapped to the proxy's internal location
+    and are always sent directly.
+    """
+    mode = get_delivery_mode()
+    if mode == 'direct':
+        return send_from_directory(directory, filename, mimetype=mimetype, conditional=True)
+
+    path = _resolve_path(directory, filename)
+
+    if mode == 'x-sendfile':
+        return _offload_response('X-Sendfile', path, path, mimetype)
+
+    relative_path = os.path.relpath(path, MEDIA_ROOT)
+    if relative_path.startswith(os.pardir):
+        return send_from_directory(directory, filename, mimetype=mimetype, conditional=True)
+
+    internal_uri = MEDIA_INTERNAL_PREFIX + quote(relative_path.replace(os.sep, '/'))
+    return _offload_response('X-Accel-Redirect', internal_uri, path, mimetype)
+
+
+def send_blob(key, mimetype=None):
+    """
+    Send a stored blob by its storage key.
+
+    Local blobs go through send_media (and its offload modes); object storage
+    blobs are streamed with a ranged GET so seeking only fetches what the
+    player asks for.
+    """
+    storage = get_storage()
+    path = storage.local_path(key)
+    if path is not None:
+        return send_media(os.path.dirname(path), os.path.basename(path), mimetype=mimetype)
+
+    size = storage.size(key)
+    mimetype = mimetype or mimetypes.guess_type(key)[0] or 'application/octet-stream'
+    if size == 0:
+        # There is no byte range to read from an empty object
+        response = Response(b'', status=200, mimetype=mimetype)
+        response.headers['Accept-Ranges'] = 'bytes'
+        return response
+
+    byte_range = request.range
+    content_range = byte_range.range_for_length(size) if byte_range else None
+    if byte_range and content_range is None:
+        return Response(status=416, headers={'Content-Range': f'bytes */{size}'})
+    start, stop = content_range or (0, size)
+
+    body = storage.read_range(key, start, stop - 1)
+    response = Response(
+        stream_with_context(body.iter_chunks(STREAM_CHUNK_SIZE)),
+        status=206 if content_range else 200,
+        mimetype=mimetype,
+        direct_passthrough=True
+    )
+    response.headers['Accept-Ranges'] = 'bytes'
+    response.headers['Content-Length'] = str(stop - start)
+    if content_range:
+        response.headers['Content-Range'] = f'bytes {start}-{stop - 1}/{size}'
+    return response
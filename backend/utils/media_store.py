@@ -0,0 +1,259 @@
+"""
+Content-addressed media store.
+
+Uploaded files are stored once under their SHA-256, sharded into two levels of
+subdirectories (``blobs/ab/cd/<sha256>.<ext>``) so no directory grows with the
+catalog. The ``media_blobs`` collection keeps a reference count that is
+incremented for every ``videos``/``materials`` document pointing at a blob and
+decremented when that document goes away; unreferenced blobs are removed by
+``collect_garbage``.
+
+The collector marks a blob (``deleting_at``) with a conditional update before
+it removes any object and drops the document only afterwards. ``store_blob``
+never takes a reference on a marked blob: it waits for the collector to
+finish and then stores the content again, so new uploads of the same content
+cannot lose their file to a collection that was already under way.
+``add_ref`` refuses marked or missing blobs outright (``BlobUnavailableError``),
+since it has no file to store again.
+
+Blob bytes live in the backend returned by ``utils.storage.get_storage``
+(local disk or an S3-compatible bucket); files are only staged locally while
+they are hashed and ingested.
+"""
+import hashlib
+import mimetypes
+import os
+import time
+from datetime import datetime, timedelta
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from utils.chunked_upload import UPLOAD_TMP_FOLDER
+from utils import mp4
+from utils.storage import get_storage
+
+BLOB_PREFIX = 'blobs/'
+VARIANT_PREFIX = 'variants/'
+GC_GRACE_PERIOD = timedelta(hours=1)
+# A deletion mark older than this was left by a collector that died
+GC_DELETE_TIMEOUT = timedelta(minutes=5)
+DELETE_POLL_INTERVAL = 0.2
+COPY_BUFFER_SIZE = 1024 * 1024
+
+
+class BlobUnavailableError(Exception):
+    """Raised when a blob is gone or being deleted, so no reference can be taken on it"""
+    def __init__(self, sha256):
+        self.sha256 = sha256
+        self.message = 'Media file is no longer available, please upload it again'
+        self.status_code = 409
+        super().__init__(self.message)
+
+
+def blob_key(sha256, extension):
+    """Storage key of a blob"""
+    return f'{BLOB_PREFIX}{sha256[:2]}/{sha256[2:4]}/{sha256}.{extension.lower()}'
+
+
+def variant_prefix(sha256):
+    """Storage prefix of the objects derived from a blob (e.g. image variants)"""
+    return f'{VARIANT_PREFIX}{sha256[:2]}/{sha256}/'
+
+
+def save_upload(file_storage, max_size=None):
+    """
+    Stream an uploaded file into the temp folder while hashing it.
+
+    Returns (temp_path, size, sha256). With max_size, reading stops once the
+    file is larger, so the caller sees size > max_size without the rest of
+    the body being written to disk.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    temp_path = os.path.join(UPLOAD_TMP_FOLDER, f'{os.urandom(12).hex()}.upload')
+    with open(temp_path, 'wb') as f:
+        for block in iter(lambda: file_storage.stream.read(COPY_BUFFER_SIZE), b''):
+            digest.update(block)
+            f.write(block)
+            size += len(block)
+            if max_size is not None and size > max_size:
+                break
+    return temp_path, size, digest.hexdigest()
+
+
+def store_blob(db, temp_path, extension, sha256, size=None):
+    """
+    Move a fully written temp file into the store and take one reference.
+
+    If the content is already stored the temp file is discarded. Returns the
+    blob document.
+    """
+    size = size if size is not None else os.path.getsize(temp_path)
+    key = blob_key(sha256, extension)
+
+    while True:
+        now = datetime.utcnow()
+        try:
+            blob = db.media_blobs.find_one_and_update(
+                {'_id': sha256, 'deleting_at': {'$exists': False}},
+                {
+                    '$inc': {'ref_count': 1},
+                    '$set': {'updated_at': now},
+                    '$setOnInsert': {'key': key, 'size': size, 'extension': extension.lower(), 'created_at': now}
+                },
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+            break
+        except DuplicateKeyError:
+            # The blob is marked for deletion; store it again once collect_garbage is done
+            _wait_for_deletion(db, sha256)
+
+    storage = get_storage()
+    try:
+        if storage.exists(blob['key']):
+            os.remove(temp_path)
+        else:
+            storage.put_file(blob['key'], temp_path, mimetypes.guess_type(blob['key'])[0])
+    except Exception:
+        # The caller gets no blob, so it cannot release this reference itself
+        release_blob(db, sha256)
+        raise
+
+    # Local path for the disk backend, None for object storage
+    blob['path'] = storage.local_path(blob['key'])
+    return blob
+
+
+def _wait_for_deletion(db, sha256):
+    """Wait until collect_garbage has removed a marked blob, clearing marks it left behind"""
+    while True:
+        blob = db.media_blobs.find_one({'_id': sha256}, {'deleting_at': 1})
+        if not blob or 'deleting_at' not in blob:
+            return
+        if blob['deleting_at'] < datetime.utcnow() - GC_DELETE_TIMEOUT:
+            db.media_blobs.update_one({'_id': sha256, 'deleting_at': blob['deleting_at']},
+                                      {'$unset': {'deleting_at': ''}})
+            return
+        time.sleep(DELETE_POLL_INTERVAL)
+
+
+def ingest_media(db, temp_path, extension, sha256, size=None):
+    """
+    Ingest stage for uploaded videos, run before the file enters the store.
+
+    MP4/MOV files get their moov box moved to the front (faststart) and are
+    probed for duration and bitrate, which are kept on the blob document as
+    ``media_info``. Other formats are stored unchanged.
+    """
+    media_info = None
+    if extension.lower() in mp4.ISO_BMFF_EXTENSIONS:
+        try:
+            rewritten_path = temp_path + '.faststart'
+            rewritten = mp4.faststart(temp_path, rewritten_path)
+            if rewritten:
+                os.replace(rewritten_path, temp_path)
+                size, sha256 = rewritten
+            media_info = mp4.probe(temp_path)
+        except (mp4.MP4Error, OSError) as e:
+            print(f"MP4 ingest skipped for {sha256}: {e}")
+            if os.path.exists(temp_path + '.faststart'):
+                os.remove(temp_path + '.faststart')
+
+    blob = store_blob(db, temp_path, extension, sha256, size)
+    if media_info and not blob.get('media_info'):
+        db.media_blobs.update_one({'_id': blob['_id']}, {'$set': {'media_info': media_info}})
+        blob['media_info'] = media_info
+    return blob
+
+
+def add_ref(db, sha256, session=None):
+    """Take another reference on an existing blob that is not being deleted"""
+    result = db.media_blobs.update_one(
+        {'_id': sha256, 'deleting_at': {'$exists': False}},
+        {'$inc': {'ref_count': 1}, '$set': {'updated_at': datetime.utcnow()}},
+        session=session
+    )
+    if not result.matched_count:
+        raise BlobUnavailableError(sha256)
+
+
+def release_blob(db, sha256, session=None):
+    """Drop one reference; the file is removed later by collect_garbage"""
+    if sha256:
+        db.media_blobs.update_one({'_id': sha256}, {'$inc': {'ref_count': -1}, '$set': {'updated_at': datetime.utcnow()}},
+                                  session=session)
+
+
+def count_references(db, sha256):
+    """Count documents that actually point at a blob"""
+    return (db.materials.count_documents({'blob_sha256': sha256}) +
+            db.videos.count_documents({'blobSha256': sha256}) +
+            db.courses.count_documents({'thumbnail_sha256': sha256}))
+
+
+def collect_garbage(db, grace_period=GC_GRACE_PERIOD):
+    """Delete unreferenced blobs and stray files older than the grace period"""
+    try:
+        storage = get_storage()
+        now = datetime.utcnow()
+        cutoff = now - grace_period
+        unreferenced = {
+            'ref_count': {'$lte': 0},
+            'updated_at': {'$lt': cutoff},
+            '$or': [{'deleting_at': {'$exists': False}}, {'deleting_at': {'$lt': now - GC_DELETE_TIMEOUT}}]
+        }
+
+        removed = 0
+        for blob in db.media_blobs.find(unreferenced):
+            # Re-check against the referencing collections before deleting
+            references = count_references(db, blob['_id'])
+            if references:
+                db.media_blobs.update_one({'_id': blob['_id']}, {'$set': {'ref_count': references}})
+                continue
+
+            # From here on store_blob waits for this blob instead of reusing it
+            marked = db.media_blobs.update_one({'_id': blob['_id'], **unreferenced},
+                                               {'$set': {'deleting_at': now}})
+            if not marked.modified_count:
+                continue
+
+            for key, _ in list(storage.list_keys(variant_prefix(blob['_id']))):
+                storage.delete(key)
+            if storage.exists(blob['key']):
+                storage.delete(blob['key'])
+                removed += 1
+
+            result = db.media_blobs.delete_one({'_id': blob['_id'], 'deleting_at': now, 'ref_count': {'$lte': 0}})
+            if not result.deleted_count:
+                # A reference was taken meanwhile; keep the record for the next upload to refill
+                db.media_blobs.update_one({'_id': blob['_id'], 'deleting_at': now}, {'$unset': {'deleting_at': ''}})
+                print(f"Media blob {blob['_id']} was referenced while it was being deleted")
+
+        # Objects left behind by interrupted uploads or deleted blobs
+        stray = [(key, modified, key.rsplit('/', 1)[-1].split('.', 1)[0])
+                 for key, modified in storage.list_keys(BLOB_PREFIX)]
+        stray += [(key, modified, key.split('/')[2])
+                  for key, modified in storage.list_keys(VARIANT_PREFIX)]
+        for key, modified, sha256 in stray:
+            if modified < cutoff and not db.media_blobs.find_one({'_id': sha256}, {'_id': 1}):
+                storage.delete(key)
+                removed += 1
+
+        print(f"Removed {removed} unreferenced media blobs")
+        return removed
+
+    except Exception as e:
+        print(f"Error during media garbage collection: {e}")
+        return 0
+
+
+if __name__ == '__main__':
+    from pymongo import MongoClient
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    client = MongoClient(os.getenv('MONGO_URI', 'mongodb://localhost:27017/edunexa_lms'))
+    collect_garbage(client.edunexa_lms)
+    client.close()
@@ -0,0 +1,22 @@
+"""
+Data migrations that bring existing documents up to the current schema.
+
+Every step is idempotent, so they can run on every deploy. ``migrate.py``
+runs them before the web server starts in production; ``python app.py``
+runs them too for local development.
+"""
+from utils.completions import migrate_completed_by
+from utils.enrollments import backfill_enrolled_counts
+from utils.grading_queue import backfill_queue_fields
+
+
+def run_migrations(db):
+    """Run every migration in order"""
+    # Move legacy materials.completed_by arrays into material_completions
+    migrate_completed_by(db)
+
+    # Recompute course seat counters from existing enrollments
+    backfill_enrolled_counts(db)
+
+    # Copy teacher_id/due_date onto older submissions for the grading queue
+    backfill_queue_fields(db)
@@ -0,0 +1,194 @@
+"""
+Minimal ISO-BMFF (MP4/MOV) helpers used when ingesting uploaded videos.
+
+- ``probe`` reads the movie header for the true duration and bitrate
+- ``faststart`` moves the ``moov`` box in front of ``mdat`` so players can
+  start before downloading the tail of the file, patching the stco/co64
+  chunk offsets while the rest of the file is copied as a stream
+"""
+import hashlib
+import os
+import struct
+from contextlib import contextmanager
+
+ISO_BMFF_EXTENSIONS = {'mp4', 'm4v', 'mov'}
+
+# Boxes on the path from moov to the chunk offset tables
+CONTAINER_BOXES = {b'moov', b'trak', b'mdia', b'minf', b'stbl', b'edts', b'dinf'}
+
+MAX_MOOV_SIZE = 64 * 1024 * 1024
+COPY_BUFFER_SIZE = 1024 * 1024
+
+
+class MP4Error(Exception):
+    """Raised when a file is not a well-formed ISO-BMFF file"""
+
+
+@contextmanager
+def _parsing():
+    """Report boxes cut short by a truncated or corrupt file as MP4Error"""
+    try:
+        yield
+    except (struct.error, IndexError) as e:
+        raise MP4Error(f'Truncated or corrupt box: {e}')
+
+
+def iter_boxes(f, start, end):
+    """Yield (type, offset, size, header_size) for the boxes in [start, end)"""
+    offset = start
+    while offset + 8 <= end:
+        f.seek(offset)
+        header = f.read(8)
+        if len(header) < 8:
+            break
+        size, box_type = struct.unpack('>I4s', header)
+        header_size = 8
+        if size == 1:
+            size = struct.unpack('>Q', f.read(8))[0]
+            header_size = 16
+        elif size == 0:
+            size = end - offset
+        if size < header_size or offset + size > end:
+            raise MP4Error(f'Invalid {box_type!r} box at offset {offset}')
+        yield box_type, offset, size, header_size
+        offset += size
+
+
+def iter_buffer_boxes(data, start, end):
+    """Same as iter_boxes for a box tree that is already in memory"""
+    offset = start
+    while offset + 8 <= end:
+        size, box_type = struct.unpack_from('>I4s', data, offset)
+        header_size = 8
+        if size == 1:
+            size = struct.unpack_from('>Q', data, offset + 8)[0]
+            header_size = 16
+        elif size == 0:
+            size = end - offset
+        if size < header_size or offset + size > end:
+            raise MP4Error(f'Invalid {box_type!r} box at offset {offset}')
+        yield box_type, offset, size, header_size
+        offset += size
+
+
+def top_level_boxes(path):
+    with open(path, 'rb') as f:
+        return list(iter_boxes(f, 0, os.path.getsize(path)))
+
+
+def _read_movie_header(moov, moov_header_size):
+    """Return (timescale, duration) from the mvhd box inside moov bytes"""
+    for box_type, offset, size, header_size in iter_buffer_boxes(moov, moov_header_size, len(moov)):
+        if box_type != b'mvhd':
+            continue
+        body = offset + header_size
+        version = moov[body]
+        if version == 1:
+            timescale, duration = struct.unpack_from('>IQ', moov, body + 4 + 16)
+        else:
+            timescale, duration = struct.unpack_from('>II', moov, body + 4 + 8)
+        return timescale, duration
+    raise MP4Error('mvhd box not found')
+
+
+def _read_moov(path, boxes):
+    moov = next((b for b in boxes if b[0] == b'moov'), None)
+    if not moov:
+        raise MP4Error('moov box not found')
+    if moov[2] > MAX_MOOV_SIZE:
+        raise MP4Error('moov box is too large')
+    with open(path, 'rb') as f:
+        f.seek(moov[1])
+        return moov, bytearray(f.read(moov[2]))
+
+
+def probe(path):
+    """
+    Read duration and bitrate from an MP4/MOV file.
+
+    Returns a dict with duration_seconds, bitrate (bits/s) and faststart.
+    """
+    with _parsing():
+        boxes = top_level_boxes(path)
+        moov, moov_bytes = _read_moov(path, boxes)
+        timescale, duration = _read_movie_header(moov_bytes, moov[3])
+
+    duration_seconds = round(duration / timescale, 3) if timescale else 0
+    file_size = os.path.getsize(path)
+    mdat = next((b for b in boxes if b[0] == b'mdat'), None)
+
+    return {
+        'duration_seconds': duration_seconds,
+        'bitrate': int(file_size * 8 / duration_seconds) if duration_seconds else None,
+        'faststart': mdat is None or moov[1] < mdat[1]
+    }
+
+
+def _patch_chunk_offsets(moov, start, end, moved_range):
+    """Shift stco/co64 entries pointing into the data that moves behind moov"""
+    insert_at, moov_offset = moved_range
+    for box_type, offset, size, header_size in iter_buffer_boxes(moov, start, end):
+        body = offset + header_size
+        if box_type in CONTAINER_BOXES:
+            _patch_chunk_offsets(moov, body, offset + size, moved_range)
+        elif box_type in (b'stco', b'co64'):
+            entry_count = struct.unpack_from('>I', moov, body + 4)[0]
+            fmt, width = ('>I', 4) if box_type == b'stco' else ('>Q', 8)
+            for i in range(entry_count):
+                position = body + 8 + i * width
+                value = struct.unpack_from(fmt, moov, position)[0]
+                # Only data between the insertion point and the old moov moves
+                if insert_at <= value < moov_offset:
+                    value += len(moov)
+                    if box_type == b'stco' and value > 0xFFFFFFFF:
+                        raise MP4Error('Chunk offset overflows stco; faststart skipped')
+                    struct.pack_into(fmt, moov, position, value)
+
+
+def _copy_range(src, dst, start, length, digest):
+    src.seek(start)
+    while length > 0:
+        block = src.read(min(COPY_BUFFER_SIZE, length))
+        if not block:
+            raise MP4Error('Unexpected end of file')
+        digest.update(block)
+        dst.write(block)
+        length -= len(block)
+
+
+def faststart(src_path, dst_path):
+    """
+    Rewrite src_path to dst_path with moov in front of the media data.
+
+    Returns (size, sha256) of the rewritten file, or None when the file is
+    already faststart and nothing was written.
+    """
+    with _parsing():
+        boxes = top_level_boxes(src_path)
+        moov, moov_bytes = _read_moov(src_path, boxes)
+        mdat = next((b for b in boxes if b[0] == b'mdat'), None)
+        if mdat is None or moov[1] < mdat[1]:
+            return None
+
+        insert_at = mdat[1]
+        moov_offset, moov_size = moov[1], moov[2]
+        _patch_chunk_offsets(moov_bytes, moov[3], len(moov_bytes), (insert_at, moov_offset))
+
+    digest = hashlib.sha256()
+    file_size = os.path.getsize(src_path)
+    with open(src_path, 'rb') as src, open(dst_path, 'wb') as dst:
+        _copy_range(src, dst, 0, insert_at, digest)
+        digest.update(moov_bytes)
+        dst.write(moov_bytes)
+        _copy_range(src, dst, insert_at, moov_offset - insert_at, digest)
+        _copy_range(src, dst, moov_offset + moov_size, file_size - moov_offset - moov_size, digest)
+
+    return os.path.getsize(dst_path), digest.hexdigest()
+
+
+def format_duration(seconds):
+    """Format seconds as M:SS or H:MM:SS"""
+    seconds = int(round(seconds))
+    hours, remainder = divmod(seconds, 3600)
+    minutes, secs = divmod(remainder, 60)
+    return f'{hours}:{minutes:02d}:{secs:02d}' if hours else f'{minutes}:{secs:02d}'
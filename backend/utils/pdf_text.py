@@ -0,0 +1,161 @@
+"""
+PDF text extraction for the AI assistant.
+
+Callers only use the first ``budget`` characters of a document, so pages are
+read in order and extraction stops once the budget is met instead of decoding
+every page. Documents with at least ``PARALLEL_MIN_PAGES`` pages are split
+into one contiguous page range per process of a pool (PDF parsing is
+CPU-bound and holds the GIL), so each process parses the file once. A process
+stops reading once its own range holds the budget, and later ranges are only
+used while the ranges before them fall short. The pool starts its processes
+with 'spawn': forking a web worker that runs other threads can copy locks
+that are held at that moment.
+
+Results are cached in ``pdf_text_cache`` by the SHA-256 of the file, so
+summarizing the same handout again skips extraction. An entry is reused for
+a larger budget only if it already holds the whole document.
+"""
+import hashlib
+import io
+import multiprocessing
+import os
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+import PyPDF2
+from pymongo.errors import PyMongoError
+
+PDF_TEXT_BUDGET = 10000
+MAX_PDF_SIZE_MB = int(os.getenv('PDF_MAX_UPLOAD_MB', 25))
+PARALLEL_MIN_PAGES = int(os.getenv('PDF_PARALLEL_MIN_PAGES', 20))
+PDF_EXTRACT_PROCESSES = int(os.getenv('PDF_EXTRACT_PROCESSES', 2))
+CACHE_TTL = timedelta(days=int(os.getenv('PDF_TEXT_CACHE_DAYS', 30)))
+
+
+class PDFError(Exception):
+    """Raised when a file cannot be read as a PDF"""
+    def __init__(self, message):
+        self.message = message
+        self.status_code = 400
+        super().__init__(self.message)
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def _process_pool():
+    """Extraction pool of this process, created on first use"""
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool_pid != os.getpid():
+            _pool = ProcessPoolExecutor(max_workers=PDF_EXTRACT_PROCESSES,
+                                        mp_context=multiprocessing.get_context('spawn'))
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def _page_text(page):
+    return (page.extract_text() or '') + "\n"
+
+
+def _extract_range(path, start, stop, budget):
+    """
+    (text, pages read) of pages [start, stop) of the PDF at path, stopping
+    once the text holds budget characters; runs in the pool
+    """
+    reader = PyPDF2.PdfReader(path)
+    return _extract_sequential(reader, budget, start, stop)
+
+
+def _extract_sequential(reader, budget, start=0, stop=None):
+    parts, length, pages_read = [], 0, 0
+    stop = len(reader.pages) if stop is None else stop
+    for i in range(start, stop):
+        text = _page_text(reader.pages[i])
+        parts.append(text)
+        length += len(text)
+        pages_read += 1
+        if length >= budget:
+            break
+    return ''.join(parts), pages_read
+
+
+def _extract_parallel(data, page_count, budget):
+    # Workers open the file themselves instead of receiving the bytes per task
+    handle = tempfile.NamedTemporaryFile(suffix='.pdf', delete=False)
+    try:
+        with handle:
+            handle.write(data)
+
+        pool = _process_pool()
+        bounds = [page_count * i // PDF_EXTRACT_PROCESSES for i in range(PDF_EXTRACT_PROCESSES + 1)]
+        futures = [pool.submit(_extract_range, handle.name, start, stop, budget)
+                   for start, stop in zip(bounds, bounds[1:])]
+
+        parts, length, pages_read = [], 0, 0
+        try:
+            for start, future in zip(bounds, futures):
+                # A range only stops short once it holds the budget by itself
+                text, range_pages = future.result()
+                parts.append(text)
+                length += len(text)
+                pages_read = start + range_pages
+                if length >= budget:
+                    break
+        finally:
+            for future in futures:
+                future.cancel()
+        return ''.join(parts), pages_read
+    finally:
+        try:
+            os.remove(handle.name)
+        except OSError:
+            pass
+
+
+def extract_pdf_text(db, data, budget=PDF_TEXT_BUDGET):
+    """
+    Text of a PDF given as bytes, read up to at least `budget` characters
+    (or the end of the document). Raises PDFError for unreadable files.
+    """
+    key = hashlib.sha256(data).hexdigest()
+    try:
+        cached = db.pdf_text_cache.find_one({'_id': key})
+    except PyMongoError as e:
+        print(f"PDF text cache lookup failed: {e}")
+        cached = None
+    if cached and (cached['complete'] or cached['budget'] >= budget):
+        return cached['text']
+
+    try:
+        reader = PyPDF2.PdfReader(io.BytesIO(data))
+        page_count = len(reader.pages)
+        if page_count >= PARALLEL_MIN_PAGES and PDF_EXTRACT_PROCESSES > 1:
+            text, pages_read = _extract_parallel(data, page_count, budget)
+        else:
+            text, pages_read = _extract_sequential(reader, budget)
+    except Exception as e:
+        raise PDFError(str(e))
+
+    now = datetime.utcnow()
+    try:
+        db.pdf_text_cache.replace_one(
+            {'_id': key},
+            {
+                'text': text,
+                'budget': budget,
+                'complete': pages_read == page_count,
+                'pages': page_count,
+                'pages_read': pages_read,
+                'created_at': now,
+                'expires_at': now + CACHE_TTL
+            },
+            upsert=True
+        )
+    except PyMongoError as e:
+        print(f"PDF text cache write failed: {e}")
+    return text
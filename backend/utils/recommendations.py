@@ -0,0 +1,150 @@
+"""
+Item-to-item course recommendations from co-enrollment.
+
+A batch job (``build_course_neighbors``, run at startup and from
+``build_recommendations.py``) reads the enrollments once, counts how many
+students each pair of courses shares and scores every pair with the cosine
+similarity of the two courses' student sets::
+
+    score(a, b) = shared(a, b) / sqrt(students(a) * students(b))
+
+The counts are kept as sparse dicts - only pairs that actually share a
+student are ever materialized - and the top ``NEIGHBORS_PER_COURSE`` for each
+course are stored in ``course_neighbors`` keyed by course id. Recommending is
+then an ``_id`` lookup of the student's courses and a merge of their
+neighbor lists, topped up with the most popular courses when the neighbors
+run out.
+"""
+import heapq
+import math
+import os
+from collections import defaultdict
+from datetime import datetime
+
+from bson import ObjectId
+from pymongo import ReplaceOne
+
+NEIGHBORS_PER_COURSE = int(os.getenv('RECOMMENDATION_NEIGHBORS', 20))
+MIN_SHARED_STUDENTS = int(os.getenv('RECOMMENDATION_MIN_SHARED', 2))
+# Students in more courses than this add little signal and quadratic cost
+MAX_COURSES_PER_STUDENT = 200
+WRITE_BATCH_SIZE = 500
+
+
+def co_enrollment_counts(db):
+    """Return (students per course, shared students per course pair) for active courses"""
+    active = {str(c['_id']) for c in db.courses.find({'is_active': True}, {'_id': 1})}
+
+    by_student = defaultdict(list)
+    for enrollment in db.enrollments.find({}, {'student_id': 1, 'course_id': 1, '_id': 0}):
+        if enrollment.get('course_id') in active:
+            by_student[enrollment['student_id']].append(enrollment['course_id'])
+
+    course_counts = defaultdict(int)
+    pair_counts = defaultdict(lambda: defaultdict(int))
+    for courses in by_student.values():
+        courses = sorted(set(courses))
+        for course_id in courses:
+            course_counts[course_id] += 1
+        if len(courses) > MAX_COURSES_PER_STUDENT:
+            continue
+        for i, a in enumerate(courses):
+            for b in courses[i + 1:]:
+                pair_counts[a][b] += 1
+    return course_counts, pair_counts
+
+
+def top_neighbors(course_counts, pair_counts, limit=NEIGHBORS_PER_COURSE, min_shared=MIN_SHARED_STUDENTS):
+    """Cosine-score every co-enrolled pair and keep the best `limit` per course"""
+    scored = defaultdict(list)
+    for a, row in pair_counts.items():
+        for b, shared in row.items():
+            if shared < min_shared:
+                continue
+            score = shared / math.sqrt(course_counts[a] * course_counts[b])
+            scored[a].append((score, shared, b))
+            scored[b].append((score, shared, a))
+
+    return {
+        course_id: [
+            {'course_id': other, 'score': round(score, 6), 'shared': shared}
+            for score, shared, other in heapq.nlargest(limit, candidates)
+        ]
+        for course_id, candidates in scored.items()
+    }
+
+
+def build_course_neighbors(db):
+    """Rebuild the course_neighbors collection; returns the number of courses indexed"""
+    try:
+        started = datetime.utcnow()
+        course_counts, pair_counts = co_enrollment_counts(db)
+        neighbors = top_neighbors(course_counts, pair_counts)
+
+        operations = [
+            ReplaceOne(
+                {'_id': course_id},
+                {'neighbors': items, 'students': course_counts[course_id], 'built_at': started},
+                upsert=True
+            )
+            for course_id, items in neighbors.items()
+        ]
+        for i in range(0, len(operations), WRITE_BATCH_SIZE):
+            db.course_neighbors.bulk_write(operations[i:i + WRITE_BATCH_SIZE], ordered=False)
+
+        # Courses that lost all their neighbors since the last build
+        db.course_neighbors.delete_many({'built_at': {'$lt': started}})
+
+        print(f"Built recommendation neighbors for {len(neighbors)} courses")
+        return len(neighbors)
+
+    except Exception as e:
+        print(f"Error building course recommendations: {e}")
+        return 0
+
+
+def recommend_courses(db, enrolled_course_ids, limit=5):
+    """
+    Courses to recommend to a student enrolled in the given courses.
+
+    Neighbor scores are summed across the student's courses; popular courses
+    fill any remaining slots. Each course carries `recommendation_score` and
+    `recommendation_source` ('co_enrollment' or 'popular').
+    """
+    enrolled = set(enrolled_course_ids)
+    scores = defaultdict(float)
+    for row in db.course_neighbors.find({'_id': {'$in': list(enrolled)}}, {'neighbors': 1}):
+        for neighbor in row.get('neighbors', []):
+            if neighbor['course_id'] not in enrolled:
+                scores[neighbor['course_id']] += neighbor['score']
+
+    # Fetch a few spare candidates in case some were deactivated since the build
+    candidates = heapq.nlargest(limit * 2, scores, key=scores.get)
+    courses = {
+        str(c['_id']): c
+        for c in db.courses.find({
+            '_id': {'$in': [ObjectId(cid) for cid in candidates if ObjectId.is_valid(cid)]},
+            'is_active': True
+        })
+    } if candidates else {}
+
+    recommendations = []
+    for course_id in candidates:
+        if course_id in courses and len(recommendations) < limit:
+            course = courses[course_id]
+            course['recommendation_score'] = round(scores[course_id], 4)
+            course['recommendation_source'] = 'co_enrollment'
+            recommendations.append(course)
+
+    if len(recommendations) < limit:
+        exclude = [ObjectId(cid) for cid in enrolled | {str(c['_id']) for c in recommendations} if ObjectId.is_valid(cid)]
+        for course in db.courses.find(
+            {'_id': {'$nin': exclude}, 'is_active': True}
+        ).sort('enrolled_count', -1).limit(limit - len(recommendations)):
+            course['recommendation_score'] = 0
+            course['recommendation_source'] = 'popular'
+            recommendations.append(course)
+
+    for course in recommendations:
+        course['_id'] = str(course['_id'])
+    return recommendations
@@ -0,0 +1,204 @@
+"""
+Object storage backends for uploaded media.
+
+Blobs are addressed by a storage key (``blobs/ab/cd/<sha256>.<ext>``) and kept
+either on local disk below MEDIA_ROOT (the default) or in an S3-compatible
+bucket (AWS S3, MinIO, ...) so several backend nodes can serve the same files.
+
+- ``local`` - files under MEDIA_ROOT, served through utils.media_delivery
+- ``s3``    - multipart uploads split across a thread pool, served with
+  byte-range reads
+
+Select the backend with STORAGE_BACKEND.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+STORAGE_BACKENDS = ('local', 's3')
+
+# Local blobs live here; utils.media_delivery maps it to the proxy's internal location
+MEDIA_ROOT = os.path.abspath(os.getenv(
+    'MEDIA_ROOT',
+    os.path.join(os.path.dirname(os.path.dirname(__file__)), 'uploads')
+))
+
+S3_PART_SIZE = int(os.getenv('S3_PART_SIZE_MB', 16)) * 1024 * 1024
+S3_MIN_PART_SIZE = 5 * 1024 * 1024  # S3 rejects smaller parts except the last
+S3_UPLOAD_CONCURRENCY = int(os.getenv('S3_UPLOAD_CONCURRENCY', 4))
+
+
+class StorageError(Exception):
+    """Raised when an object cannot be stored or read"""
+
+
+class LocalStorage:
+    """Blobs stored as files below a root directory"""
+    name = 'local'
+
+    def __init__(self, root=MEDIA_ROOT):
+        self.root = root
+
+    def local_path(self, key):
+        return os.path.join(self.root, *key.split('/'))
+
+    def exists(self, key):
+        return os.path.exists(self.local_path(key))
+
+    def size(self, key):
+        return os.path.getsize(self.local_path(key))
+
+    def put_file(self, key, path, content_type=None):
+        """Move a local file into place under key"""
+        target = self.local_path(key)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(path, target)
+
+    def delete(self, key):
+        if self.exists(key):
+            os.remove(self.local_path(key))
+
+    def list_keys(self, prefix):
+        """Yield (key, last_modified) for every object below prefix"""
+        base = self.local_path(prefix)
+        for root, _, files in os.walk(base):
+            for name in files:
+                path = os.path.join(root, name)
+                key = os.path.relpath(path, self.root).replace(os.sep, '/')
+                yield key, datetime.utcfromtimestamp(os.path.getmtime(path))
+
+
+class S3Storage:
+    """Blobs stored in an S3-compatible bucket"""
+    name = 's3'
+
+    def __init__(self, bucket, endpoint_url=None, region=None, prefix='',
+                 part_size=S3_PART_SIZE, concurrency=S3_UPLOAD_CONCURRENCY):
+        try:
+            import boto3
+            from botocore.config import Config
+        except ImportError:
+            raise StorageError('STORAGE_BACKEND=s3 requires boto3 (pip install boto3)')
+
+        if not bucket:
+            raise StorageError('S3_BUCKET is required when STORAGE_BACKEND=s3')
+
+        self.bucket = bucket
+        self.prefix = prefix.strip('/') + '/' if prefix.strip('/') else ''
+        self.part_size = max(part_size, S3_MIN_PART_SIZE)
+        self.concurrency = max(1, concurrency)
+        # One connection per upload worker plus headroom for range reads
+        self.client = boto3.client(
+            's3',
+            endpoint_url=endpoint_url or None,
+            region_name=region or None,
+            config=Config(max_pool_connections=self.concurrency * 2 + 10)
+        )
+
+    def _object_key(self, key):
+        return self.prefix + key
+
+    def local_path(self, key):
+        return None
+
+    def _head(self, key):
+        from botocore.exceptions import ClientError
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=self._object_key(key))
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return None
+            raise
+
+    def exists(self, key):
+        return self._head(key) is not None
+
+    def size(self, key):
+        head = self._head(key)
+        if head is None:
+            raise StorageError(f'Object not found: {key}')
+        return head['ContentLength']
+
+    def _upload_part(self, path, object_key, upload_id, part_number, offset, length):
+        # Each worker reads its own slice, so the file is never held in memory
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            body = f.read(length)
+        response = self.client.upload_part(
+            Bucket=self.bucket, Key=object_key, UploadId=upload_id,
+            PartNumber=part_number, Body=body
+        )
+        return {'PartNumber': part_number, 'ETag': response['ETag']}
+
+    def put_file(self, key, path, content_type=None):
+        """Upload a local file, in parallel parts when it is large, then remove it"""
+        object_key = self._object_key(key)
+        file_size = os.path.getsize(path)
+        extra = {'ContentType': content_type} if content_type else {}
+
+        if file_size <= self.part_size:
+            with open(path, 'rb') as f:
+                self.client.put_object(Bucket=self.bucket, Key=object_key, Body=f, **extra)
+            os.remove(path)
+            return
+
+        upload_id = self.client.create_multipart_upload(Bucket=self.bucket, Key=object_key, **extra)['UploadId']
+        try:
+            with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+                futures = [
+                    executor.submit(self._upload_part, path, object_key, upload_id, number, offset,
+                                    min(self.part_size, file_size - offset))
+                    for number, offset in enumerate(range(0, file_size, self.part_size), start=1)
+                ]
+                parts = [future.result() for future in futures]
+
+            self.client.complete_multipart_upload(
+                Bucket=self.bucket, Key=object_key, UploadId=upload_id,
+                MultipartUpload={'Parts': parts}
+            )
+        except Exception:
+            self.client.abort_multipart_upload(Bucket=self.bucket, Key=object_key, UploadId=upload_id)
+            raise
+
+        os.remove(path)
+
+    def read_range(self, key, start, end):
+        """Return a streaming body for bytes [start, end] (inclusive)"""
+        response = self.client.get_object(
+            Bucket=self.bucket, Key=self._object_key(key), Range=f'bytes={start}-{end}'
+        )
+        return response['Body']
+
+    def download_file(self, key, path):
+        """Copy an object to a local file"""
+        self.client.download_file(self.bucket, self._object_key(key), path)
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=self._object_key(key))
+
+    def list_keys(self, prefix):
+        """Yield (key, last_modified) for every object below prefix"""
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self._object_key(prefix)):
+            for obj in page.get('Contents', []):
+                yield obj['Key'][len(self.prefix):], obj['LastModified'].replace(tzinfo=None)
+
+
+_storage = None
+
+
+def get_storage():
+    """Return the configured storage backend (created once per process)"""
+    global _storage
+    if _storage is None:
+        backend = os.getenv('STORAGE_BACKEND', 'local').strip().lower()
+        if backend == 's3':
+            _storage = S3Storage(
+                bucket=os.getenv('S3_BUCKET'),
+                endpoint_url=os.getenv('S3_ENDPOINT_URL'),
+                region=os.getenv('S3_REGION'),
+                prefix=os.getenv('S3_PREFIX', '')
+            )
+        else:
+            _storage = LocalStorage()
+    return _storage
@@ -0,0 +1,174 @@
+"""
+Map-reduce summaries for documents longer than one prompt.
+
+The text is split into sections of at most ``SECTION_CHARS`` characters at
+line boundaries. Where a section ends is decided by the content: once a
+section is half full it ends after the first line whose hash is a multiple of
+``BOUNDARY_MODULUS``. An edit therefore only moves the boundaries next to it,
+and every other section keeps exactly the same text. Each section also
+repeats the last ``SECTION_OVERLAP`` characters of the one before, so an idea
+that spans a boundary is seen whole.
+
+The sections are summarized concurrently on a per-process pool of
+``MAP_CONCURRENCY`` threads. The pool is kept below the Gemini client's
+concurrency limit so chat requests still get a slot. Section summaries are
+cached by section text through utils.ai_cache ('summary_section'), so
+re-summarizing an edited handout only calls the model for the changed
+sections. One reduce call then combines the section summaries; if they are
+too long for one prompt, they are split and summarized again first.
+
+A section that finds the model busy is retried after a short wait. A section
+that still fails is left out instead of failing the whole summary, as long as
+no more than ``MAX_SKIPPED_FRACTION`` of the sections are missing.
+"""
+import hashlib
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.ai_cache import get_or_generate
+from utils.ai_client import generate, AI_MAX_CONCURRENCY, AIBusyError
+
+# Longer input is summarized section by section
+SINGLE_PASS_CHARS = 10000
+MAX_DOCUMENT_CHARS = int(os.getenv('SUMMARY_MAX_CHARS', 200000))
+SECTION_CHARS = int(os.getenv('SUMMARY_SECTION_CHARS', 8000))
+SECTION_OVERLAP = int(os.getenv('SUMMARY_SECTION_OVERLAP', 400))
+MAP_CONCURRENCY = int(os.getenv('SUMMARY_MAP_CONCURRENCY', max(1, min(3, AI_MAX_CONCURRENCY - 1))))
+BOUNDARY_MODULUS = 8
+MAX_REDUCE_ROUNDS = 3
+SECTION_ATTEMPTS = 3
+SECTION_RETRY_DELAY = 2.0
+MAX_SKIPPED_FRACTION = 0.25
+
+SECTION_PROMPT = """
+Summarize this section of a longer educational document in a few concise bullet points.
+Keep key concepts, definitions, formulas and examples; leave out filler.
+
+Section:
+{section}
+"""
+
+REDUCE_PROMPT = """
+Below are summaries of consecutive sections of one educational document.
+Combine them into one concise summary of the whole document.
+Focus on key concepts, main points, and important details that students should remember,
+and remove repetition between sections.
+
+Section summaries:
+{summaries}
+
+Summary:
+"""
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def _section_pool():
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool_pid != os.getpid():
+            _pool = ThreadPoolExecutor(max_workers=MAP_CONCURRENCY, thread_name_prefix='summary')
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def _units(text, max_len):
+    """Non-empty lines of text, with lines longer than max_len split at spaces"""
+    for line in text.splitlines():
+        line = line.strip()
+        while len(line) > max_len:
+            cut = line.rfind(' ', 0, max_len)
+            if cut <= 0:
+                cut = max_len
+            yield line[:cut]
+            line = line[cut:].lstrip()
+        if line:
+            yield line
+
+
+def _is_boundary(unit):
+    return int(hashlib.md5(unit.encode()).hexdigest()[:8], 16) % BOUNDARY_MODULUS == 0
+
+
+def split_sections(text, size=SECTION_CHARS, overlap=SECTION_OVERLAP):
+    """Split text into content-defined sections, each prefixed with the tail of the previous one"""
+    sections, current, length = [], [], 0
+    for unit in _units(text, size // 4):
+        if current and length + len(unit) > size:
+            sections.append('\n'.join(current))
+            current, length = [], 0
+        current.append(unit)
+        length += len(unit) + 1
+        if length >= size // 2 and _is_boundary(unit):
+            sections.append('\n'.join(current))
+            current, length = [], 0
+    if current:
+        sections.append('\n'.join(current))
+
+    overlapped = sections[:1]
+    for previous, section in zip(sections, sections[1:]):
+        tail = previous[-overlap:]
+        # Start the overlap on a word boundary
+        tail = tail[tail.find(' ') + 1:] if ' ' in tail else tail
+        overlapped.append(f"{tail}\n{section}")
+    return overlapped
+
+
+def _summarize_section(db, section):
+    prompt = SECTION_PROMPT.format(section=section)
+    for attempt in range(1, SECTION_ATTEMPTS + 1):
+        try:
+            return get_or_generate(db, 'summary_section', section, '',
+                                   lambda: generate(prompt, mode='summary_section'))
+        except AIBusyError:
+            if attempt == SECTION_ATTEMPTS:
+                raise
+            time.sleep(SECTION_RETRY_DELAY * attempt)
+
+
+def _try_section(db, section):
+    """(summary, None), or (None, error) if the section could not be summarized"""
+    try:
+        return _summarize_section(db, section), None
+    except Exception as e:
+        return None, e
+
+
+def _summarize_sections(db, sections):
+    """Section summaries in order, without the sections that failed; (summaries, skipped)"""
+    results = list(_section_pool().map(lambda section: _try_section(db, section), sections))
+    errors = [error for _, error in results if error is not None]
+    if len(errors) > len(sections) * MAX_SKIPPED_FRACTION:
+        raise errors[0]
+    for error in errors:
+        print(f"Skipped a summary section: {error}")
+    return [summary for summary, error in results if error is None], len(errors)
+
+
+def summarize_document(db, text):
+    """
+    Summarize text of any length up to MAX_DOCUMENT_CHARS.
+
+    Returns (summary, number of sections, number of skipped sections). Raises
+    AIError (or the SDK's error) when too many sections or the reduce call
+    fail.
+    """
+    sections = split_sections(text)
+    section_count = len(sections)
+    skipped = 0
+    for _ in range(MAX_REDUCE_ROUNDS):
+        summaries, skipped_now = _summarize_sections(db, sections)
+        skipped += skipped_now
+        combined = '\n\n'.join(f"Section {i + 1}:\n{summary}" for i, summary in enumerate(summaries))
+        if len(combined) <= SINGLE_PASS_CHARS:
+            break
+        sections = split_sections(combined)
+
+    prompt = REDUCE_PROMPT.format(summaries=combined[:SINGLE_PASS_CHARS * 2])
+    summary = get_or_generate(db, 'summary', combined, 'sections',
+                              lambda: generate(prompt, mode='summary_reduce'))
+    return summary, section_count, skipped
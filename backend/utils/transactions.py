@@ -0,0 +1,44 @@
+"""
+Multi-document transactions.
+
+MongoDB only supports transactions on replica sets and sharded clusters,
+while development setups usually run a standalone mongod. ``run_in_transaction``
+checks the deployment once per client; where transactions are unavailable the
+work runs without a session and the caller's ``compensate`` hook undoes any
+partial writes if it fails.
+"""
+from pymongo.write_concern import WriteConcern
+
+_transaction_support = {}
+
+
+def supports_transactions(db):
+    """True when the server is a replica set member or mongos"""
+    key = id(db.client)
+    if key not in _transaction_support:
+        try:
+            hello = db.command('hello')
+            _transaction_support[key] = bool(hello.get('setName')) or hello.get('msg') == 'isdbgrid'
+        except Exception:
+            _transaction_support[key] = False
+    return _transaction_support[key]
+
+
+def run_in_transaction(db, work, compensate=None):
+    """
+    Call work(session) atomically and return its result.
+
+    work may be retried on transient errors, so it must only write through
+    the session it is given. On servers without transactions it is called
+    once with session=None and compensate() runs if it raises.
+    """
+    if supports_transactions(db):
+        with db.client.start_session() as session:
+            return session.with_transaction(work, write_concern=WriteConcern('majority'))
+
+    try:
+        return work(None)
+    except Exception:
+        if compensate:
+            compensate()
+        raise
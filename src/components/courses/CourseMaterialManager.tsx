@@ -1,5 +1,5 @@
 import React, { useState, useEffect } from 'react';
-import CourseAPI, { Material, MaterialUploadRequest, VideoUploadRequest } from '../../services/courseAPI';
+import CourseAPI, { Material, MaterialUploadRequest, VideoUploadRequest, DocumentUploadRequest } from '../../services/courseAPI';
 import {
   Plus,
   Video,
@@ -32,6 +32,7 @@ export const CourseMaterialManager: React.FC<CourseMaterialManagerProps> = ({
   const [description, setDescription] = useState('');
   const [content, setContent] = useState('');
   const [videoFile, setVideoFile] = useState<File | null>(null);
+  const [pdfFile, setPdfFile] = useState<File | null>(null);
   const [order, setOrder] = useState(0);
   const [isRequired, setIsRequired] = useState(true);
 
@@ -56,6 +57,7 @@ export const CourseMaterialManager: React.FC<CourseMaterialManagerProps> = ({
     setDescription('');
     setContent('');
     setVideoFile(null);
+    setPdfFile(null);
     setOrder(0);
     setIsRequired(true);
     setMaterialType('video');
@@ -72,7 +74,12 @@ export const CourseMaterialManager: React.FC<CourseMaterialManagerProps> = ({
       return;
     }
 
-    if (materialType !== 'video' && !content.trim()) {
+    if (materialType === 'pdf' && !pdfFile) {
+      alert('Please select a PDF file');
+      return;
+    }
+
+    if ((materialType === 'document' || materialType === 'link') && !content.trim()) {
       alert('Please enter content/URL');
       return;
     }
@@ -88,6 +95,16 @@ export const CourseMaterialManager: React.FC<CourseMaterialManagerProps> = ({
           video: videoFile
         };
         await CourseAPI.uploadVideo(courseId, videoData);
+      } else if (materialType === 'pdf' && pdfFile) {
+        // Uploaded so the AI assistant can index and summarize its text
+        const documentData: DocumentUploadRequest = {
+          title: title.trim(),
+          description: description.trim(),
+          order,
+          is_required: isRequired,
+          file: pdfFile
+        };
+        await CourseAPI.uploadDocument(courseId, documentData);
       } else {
         const materialData: MaterialUploadRequest = {
           title: title.trim(),
@@ -130,6 +147,23 @@ export const CourseMaterialManager: React.FC<CourseMaterialManagerProps> = ({
     setVideoFile(file);
   };
 
+  const handlePdfFileChange = (e: React.ChangeEvent<HTMLInputElement>) => {
+    const file = e.target.files?.[0];
+    if (!file) return;
+
+    if (file.size > 25 * 1024 * 1024) {
+      alert('PDF file size must be less than 25MB');
+      return;
+    }
+
+    if (file.type !== 'application/pdf' && !file.name.toLowerCase().endsWith('.pdf')) {
+      alert('Please select a PDF file');
+      return;
+    }
+
+    setPdfFile(file);
+  };
+
   const getMaterialIcon = (type: string) => {
     switch (type) {
       case 'video':
@@ -339,6 +373,51 @@ export const CourseMaterialManager: React.FC<CourseMaterialManagerProps> = ({
                     </label>
                   </div>
                 </div>
+              ) : materialType === 'pdf' ? (
+                <div>
+                  <label className="block text-sm font-medium text-gray-700 mb-2">
+                    PDF File <span className="text-red-500">*</span>
+                  </label>
+                  <div className="border-2 border-dashed border-gray-300 rounded-lg p-6">
+                    <input
+                      type="file"
+                      id="pdf-upload"
+                      accept="application/pdf,.pdf"
+                      onChange={handlePdfFileChange}
+                      className="hidden"
+                      required
+                    />
+                    <label htmlFor="pdf-upload" className="cursor-pointer">
+                      {pdfFile ? (
+                        <div className="flex items-center justify-center gap-3">
+                          <FileText className="h-8 w-8 text-red-600" />
+                          <div className="flex-1 text-left">
+                            <p className="text-sm font-medium text-gray-900">{pdfFile.name}</p>
+                            <p className="text-sm text-gray-500">
+                              {(pdfFile.size / (1024 * 1024)).toFixed(2)} MB
+                            </p>
+                          </div>
+                          <button
+                            type="button"
+                            onClick={(e) => {
+                              e.preventDefault();
+                              setPdfFile(null);
+                            }}
+                            className="text-red-600 hover:text-red-700 p-2"
+                          >
+                            <X className="h-5 w-5" />
+                          </button>
+                        </div>
+                      ) : (
+                        <>
+                          <Upload className="h-8 w-8 text-gray-400 mx-auto mb-2" />
+                          <p className="text-sm text-gray-600 text-center">Click to upload PDF</p>
+                          <p className="text-sm text-gray-500 mt-1 text-center">PDF (Max 25MB)</p>
+                        </>
+                      )}
+                    </label>
+                  </div>
+                </div>
               ) : (
                 <div>
                   <label className="block text-sm font-medium text-gray-700 mb-2">
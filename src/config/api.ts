@@ -29,6 +29,7 @@ export const API_ENDPOINTS = {
     ENROLL: (id: string) => `${API_BASE_URL}/courses/${id}/enroll`,
     UNENROLL: (id: string) => `${API_BASE_URL}/courses/${id}/unenroll`,
     MATERIALS: (id: string) => `${API_BASE_URL}/courses/${id}/materials`,
+    MATERIAL: (id: string, materialId: string) => `${API_BASE_URL}/courses/${id}/materials/${materialId}`,
     STUDENTS: (id: string) => `${API_BASE_URL}/courses/${id}/students`,
   },
 
@@ -56,12 +57,14 @@ export const API_ENDPOINTS = {
   // AI Features
   AI: {
     CHAT: `${API_BASE_URL}/ai/chat`,
+    CHAT_STREAM: `${API_BASE_URL}/ai/chat/stream`,
     CHAT_WELCOME: `${API_BASE_URL}/ai/chat/welcome`,
     SUMMARIZE: `${API_BASE_URL}/ai/summarize`,
 
     RECOMMENDATIONS: `${API_BASE_URL}/ai/recommendations`,
     CHAT_HISTORY: `${API_BASE_URL}/ai/chat-history`,
     LEARNING_PATH: `${API_BASE_URL}/ai/learning-path`,
+    JOB: (id: string) => `${API_BASE_URL}/ai/jobs/${id}`,
   },
 
   // Analytics
@@ -430,16 +433,95 @@ export const assignmentsAPI = {
 
 
 export const aiAPI = {
-  chat: (message: string) => apiClient.post(API_ENDPOINTS.AI.CHAT, { message }),
+  // Chats run on the AI job queue; the request answers with a job to wait for
+  chat: async (message: string) => {
+    const data = await apiClient.post<any>(API_ENDPOINTS.AI.CHAT, { message });
+    return data.job_id ? aiAPI.waitForJob(data.job_id) : data;
+  },
+  // Streams the response over Server-Sent Events, calling onChunk as text arrives.
+  // Resolves with the full response once the `done` event is received.
+  chatStream: async (message: string, type: string = 'general', onChunk: (text: string) => void) => {
+    const response = await fetch(API_ENDPOINTS.AI.CHAT_STREAM, {
+      method: 'POST',
+      headers: { ...HTTP_CONFIG.headers, ...getAuthHeaders() },
+      body: JSON.stringify({ message, type }),
+    });
+    if (!response.ok || !response.body) {
+      const data = await response.json().catch(() => ({}));
+      throw new Error(data.error || `HTTP error! status: ${response.status}`);
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let fullText = '';
+    for (;;) {
+      const { done, value } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+
+      let boundary;
+      while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+        const block = buffer.slice(0, boundary);
+        buffer = buffer.slice(boundary + 2);
+        const event = block.match(/^event: (.*)$/m)?.[1];
+        const data = JSON.parse(block.match(/^data: (.*)$/m)?.[1] || '{}');
+        if (event === 'chunk') {
+          fullText += data.text;
+          onChunk(data.text);
+        } else if (event === 'error') {
+          throw new Error(data.error);
+        } else if (event === 'done') {
+          return fullText;
+        }
+      }
+    }
+    throw new Error('AI response stream ended unexpectedly');
+  },
   getWelcomeMessage: () => apiClient.get(API_ENDPOINTS.AI.CHAT_WELCOME),
-  summarize: (content: string, type: string = 'text') =>
-    apiClient.post(API_ENDPOINTS.AI.SUMMARIZE, { content, type }),
+  // Long documents are summarized by the AI workers; the request then answers with a job to wait for
+  summarize: async (content: string, type: string = 'text') => {
+    const data = await apiClient.post<any>(API_ENDPOINTS.AI.SUMMARIZE, { content, type });
+    return data.job_id ? aiAPI.waitForJob(data.job_id) : data;
+  },
+  // Course materials are usually summarized at upload; this returns the stored summary
+  summarizeMaterial: async (materialId: string) => {
+    const data = await apiClient.post<any>(API_ENDPOINTS.AI.SUMMARIZE, { material_id: materialId });
+    return data.job_id ? aiAPI.waitForJob(data.job_id) : data;
+  },
+  // Uploads the PDF as multipart form data instead of base64 JSON
+  summarizeFile: async (file: File) => {
+    const formData = new FormData();
+    formData.append('file', file);
+    const response = await fetch(API_ENDPOINTS.AI.SUMMARIZE, {
+      method: 'POST',
+      headers: getAuthHeaders(),
+      body: formData,
+    });
+    const data = await response.json().catch(() => ({}));
+    if (!response.ok) {
+      throw new Error(data.error || 'Failed to summarize file');
+    }
+    return data.job_id ? aiAPI.waitForJob(data.job_id) : data;
+  },
 
   getRecommendations: () => apiClient.get(API_ENDPOINTS.AI.RECOMMENDATIONS),
   getChatHistory: (page: number = 1, limit: number = 20) =>
     apiClient.get(`${API_ENDPOINTS.AI.CHAT_HISTORY}?page=${page}&limit=${limit}`),
-  generateLearningPath: (goal: string, timeframe: string = 'month') =>
-    apiClient.post(API_ENDPOINTS.AI.LEARNING_PATH, { goal, timeframe }),
+  generateLearningPath: async (goal: string, timeframe: string = 'month') => {
+    const data = await apiClient.post<any>(API_ENDPOINTS.AI.LEARNING_PATH, { goal, timeframe });
+    return data.job_id ? aiAPI.waitForJob(data.job_id) : data;
+  },
+  // Queued AI requests answer with a job id; poll it until the worker is done.
+  getJob: (id: string) => apiClient.get<any>(API_ENDPOINTS.AI.JOB(id)),
+  waitForJob: async (id: string, intervalMs: number = 1000) => {
+    for (;;) {
+      const job = await apiClient.get<any>(API_ENDPOINTS.AI.JOB(id));
+      if (job.status === 'done') return job.result;
+      if (job.status === 'failed') throw new Error(job.error || 'AI request failed');
+      await new Promise((resolve) => setTimeout(resolve, intervalMs));
+    }
+  },
 };
 
 export const analyticsAPI = {
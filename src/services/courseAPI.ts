@@ -56,7 +56,7 @@ export interface Material {
   uploaded_by: string;
   created_at: string;
   views?: number;
-  completed_by?: string[];
+  completion_count?: number;
 }
 
 export interface Assignment {
@@ -140,6 +140,14 @@ export interface VideoUploadRequest {
   video: File;
 }
 
+export interface DocumentUploadRequest {
+  title: string;
+  description?: string;
+  order?: number;
+  is_required?: boolean;
+  file: File;
+}
+
 export class CourseAPI {
   /**
    * Get all courses for the current teacher
@@ -171,6 +179,36 @@ export class CourseAPI {
     }
   }
 
+  /**
+   * Get a course with only the material and assignment titles and order
+   */
+  static async getCourseOutline(courseId: string): Promise<Course> {
+    try {
+      const response = await apiClient.get<{ course: Course }>(
+        `${API_ENDPOINTS.COURSES.BY_ID(courseId)}?outline=1`
+      );
+      return response.course;
+    } catch (error) {
+      console.error('Failed to fetch course outline:', error);
+      throw new Error('Failed to load course details');
+    }
+  }
+
+  /**
+   * Get the full body of a single material
+   */
+  static async getMaterial(courseId: string, materialId: string): Promise<Material> {
+    try {
+      const response = await apiClient.get<{ material: Material }>(
+        API_ENDPOINTS.COURSES.MATERIAL(courseId, materialId)
+      );
+      return response.material;
+    } catch (error) {
+      console.error('Failed to fetch material:', error);
+      throw new Error('Failed to load material');
+    }
+  }
+
   /**
    * Create a new course
    */
@@ -287,6 +325,41 @@ export class CourseAPI {
     }
   }
 
+  /**
+   * Upload a PDF document material
+   */
+  static async uploadDocument(courseId: string, documentData: DocumentUploadRequest): Promise<Material> {
+    const formData = new FormData();
+    formData.append('file', documentData.file);
+    formData.append('title', documentData.title);
+    if (documentData.description) {
+      formData.append('description', documentData.description);
+    }
+    if (documentData.order !== undefined) {
+      formData.append('order', documentData.order.toString());
+    }
+    if (documentData.is_required !== undefined) {
+      formData.append('is_required', String(documentData.is_required));
+    }
+
+    const token = localStorage.getItem('access_token');
+    const response = await fetch(`${API_ENDPOINTS.COURSES.BY_ID(courseId)}/upload-document`, {
+      method: 'POST',
+      headers: {
+        'Authorization': `Bearer ${token}`,
+      },
+      body: formData,
+    });
+
+    if (!response.ok) {
+      const errorData = await response.json().catch(() => ({}));
+      throw new Error(errorData.error || 'Failed to upload document');
+    }
+
+    const result = await response.json();
+    return result.material;
+  }
+
   /**
    * Get course materials
    */